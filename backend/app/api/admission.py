@@ -0,0 +1,182 @@
+import json
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ByteBudget:
+    """
+    Per-worker budget of request body bytes held in memory.
+
+    Works like a semaphore counted in bytes: requests reserve what they are
+    about to buffer and release it once their response has been sent.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _cond(self) -> asyncio.Condition:
+        # Created lazily so it binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self, amount: int, timeout: float) -> bool:
+        """
+        Reserve ``amount`` bytes, waiting up to ``timeout`` seconds.
+
+        Requests larger than the whole budget are admitted once it is idle.
+        Returns False when the reservation could not be made in time.
+        """
+        amount = min(amount, self.capacity)
+        cond = self._cond()
+        async with cond:
+            try:
+                await asyncio.wait_for(
+                    cond.wait_for(lambda: self.in_use + amount <= self.capacity), timeout
+                )
+            except asyncio.TimeoutError:
+                return False
+            self.in_use += amount
+            return True
+
+    async def release(self, amount: int):
+        amount = min(amount, self.capacity)
+        cond = self._cond()
+        async with cond:
+            self.in_use -= amount
+            cond.notify_all()
+
+
+class _Rejected(HTTPException):
+    """
+    Raised from inside the body stream; being an HTTPException, FastAPI's
+    handlers turn it into the right response when a route is reading the body.
+    """
+
+    def __init__(self, status: int, detail: str, retry_after: Optional[int] = None):
+        headers = {"Retry-After": str(retry_after)} if retry_after else None
+        super().__init__(status_code=status, detail=detail, headers=headers)
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware bounding request body sizes and buffered bytes per worker.
+
+    - Bodies over the endpoint's limit are rejected with 413, up front when
+      Content-Length is known and as soon as the limit is crossed otherwise.
+    - Bodies are charged against a shared ByteBudget; when it stays exhausted
+      for the admission timeout the request is rejected with 429 and a
+      Retry-After header instead of queueing without bound.
+    - Streamed endpoints (which read uploads in chunks from the spooled temp
+      file) are only charged for the part the multipart parser keeps in RAM.
+    """
+
+    def __init__(
+        self,
+        app,
+        max_body_size: int = None,
+        endpoint_limits: Dict[str, int] = None,
+        streamed_endpoints: Iterable[str] = None,
+        budget_bytes: int = None,
+        admission_timeout: float = None,
+        retry_after: int = None,
+        spool_size: int = None,
+    ):
+        self.app = app
+        self.max_body_size = max_body_size or settings.UPLOAD_MAX_BODY_SIZE
+        self.endpoint_limits = endpoint_limits if endpoint_limits is not None else settings.UPLOAD_ENDPOINT_LIMITS
+        self.streamed_endpoints = set(
+            streamed_endpoints if streamed_endpoints is not None else settings.UPLOAD_STREAMED_ENDPOINTS
+        )
+        self.budget = ByteBudget(budget_bytes or settings.UPLOAD_MEMORY_BUDGET)
+        self.admission_timeout = admission_timeout if admission_timeout is not None else settings.UPLOAD_ADMISSION_TIMEOUT
+        self.retry_after = retry_after or settings.UPLOAD_RETRY_AFTER
+        self.spool_size = spool_size or settings.UPLOAD_SPOOL_SIZE
+
+    def _charge(self, path: str, size: int) -> int:
+        """Bytes of a body of the given size that stay in worker memory."""
+        if path in self.streamed_endpoints:
+            return min(size, self.spool_size)
+        return size
+
+    async def _reject(self, send, status: int, detail: str):
+        headers = [(b"content-type", b"application/json")]
+        if status == 429:
+            headers.append((b"retry-after", str(self.retry_after).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        limit = self.endpoint_limits.get(path, self.max_body_size)
+        content_length = None
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    await self._reject(send, 400, "Invalid Content-Length header")
+                    return
+                break
+
+        if content_length is not None and content_length > limit:
+            await self._reject(send, 413, f"Request body exceeds the {limit} byte limit for {path}")
+            return
+
+        reserved = 0
+        if content_length is not None:
+            charge = self._charge(path, content_length)
+            if not await self.budget.acquire(charge, self.admission_timeout):
+                logger.warning(f"Rejecting {path}: upload budget exhausted ({self.budget.in_use} bytes in use)")
+                await self._reject(send, 429, "Server is busy, retry later")
+                return
+            reserved = charge
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, reserved
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = len(message.get("body", b""))
+                received += chunk
+                if received > limit:
+                    raise _Rejected(413, f"Request body exceeds the {limit} byte limit for {path}")
+                if content_length is None:
+                    # Unknown length: charge the budget as the body arrives
+                    charge = self._charge(path, received) - reserved
+                    if charge > 0:
+                        if not await self.budget.acquire(charge, self.admission_timeout):
+                            raise _Rejected(429, "Server is busy, retry later", self.retry_after)
+                        reserved += charge
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except _Rejected as e:
+            if response_started:
+                raise
+            await self._reject(send, e.status_code, e.detail)
+        finally:
+            if reserved:
+                await self.budget.release(reserved)
@@ -0,0 +1,43 @@
+import random
+import logging
+
+from app.core.config import settings
+from app.services import memory_stats
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryAccountingMiddleware:
+    """
+    ASGI middleware recording the memory use of every API request.
+
+    Requests are accounted per endpoint (the route function name) in
+    memory_stats.memory_stats; a MEMORY_TRACE_SAMPLE_RATE fraction is traced
+    with tracemalloc. Services mark their stages with memory_stats.checkpoint.
+    """
+
+    def __init__(self, app, stats: memory_stats.MemoryStats = None, trace_sample_rate: float = None):
+        self.app = app
+        self.stats = stats or memory_stats.memory_stats
+        self.trace_sample_rate = (
+            settings.MEMORY_TRACE_SAMPLE_RATE if trace_sample_rate is None else trace_sample_rate
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        traced = bool(self.trace_sample_rate) and random.random() < self.trace_sample_rate
+        record = memory_stats.begin(scope["path"], traced)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # The router stored the matched endpoint in the scope; group by it
+            # rather than by path so session ids do not split the statistics
+            record.endpoint = getattr(scope.get("endpoint"), "__name__", scope["path"])
+            memory_stats.end(record)
+            try:
+                self.stats.add(record)
+            except Exception as e:
+                logger.warning(f"Could not record memory statistics: {e}")
@@ -0,0 +1,309 @@
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+FORMATS = {"collapsed": ".collapsed.txt", "speedscope": ".speedscope.json"}
+# Deepest stack recorded; deeper frames are cut at the root end
+MAX_DEPTH = 256
+
+
+class ProfileStore:
+    """
+    Directory of finished profiles shared by all worker processes.
+
+    Each profile is stored as ``<id>.json`` (request metadata) next to its
+    collapsed stacks and speedscope export. Only the newest ``max_profiles``
+    are kept.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_profiles: int = None):
+        self.directory = directory or settings.PROFILE_DIR or os.path.join(
+            tempfile.gettempdir(), "securecrypt-profiles"
+        )
+        self.max_profiles = max_profiles or settings.PROFILE_MAX_FILES
+
+    def path(self, profile_id: str, fmt: str) -> Optional[str]:
+        """Path of a stored profile in the given format, or None if there is none."""
+        if not PROFILE_ID.match(profile_id) or fmt not in FORMATS:
+            return None
+        path = os.path.join(self.directory, profile_id + FORMATS[fmt])
+        return path if os.path.exists(path) else None
+
+    def list(self) -> List[Dict]:
+        """Metadata of the stored profiles, newest first."""
+        profiles = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return profiles
+        for name in names:
+            if not name.endswith(".json") or name.endswith(FORMATS["speedscope"]):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                # Removed or still being written by another worker
+                continue
+        profiles.sort(key=lambda p: p["started"], reverse=True)
+        return profiles
+
+    def save(self, metadata: Dict, collapsed: str, speedscope: Dict):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, metadata["id"])
+        with open(base + FORMATS["collapsed"], "w", encoding="utf-8") as f:
+            f.write(collapsed)
+        with open(base + FORMATS["speedscope"], "w", encoding="utf-8") as f:
+            json.dump(speedscope, f)
+        # Metadata last: a profile is listed only once its exports exist
+        tmp = base + ".json.part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(metadata, f)
+        os.replace(tmp, base + ".json")
+        self._trim()
+
+    def _trim(self):
+        profiles = self.list()
+        for profile in profiles[self.max_profiles:]:
+            for suffix in (".json", *FORMATS.values()):
+                try:
+                    os.remove(os.path.join(self.directory, profile["id"] + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of the threads serving one request.
+
+    The request's own event loop thread is registered explicitly; the
+    threadpool workers of that loop (which run ``run_in_threadpool`` work) are
+    found by their ``loop`` attribute. Threads of other executors are not
+    sampled, their time shows up in the frame waiting for them.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_ids: set = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Register the calling thread, running ``loop``, as serving the request."""
+        self.loop = loop
+        self.thread_ids.add(threading.get_ident())
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _threads(self) -> set:
+        idents = set(self.thread_ids)
+        if self.loop is not None:
+            for thread in threading.enumerate():
+                if getattr(thread, "loop", None) is self.loop:
+                    idents.add(thread.ident)
+        return idents
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            idents = self._threads()
+            for ident, frame in sys._current_frames().items():
+                if ident in idents:
+                    stack = _stack(frame)
+                    if not _idle_worker(stack):
+                        self.samples[stack] += 1
+
+
+def _stack(frame) -> Tuple[Tuple[str, str, int], ...]:
+    """(function, file, line) tuples from the root to ``frame``."""
+    stack = []
+    while frame is not None and len(stack) < MAX_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _idle_worker(stack: Tuple[Tuple[str, str, int], ...]) -> bool:
+    """Whether the stack is a threadpool worker waiting for work."""
+    for parent, frame in zip(stack, stack[1:]):
+        if frame[0] == "get" and os.path.basename(frame[1]) == "queue.py":
+            return parent[0] == "run" and "anyio" in parent[1]
+    return False
+
+
+def _frame_name(frame: Tuple[str, str, int]) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def collapse(samples: Counter) -> str:
+    """Samples in the collapsed-stack format read by flamegraph.pl and speedscope."""
+    lines = [
+        ";".join(_frame_name(frame) for frame in stack) + f" {count}"
+        for stack, count in samples.most_common()
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def to_speedscope(samples: Counter, interval: float, name: str) -> Dict:
+    """Samples as a speedscope "sampled" profile, weighted in seconds."""
+    frames: List[Dict] = []
+    index: Dict[Tuple[str, str, int], int] = {}
+    stacks, weights = [], []
+    for stack, count in samples.most_common():
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+        stacks.append([index[frame] for frame in stack])
+        weights.append(count * interval)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "securecrypt",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": stacks,
+            "weights": weights,
+        }],
+    }
+
+
+def admin_token_valid(token: Optional[str]) -> bool:
+    """Whether ``token`` matches the configured profiling admin token."""
+    expected = settings.PROFILE_ADMIN_TOKEN
+    return bool(expected and token and hmac.compare_digest(token.encode(), expected.encode()))
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling selected requests with a stack sampler.
+
+    A request is profiled when it carries an X-Profile header matching
+    settings.PROFILE_ADMIN_TOKEN, or at random with probability
+    settings.PROFILE_SAMPLE_RATE. The profiled request runs on a thread with
+    its own event loop so its samples are not mixed with concurrent
+    requests; the stacks and request metadata (never the body) are written
+    to the ProfileStore when the response is complete.
+    """
+
+    def __init__(self, app, store: ProfileStore = None, sample_rate: float = None, interval: float = None,
+                 max_active: int = None):
+        self.app = app
+        self.store = store or ProfileStore()
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.interval = interval or settings.PROFILE_INTERVAL
+        self.max_active = max_active or settings.PROFILE_MAX_ACTIVE
+        self.active = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _trigger(self, scope) -> Optional[str]:
+        if not scope["path"].startswith("/api/") or scope["path"].startswith("/api/profiles"):
+            return None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER and admin_token_valid(value.decode("latin-1")):
+                return "header"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def _run_profiled(self, sampler: StackSampler, scope, receive, send):
+        """Run the request on its own thread and event loop, bridging receive/send back."""
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_active, thread_name_prefix="profiled")
+
+        async def thread_receive():
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(receive(), loop))
+
+        async def thread_send(message):
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(send(message), loop))
+
+        async def run():
+            sampler.attach(asyncio.get_running_loop())
+            await self.app(scope, thread_receive, thread_send)
+
+        await loop.run_in_executor(self._executor, lambda: asyncio.run(run()))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.active >= self.max_active:
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        sampler = StackSampler(self.interval)
+        self.active += 1
+        started = time.time()
+        sampler.start()
+        try:
+            await self._run_profiled(sampler, scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            self.active -= 1
+            duration = time.time() - started
+            metadata = {
+                "id": uuid.uuid4().hex,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "trigger": trigger,
+                "started": started,
+                "duration": round(duration, 4),
+                "content_length": next(
+                    (int(v) for k, v in scope["headers"] if k == b"content-length" and v.isdigit()), None
+                ),
+                "samples": sum(sampler.samples.values()),
+                "interval": self.interval,
+                "pid": os.getpid(),
+            }
+            name = f"{scope['method']} {scope['path']}"
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.store.save, metadata, collapse(sampler.samples),
+                    to_speedscope(sampler.samples, self.interval, name),
+                )
+                logger.info(f"Profiled {name} in {duration:.3f}s: {metadata['id']}")
+            except OSError as e:
+                logger.warning(f"Could not save profile of {name}: {e}")
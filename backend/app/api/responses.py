@@ -0,0 +1,146 @@
+import json
+import zlib
+import codecs
+import base64
+import logging
+from typing import Dict, Iterator, Optional, Union
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick a content encoding from an Accept-Encoding header.
+
+    Prefers zstd (when the zstandard package is installed) over gzip and
+    honours q=0 exclusions.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    if zstandard is not None and accepted.get("zstd", 0) > 0:
+        return "zstd"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+def compresses_well(sample: bytes) -> bool:
+    """Whether a sample of the response shrinks enough to be worth compressing."""
+    if len(sample) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+        return False
+    compressed = zlib.compress(sample, 1)
+    return len(compressed) <= len(sample) * settings.RESPONSE_COMPRESSION_MAX_RATIO
+
+
+def looks_like_text(data: bytes) -> bool:
+    """
+    Whether a payload looks like UTF-8 text, judged on a bounded sample.
+
+    Used to pick an envelope encoding when the client did not ask for one,
+    so binary payloads go straight to Base64 without decoding all of them.
+    """
+    sample = bytes(memoryview(data)[:settings.RESPONSE_COMPRESSION_SAMPLE_SIZE])
+    if b"\x00" in sample:
+        return False
+    try:
+        # final=False tolerates a multi-byte character cut off by the sample
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _compressor(encoding: str):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=settings.RESPONSE_COMPRESSION_LEVEL).compressobj()
+    # wbits=31 produces a gzip container
+    return zlib.compressobj(settings.RESPONSE_COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+
+
+def _envelope_chunks(fields: Dict, data: Union[bytes, str], encoding: str) -> Iterator[bytes]:
+    """
+    Serialize ``{**fields, "encoding": encoding, "data": data}`` piece by piece.
+
+    Bytes are Base64-encoded in slices aligned to 3 bytes, so the
+    concatenation equals the Base64 of the whole payload; text is JSON-escaped
+    slice by slice. The full JSON string is never built in memory.
+    """
+    head = json.dumps({**fields, "encoding": encoding})
+    yield (head[:-1] + ', "data": "').encode("utf-8")
+    step = settings.RESPONSE_CHUNK_SIZE
+    if encoding == "base64":
+        step -= step % 3
+        view = memoryview(data)
+        for start in range(0, len(view), step):
+            yield base64.b64encode(view[start:start + step])
+    else:
+        for start in range(0, len(data), step):
+            yield json.dumps(data[start:start + step])[1:-1].encode("utf-8")
+    yield b'"}'
+
+
+def _compressed(chunks: Iterator[bytes], encoding: str) -> Iterator[bytes]:
+    compressor = _compressor(encoding)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def envelope_response(request: Request, fields: Dict, data: Union[bytes, str], encoding: str,
+                      compress: bool = True) -> StreamingResponse:
+    """
+    Stream a JSON envelope carrying a (possibly large) payload.
+
+    Parameters:
+    - request: Incoming request, used for Accept-Encoding negotiation
+    - fields: Envelope fields such as filename and message
+    - data: Payload, raw bytes for "base64" or a string for "text"
+    - encoding: Either "base64" or "text"; echoed in the envelope so clients
+      never have to guess
+    - compress: False for payloads known not to compress, such as ciphertext,
+      to skip sampling and compression altogether
+
+    Returns:
+    - StreamingResponse, gzip/zstd compressed when the client accepts it and
+      a sample of the payload compresses
+    """
+    chunks = _envelope_chunks(fields, data, encoding)
+    headers = {"Vary": "Accept-Encoding"}
+
+    content_encoding = negotiate_encoding(request.headers.get("accept-encoding")) if compress else None
+    if content_encoding:
+        # Sample the raw bytes: Base64 of incompressible data still shrinks to
+        # about 3/4, which would pass the ratio without saving anything real
+        sample_size = settings.RESPONSE_COMPRESSION_SAMPLE_SIZE
+        if encoding == "base64":
+            sample = bytes(memoryview(data)[:sample_size])
+        else:
+            sample = data[:sample_size].encode("utf-8")
+        if compresses_well(sample):
+            headers["Content-Encoding"] = content_encoding
+            chunks = _compressed(chunks, content_encoding)
+
+    return StreamingResponse(chunks, media_type="application/json", headers=headers)
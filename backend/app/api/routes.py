@@ -1,9 +1,9 @@
 import logging
 from fastapi import APIRouter, HTTPException
-from fastapi import FastAPI, File, Form, UploadFile
+from fastapi import FastAPI, File, Form, Header, Request, Response, UploadFile
 from fastapi.responses import JSONResponse
-from typing import Optional, Literal
-from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional, Literal, Tuple
+from fastapi.responses import FileResponse, StreamingResponse
 from io import BytesIO
 import base64
 
@@ -12,12 +12,30 @@ from app.schemas.encryption import (
     EncryptionResponse,
     ImageEncryptionRequest,
     ImageEncryptionResponse,
-    AutoDecryptImageRequest
+    AutoDecryptImageRequest,
+    AnimationEncryptionRequest,
+    ImageOutputFormat,
+    ImageSessionCreateRequest,
+    ImageSessionUpdateRequest,
+    ImageSessionResponse
 )
 from app.services.encryption_service import EncryptionService
 from app.services.image_service import ImageEncryptionService
+from app.services.animation_service import AnimationEncryptionService
+from app.services.result_cache import ResultCache
+from app.services.image_session import ImageSessionStore
+from app.services.region_set import RegionSet
+from app.services import image_codecs, memory_stats
+from app.core.config import settings
+from app.api.responses import envelope_response, looks_like_text
+from app.api.upload_stream import CpuPipeline, MultipartStream
+from app.api.profiling import ProfileStore, admin_token_valid
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 import os
+import json
 import binascii
+import tempfile
 
 # Configure basic logging for the application
 logging.basicConfig(level=logging.DEBUG)
@@ -27,9 +45,14 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 encryption_service = EncryptionService()
 image_service = ImageEncryptionService()
+animation_service = AnimationEncryptionService(image_service)
+result_cache = ResultCache()
+image_sessions = ImageSessionStore(image_service)
+profile_store = ProfileStore()
 
 @router.post("/encrypt")
 async def encrypt_file(
+    request: Request,
     file: UploadFile = File(...),
     operation: Literal["encrypt", "decrypt"] = Form(...),
     algorithm: str = Form(...),
@@ -44,6 +67,7 @@ async def encrypt_file(
     # RSA keys
     publicKey: Optional[str] = Form(None),
     privateKey: Optional[str] = Form(None),
+    publicKeys: Optional[str] = Form(None),  # ecc-multi: JSON list or concatenated PEM public keys
 
     # 3DES-specific
     keyOption: Optional[str] = Form(None),
@@ -58,7 +82,10 @@ async def encrypt_file(
     selectedText: Optional[str] = Form(None),
     plaintext: Optional[str] = Form(None),
 
-    curve : Optional[str] = Form(None)
+    curve : Optional[str] = Form(None),
+
+    # Decrypted output: "text" or "base64"; detected from a sample of the content when omitted
+    outputEncoding: Optional[Literal["text", "base64"]] = Form(None)
 ):
     """
     Endpoint to encrypt or decrypt files using various cryptographic algorithms.
@@ -69,19 +96,23 @@ async def encrypt_file(
     Parameters:
     - file: The file to be encrypted or decrypted
     - operation: Either "encrypt" or "decrypt"
-    - algorithm: Cryptographic algorithm to use (aes, rsa, ecc, 3des)
+    - algorithm: Cryptographic algorithm to use (aes, rsa, ecc, ecc-multi, 3des, chacha20-poly1305,
+      aes-gcm-siv, aead-auto for the fastest AEAD on this host, or envelope for a random
+      data key wrapped by the password or public key, see /rewrap)
+    - publicKeys: Recipient public keys for ecc-multi, as a JSON list or concatenated PEM blocks
     - Various algorithm-specific parameters (password, keys, modes, etc.)
     - Partial encryption parameters for text files
+    - outputEncoding: How full-file decryption results are returned ("text" or "base64")
     
     Returns:
-    - JSON with filename, processed data, and status message
+    - JSON with filename, processed data, and status message. Full-file results
+      are streamed, carry an "encoding" field and may be gzip/zstd compressed
     """
     print(partialEncryption)
     try:
         # Read file content
         file_content = await file.read()
         logger.debug(f"File read - Size: {len(file_content)} bytes")
-        print(file_content)
         
         if operation == "encrypt":
             if partialEncryption:
@@ -163,6 +194,39 @@ async def encrypt_file(
                         file_content,
                         publicKey
                     )
+                elif algorithm in ("chacha20-poly1305", "aes-gcm-siv"):
+                    if not password:
+                        raise HTTPException(status_code=400, detail=f"Password is required for {algorithm}")
+                    encrypted_data = encryption_service.aead_encrypt(
+                        file_content,
+                        password,
+                        algorithm,
+                        keySize or 256,
+                        nonce or iv
+                    )
+                elif algorithm == "aead-auto":
+                    if not password:
+                        raise HTTPException(status_code=400, detail="Password is required for aead-auto")
+                    encrypted_data = encryption_service.aead_auto_encrypt(file_content, password)
+                elif algorithm == "ecc-multi":
+                    if not publicKeys:
+                        raise HTTPException(status_code=400, detail="Public keys are required for multi-recipient ECC encryption")
+                    encrypted_data = encryption_service.ecc_encrypt_multi(
+                        file_content,
+                        _parse_public_keys(publicKeys),
+                        curve
+                    )
+                elif algorithm == "envelope":
+                    if password:
+                        encrypted_data = encryption_service.encrypt_wrapped(file_content, "password", password)
+                    elif publicKey:
+                        encrypted_data = encryption_service.encrypt_wrapped(
+                            file_content,
+                            encryption_service.wrap_method(publicKey),
+                            publicKey
+                        )
+                    else:
+                        raise HTTPException(status_code=400, detail="Password or public key is required for envelope encryption")
                 elif algorithm == "3des":
                     encrypted_data = encryption_service.triple_des_encrypt(
                         file_content,
@@ -178,12 +242,13 @@ async def encrypt_file(
                 else:
                     raise HTTPException(status_code=400, detail=f"Unsupported algorithm: {algorithm}")
                 
-                encrypted_base64 = base64.b64encode(encrypted_data).decode('utf-8')
-                return {
-                    "filename": f"encrypted_{file.filename}",
-                    "data": encrypted_base64,
-                    "message": "Success"
-                }
+                return envelope_response(
+                    request,
+                    {"filename": f"encrypted_{file.filename}", "message": "Success"},
+                    encrypted_data,
+                    "base64",
+                    compress=False
+                )
                 
         else:  # decrypt
             try:
@@ -261,6 +326,30 @@ async def encrypt_file(
                             encrypted_bytes,
                             privateKey
                         )
+                    elif algorithm in ("chacha20-poly1305", "aes-gcm-siv"):
+                        if not password:
+                            raise HTTPException(status_code=400, detail=f"Password is required for {algorithm}")
+                        decrypted_data = encryption_service.aead_decrypt(
+                            encrypted_bytes,
+                            password,
+                            algorithm,
+                            keySize or 256
+                        )
+                    elif algorithm == "aead-auto":
+                        if not password:
+                            raise HTTPException(status_code=400, detail="Password is required for aead-auto")
+                        decrypted_data = encryption_service.aead_auto_decrypt(encrypted_bytes, password)
+                    elif algorithm == "ecc-multi":
+                        if not privateKey:
+                            raise HTTPException(status_code=400, detail="Private key is required for multi-recipient ECC decryption")
+                        decrypted_data = encryption_service.ecc_decrypt_multi(
+                            encrypted_bytes,
+                            privateKey
+                        )
+                    elif algorithm == "envelope":
+                        if not password and not privateKey:
+                            raise HTTPException(status_code=400, detail="Password or private key is required for envelope decryption")
+                        decrypted_data = encryption_service.decrypt_wrapped(encrypted_bytes, password or privateKey)
                     elif algorithm == "3des":
                         decrypted_data = encryption_service.triple_des_decrypt(
                             encrypted_bytes,
@@ -275,22 +364,20 @@ async def encrypt_file(
                     else:
                         raise HTTPException(status_code=400, detail=f"Unsupported algorithm: {algorithm}")
                     
+                    fields = {"filename": f"decrypted_{file.filename}", "message": "Success"}
+                    if outputEncoding is None and not looks_like_text(decrypted_data):
+                        # Judged on a sample, so binary output is never decoded in full
+                        outputEncoding = "base64"
+                    if outputEncoding == "base64":
+                        return envelope_response(request, fields, decrypted_data, "base64")
                     try:
-                        # Try to decode as text first
                         decrypted_text = decrypted_data.decode('utf-8')
-                        return {
-                            "filename": f"decrypted_{file.filename}",
-                            "data": decrypted_text,
-                            "message": "Success"
-                        }
                     except UnicodeDecodeError:
-                        # If not text, return as base64
-                        decrypted_base64 = base64.b64encode(decrypted_data).decode('utf-8')
-                        return {
-                            "filename": f"decrypted_{file.filename}",
-                            "data": decrypted_base64,
-                            "message": "Success"
-                        }
+                        if outputEncoding == "text":
+                            raise ValueError("Decrypted data is not valid UTF-8 text")
+                        # Text at the start only: fall back to base64
+                        return envelope_response(request, fields, decrypted_data, "base64")
+                    return envelope_response(request, fields, decrypted_text, "text")
             except ValueError as e:
                 logger.error(f"Decryption error: {str(e)}")
                 raise HTTPException(status_code=400, detail=str(e))
@@ -350,20 +437,34 @@ async def generate_ecc_keys(
     """
     Endpoint to generate a new Elliptic Curve Cryptography (ECC) key pair.
     
-    Supports different curves, including secp256r1 and secp256k1.
-    Returns both the private and public keys in PEM format.
+    Supports different curves, including secp256r1 and secp256k1, whose keys are
+    returned in PEM format, and x25519, whose keys are returned as raw 32-byte
+    hex strings. Every curve offered here can be used for ECIES encryption.
     
     Parameters:
-    - curve: The elliptic curve to use (e.g., "secp256r1", "secp256k1")
+    - curve: The elliptic curve to use ("secp256r1", "secp256k1" or "x25519")
     
     Returns:
-    - JSON containing private_key and public_key in PEM format
+    - JSON containing private_key, public_key and their format ("pem" or "raw-hex")
     """
     # Generate public and private keys using ec.generate_private_key
-    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric import ec, x25519
     from cryptography.hazmat.primitives import serialization
     from cryptography.hazmat.backends import default_backend
 
+    # Curve25519 keys are serialized raw: no PEM parsing on the encryption hot path
+    if curve == "x25519":
+        private_key = x25519.X25519PrivateKey.generate()
+        return {
+            "private_key": private_key.private_bytes(
+                serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption()
+            ).hex(),
+            "public_key": private_key.public_key().public_bytes(
+                serialization.Encoding.Raw, serialization.PublicFormat.Raw
+            ).hex(),
+            "format": "raw-hex"
+        }
+
     # Select the curve based on the input parameter
     if curve == "secp256r1":
         private_key = ec.generate_private_key(
@@ -375,6 +476,8 @@ async def generate_ecc_keys(
             ec.SECP256K1(),
             default_backend()
         )
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported curve: {curve}")
 
     # Get the corresponding public key
     public_key = private_key.public_key()
@@ -394,12 +497,13 @@ async def generate_ecc_keys(
 
     return {
         "private_key": private_key_pem.decode('utf-8'),
-        "public_key": public_key_pem.decode('utf-8')
+        "public_key": public_key_pem.decode('utf-8'),
+        "format": "pem"
     }
 
 
 @router.post("/image/process", response_model=ImageEncryptionResponse)
-async def process_image(request: ImageEncryptionRequest):
+async def process_image(request: ImageEncryptionRequest, response: Response):
     """
     Endpoint to process (encrypt or decrypt) regions of an image.
     
@@ -410,13 +514,15 @@ async def process_image(request: ImageEncryptionRequest):
     - request: Contains image content, encryption key, regions, algorithm, operation
     
     Returns:
-    - Processed image in Base64 format with filename
+    - Processed image in Base64 format with filename. Identical requests are
+      served from the result cache (X-Result-Cache: hit)
     """
     # 1️⃣ Validate Base64 image blob
     try:
         image_data = base64.b64decode(request.image_content, validate=True)
     except (binascii.Error, ValueError):
         raise HTTPException(status_code=400, detail="`image_content` is not valid Base64")
+    memory_stats.checkpoint("parse")
 
     # 2️⃣ Validate hex key
     if len(request.key) % 2 != 0:
@@ -435,37 +541,85 @@ async def process_image(request: ImageEncryptionRequest):
         except (binascii.Error, ValueError) as e:
             raise HTTPException(status_code=400, detail=f"`nonce` is not valid hex: {e}")
 
-    # 4️⃣ Validate regions list
-    if not request.regions or not all(
-        isinstance(r, dict) and
-        all(k in r for k in ("left","top","width","height"))
-        for r in request.regions
-    ):
-        raise HTTPException(
-            status_code=400,
-            detail="Each entry in `regions` must be an object with keys: left, top, width, height"
-        )
+    # 4️⃣ Validate regions (list of objects or packed blob)
+    try:
+        if request.regions_packed is not None:
+            region_set = RegionSet.from_base64(request.regions_packed)
+        else:
+            region_set = RegionSet.from_dicts(request.regions)
+        if request.merge_regions:
+            region_set = region_set.merged()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regions: {e}")
+    if not len(region_set):
+        raise HTTPException(status_code=400, detail="No regions provided")
 
-    # ✅ All good—call your service
+    # ✅ All good—call your service (or reuse an identical earlier result)
+    output_format = image_codecs.resolve_output_format(request.output_format, request.operation)
+    cache_key = None
+    if settings.RESULT_CACHE_ENABLED:
+        cache_key = result_cache.make_key("image/process", image_data, {
+            "regions": region_set.fingerprint(),
+            "key": request.key,
+            "nonce": request.nonce,
+            "algorithm": request.algorithm,
+            "operation": request.operation,
+            "manifest_mode": request.manifest_mode,
+            "output_format": output_format,
+            "channels": request.channels,
+        })
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            response.headers["X-Result-Cache"] = "hit"
+            processed_data, meta = cached
+            return ImageEncryptionResponse(
+                processed_image=base64.b64encode(processed_data).decode('utf-8'),
+                filename=image_codecs.output_filename("processed_image", output_format),
+                manifest=meta["manifest"] if request.manifest_mode == "sidecar" else None,
+                mime_type=image_codecs.mime_type(output_format)
+            )
+
+    manifest = None
     try:
-        processed_data = image_service.process_image(
-            image_data,
-            request.regions,
-            request.key,
-            request.nonce,
-            request.algorithm,
-            request.operation
-            
-        )
+        if request.manifest_mode:
+            processed_data, manifest = image_service.process_image_with_manifest(
+                image_data,
+                region_set,
+                request.key,
+                request.nonce,
+                request.algorithm,
+                request.operation,
+                embed_manifest=request.manifest_mode == "embed",
+                output_format=request.output_format,
+                channels=request.channels
+            )
+        else:
+            processed_data = image_service.process_image(
+                image_data,
+                region_set,
+                request.key,
+                request.nonce,
+                request.algorithm,
+                request.operation,
+                output_format=request.output_format,
+                channels=request.channels
+            )
     except Exception as e:
         # If your service ever throws, bubble up as 400
         raise HTTPException(status_code=400, detail=str(e))
 
+    if cache_key is not None:
+        result_cache.put(cache_key, processed_data, {"manifest": manifest})
+        response.headers["X-Result-Cache"] = "miss"
+
     # Encode back to Base64 for the response
     processed_image = base64.b64encode(processed_data).decode('utf-8')
+    memory_stats.checkpoint("base64")
     return ImageEncryptionResponse(
         processed_image=processed_image,
-        filename="processed_image.png"
+        filename=image_codecs.output_filename("processed_image", output_format),
+        manifest=manifest if request.manifest_mode == "sidecar" else None,
+        mime_type=image_codecs.mime_type(output_format)
     )
 
 
@@ -490,23 +644,24 @@ async def hash_file(
     - JSON with filename, computed hash value, and status message
     """
     try:
-        # Read file content
-        file_content = await file.read()
-        logger.debug(f"File read - Size: {len(file_content)} bytes")
-
         # Choose hash algorithm based on request
         if algorithm == "sha256":
             hasher = hashlib.sha256()
-            hasher.update(file_content)
-            hash_value = hasher.hexdigest()
-            
         elif algorithm == "blake3":
             hasher = blake3.blake3()
-            hasher.update(file_content)
-            hash_value = hasher.hexdigest()
-            
         else:
             raise HTTPException(status_code=400, detail=f"Unsupported algorithm: {algorithm}")
+
+        # Hash the spooled upload in chunks instead of reading it all into memory
+        size = 0
+        while True:
+            block = await file.read(settings.STREAM_READ_SIZE)
+            if not block:
+                break
+            hasher.update(block)
+            size += len(block)
+        logger.debug(f"File hashed - Size: {size} bytes")
+        hash_value = hasher.hexdigest()
         
         return {
             "filename": f"hashed_{file.filename}",
@@ -518,6 +673,236 @@ async def hash_file(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/stream/hash")
+async def stream_hash_file(request: Request):
+    """
+    Streaming variant of /hash that hashes the upload while it is received.
+
+    The multipart body is parsed incrementally instead of being spooled first,
+    so hashing overlaps with the upload. Form fields must precede the file part.
+
+    Parameters:
+    - algorithm: Hash algorithm to use (sha256 or blake3)
+    - file: The file to be hashed
+
+    Returns:
+    - JSON with filename, computed hash value, and status message
+    """
+    hasher = None
+
+    async def open_file(fields, filename):
+        nonlocal hasher
+        algorithm = fields.get("algorithm")
+        if algorithm == "sha256":
+            hasher = hashlib.sha256()
+        elif algorithm == "blake3":
+            hasher = blake3.blake3()
+        elif algorithm is None:
+            raise HTTPException(status_code=400, detail="`algorithm` must be sent before the file")
+        else:
+            raise HTTPException(status_code=400, detail=f"Unsupported algorithm: {algorithm}")
+        return CpuPipeline(hasher.update)
+
+    _, filename = await _stream_upload(request, open_file)
+    return {
+        "filename": f"hashed_{filename}",
+        "hash": hasher.hexdigest(),
+        "message": "Success"
+    }
+
+
+@router.post("/stream/encrypt")
+async def stream_encrypt_file(request: Request):
+    """
+    Streaming variant of /encrypt that encrypts or decrypts the upload while it is received.
+
+    Uses the chunked AES-GCM stream format so the file can be processed
+    incrementally. The output is spooled and sent once the whole upload has
+    been processed (and, when decrypting, authenticated). Form fields must
+    precede the file part.
+
+    Parameters:
+    - operation: Either "encrypt" or "decrypt"
+    - algorithm: Must be "aes"
+    - password: Password for key derivation
+    - keySize: Key size in bits (encryption only, defaults to 256)
+    - chunkSize: Optional plaintext bytes per chunk (encryption only)
+    - file: The file to process
+
+    Returns:
+    - The processed file as application/octet-stream
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_SIZE)
+    cipher = None
+
+    async def open_file(fields, filename):
+        nonlocal cipher
+        operation = fields.get("operation")
+        password = fields.get("password")
+        if operation not in ("encrypt", "decrypt") or not password:
+            raise HTTPException(status_code=400, detail="`operation` and `password` must be sent before the file")
+        if fields.get("algorithm", "aes") != "aes":
+            raise HTTPException(status_code=400, detail="Streaming uploads only support the aes algorithm")
+        try:
+            if operation == "encrypt":
+                chunk_size = int(fields["chunkSize"]) if fields.get("chunkSize") else None
+                cipher = await run_in_threadpool(
+                    encryption_service.chunked_encryptor, password, int(fields.get("keySize") or 256), chunk_size
+                )
+            else:
+                cipher = encryption_service.chunked_decryptor(password)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return CpuPipeline(lambda block: output.write(cipher.update(block)))
+
+    try:
+        fields, filename = await _stream_upload(request, open_file)
+        output.write(await run_in_threadpool(cipher.finalize))
+    except ValueError as e:
+        output.close()
+        logger.error(f"Streaming encryption error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        output.close()
+        raise
+
+    output.seek(0)
+
+    def iter_output():
+        while True:
+            block = output.read(settings.STREAM_READ_SIZE)
+            if not block:
+                break
+            yield block
+
+    prefix = "encrypted" if fields["operation"] == "encrypt" else "decrypted"
+    return StreamingResponse(
+        iter_output(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{prefix}_{filename}"'},
+        background=BackgroundTask(output.close)
+    )
+
+
+@router.post("/decrypt/range")
+async def decrypt_range(
+    request: Request,
+    file: UploadFile = File(...),
+    password: str = Form(...),
+):
+    """
+    Decrypt part of a chunked AES-GCM stream, honouring the Range header.
+
+    Only the chunks covering the requested bytes (plus the final chunk, which
+    vouches for the plaintext size) are read, decrypted and authenticated.
+    Files produced by /stream/encrypt and the CLI use this format.
+
+    The upload itself is still received in full (spooled to disk past a
+    small size), since the server holds no stored ciphertext to seek into;
+    the decryption work is what scales with the range. Callers holding the
+    file locally can use EncryptionService.chunked_reader on any seekable
+    file for fully proportional reads.
+
+    Parameters:
+    - file: The encrypted file
+    - password: Password for key derivation
+    - Range header: A single "bytes=start-end", "bytes=start-" or "bytes=-suffix"
+      range; without it the whole plaintext is returned
+
+    Returns:
+    - 206 with the requested plaintext bytes and Content-Range, or 200 with all of it
+    """
+    try:
+        reader = await run_in_threadpool(encryption_service.chunked_reader, file.file, password)
+    except ValueError as e:
+        logger.error(f"Range decryption error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    byte_range = _parse_range(request.headers.get("range"), reader.size)
+    start, end = byte_range if byte_range else (0, reader.size)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start),
+        "Content-Disposition": f'attachment; filename="decrypted_{file.filename}"',
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{reader.size}"
+
+    # Authenticate the first covering chunk before committing to a response
+    chunks = reader.read(start, end)
+    try:
+        first = await run_in_threadpool(next, chunks, b"")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def iter_range():
+        yield first
+        yield from chunks
+
+    return StreamingResponse(
+        iter_range(),
+        status_code=206 if byte_range else 200,
+        media_type="application/octet-stream",
+        headers=headers,
+    )
+
+
+@router.post("/rewrap")
+async def rewrap_file(
+    file: UploadFile = File(...),
+    oldPassword: Optional[str] = Form(None),
+    oldPrivateKey: Optional[str] = Form(None),
+    newPassword: Optional[str] = Form(None),
+    newPublicKey: Optional[str] = Form(None),
+):
+    """
+    Change the password or key pair protecting an envelope-encrypted file.
+
+    Only the wrapped data key at the start of the file is replaced; the
+    payload is passed through unchanged, without being decrypted.
+
+    Parameters:
+    - file: The envelope-encrypted file (binary, i.e. the Base64-decoded /encrypt output)
+    - oldPassword / oldPrivateKey: The credential currently protecting the file
+    - newPassword / newPublicKey: The new credential (RSA or ECC public key)
+
+    Returns:
+    - The re-wrapped file as application/octet-stream
+    """
+    old_key = oldPassword or oldPrivateKey
+    if not old_key:
+        raise HTTPException(status_code=400, detail="Old password or private key is required")
+    if newPassword:
+        new_method, new_key = "password", newPassword
+    elif newPublicKey:
+        new_method, new_key = encryption_service.wrap_method(newPublicKey), newPublicKey
+    else:
+        raise HTTPException(status_code=400, detail="New password or public key is required")
+
+    try:
+        prefix, old_length = await run_in_threadpool(
+            encryption_service.rewrap, file.file, old_key, new_method, new_key
+        )
+    except ValueError as e:
+        logger.error(f"Rewrap error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def iter_file():
+        yield prefix
+        file.file.seek(old_length)
+        while True:
+            block = file.file.read(settings.STREAM_READ_SIZE)
+            if not block:
+                break
+            yield block
+
+    return StreamingResponse(
+        iter_file(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{file.filename}"'}
+    )
+
+
 @router.post("/image/auto-decrypt", response_model=ImageEncryptionResponse)
 async def auto_decrypt_image(request: AutoDecryptImageRequest):
     """
@@ -537,6 +922,7 @@ async def auto_decrypt_image(request: AutoDecryptImageRequest):
         image_data = base64.b64decode(request.image_content, validate=True)
     except (binascii.Error, ValueError):
         raise HTTPException(status_code=400, detail="`image_content` is not valid Base64")
+    memory_stats.checkpoint("parse")
 
     # 2️⃣ Validate hex key
     if len(request.key) % 2 != 0:
@@ -561,25 +947,33 @@ async def auto_decrypt_image(request: AutoDecryptImageRequest):
             image_data,
             request.key,
             request.nonce,
-            request.algorithm
+            request.algorithm,
+            manifest=request.manifest,
+            output_format=request.output_format,
+            allow_unauthenticated_manifest=request.allow_unauthenticated_manifest
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
     # Encode back to Base64 for the response
+    output_format = image_codecs.resolve_output_format(request.output_format, "decrypt")
     processed_image = base64.b64encode(processed_data).decode('utf-8')
+    memory_stats.checkpoint("base64")
     return ImageEncryptionResponse(
         processed_image=processed_image,
-        filename="decrypted_image.png"
+        filename=image_codecs.output_filename("decrypted_image", output_format),
+        mime_type=image_codecs.mime_type(output_format)
     )
 
 
 @router.post("/image/partial-encrypt", response_model=ImageEncryptionResponse)
 async def partial_encrypt_image(
+    response: Response,
     image_content: str = Form(...),  # Base64 encoded image
     operation: Literal["encrypt", "decrypt"] = Form(...),
     algorithm: str = Form(...),
-    regions: str = Form(...),  # String of regions in format "x,y,width,height;x,y,width,height"
+    regions: Optional[str] = Form(None),  # String of regions in format "x,y,width,height;x,y,width,height"
+    regions_packed: Optional[str] = Form(None),  # Base64 packed int32 regions, instead of `regions`
     password: Optional[str] = Form(None),
     key_size: Optional[int] = Form(None),
     mode: Optional[str] = Form(None),
@@ -587,20 +981,29 @@ async def partial_encrypt_image(
     nonce: Optional[str] = Form(None),
     rc4_key: Optional[str] = Form(None),
     logistic_initial: Optional[float] = Form(None),
-    logistic_parameter: Optional[float] = Form(None)
+    logistic_parameter: Optional[float] = Form(None),
+    embed_manifest: bool = Form(False),
+    output_format: Optional[ImageOutputFormat] = Form(None),
+    channels: Optional[str] = Form(None)  # Comma separated channel indices, e.g. "0,1,2"
 ):
     """
     Endpoint to encrypt or decrypt specific regions of an image.
     
     Takes a Base64-encoded image and processes specified regions using the
-    selected cryptographic algorithm. Supports AES, RC4, and Logistic XOR algorithms.
+    selected cryptographic algorithm. Supports AES, RC4, Logistic XOR and the
+    parallelizable Logistic Tiled variant (algorithm "logistic-tiled").
     
     Parameters:
     - image_content: Base64 encoded image data
     - operation: Either "encrypt" or "decrypt"
     - algorithm: Cryptographic algorithm to use
     - regions: String specifying regions to process in format "x,y,width,height;x,y,width,height"
+    - regions_packed: Base64 packed regions (little-endian int32 left, top, width, height per region),
+      for masks of thousands of regions; used instead of `regions`
     - Various algorithm-specific parameters
+    - embed_manifest: Store a region manifest in the output PNG so auto-decrypt can skip detection
+    - output_format: Output encoding profile (png, png-fast, png-store, webp-lossless, tiff, raw)
+    - channels: Comma separated channel indices to process; alpha is left in the clear by default
     
     Returns:
     - Processed image in Base64 format with filename and success message
@@ -611,32 +1014,16 @@ async def partial_encrypt_image(
             image_data = base64.b64decode(image_content, validate=True)
         except (binascii.Error, ValueError):
             raise HTTPException(status_code=400, detail="Invalid Base64 image data")
+        memory_stats.checkpoint("parse")
 
-        # Parse regions string
+        # Parse regions (string or packed blob) in one vectorized pass
+        region_set = _parse_region_string(regions, regions_packed)
+
+        # Parse channel selection
         try:
-            regions_list = []
-            for region_str in regions.split(';'):
-                if not region_str.strip():
-                    continue
-                try:
-                    x, y, width, height = map(int, region_str.split(','))
-                    regions_list.append({
-                        "left": x,
-                        "top": y,
-                        "width": width,
-                        "height": height
-                    })
-                except ValueError:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Invalid region format: {region_str}. Expected format: x,y,width,height"
-                    )
-            
-            if not regions_list:
-                raise HTTPException(status_code=400, detail="No valid regions provided")
-                
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid regions format: {str(e)}")
+            channels_list = [int(c) for c in channels.split(',') if c.strip()] if channels else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid channels: {channels}. Expected format: 0,1,2")
 
         # Validate algorithm-specific parameters
         if algorithm == "aes":
@@ -654,7 +1041,7 @@ async def partial_encrypt_image(
         elif algorithm == "rc4":
             if not rc4_key:
                 raise HTTPException(status_code=400, detail="RC4 key is required")
-        elif algorithm == "logistic":
+        elif algorithm in ("logistic", "logistic-tiled"):
             if logistic_initial is None:
                 raise HTTPException(status_code=400, detail="Initial value is required for Logistic XOR")
             if logistic_parameter is None:
@@ -666,22 +1053,55 @@ async def partial_encrypt_image(
         else:
             raise HTTPException(status_code=400, detail=f"Unsupported algorithm: {algorithm}")
 
+        # Identical requests (e.g. preview toggles) are served from the result cache
+        resolved_format = image_codecs.resolve_output_format(output_format, operation)
+        cache_key = None
+        cached = None
+        if settings.RESULT_CACHE_ENABLED:
+            cache_key = result_cache.make_key("image/partial-encrypt", image_data, {
+                "operation": operation,
+                "algorithm": algorithm,
+                "regions": region_set.fingerprint(),
+                "password": password,
+                "key_size": key_size,
+                "mode": mode,
+                "iv": iv,
+                "nonce": nonce,
+                "rc4_key": rc4_key,
+                "logistic_initial": logistic_initial,
+                "logistic_parameter": logistic_parameter,
+                "embed_manifest": embed_manifest,
+                "output_format": resolved_format,
+                "channels": channels_list,
+            })
+            cached = result_cache.get(cache_key)
+
         # Process the image
         try:
-            processed_data = image_service.partial_process_image(
-                image_data=image_data,
-                regions=regions_list,
-                operation=operation,
-                algorithm=algorithm,
-                password=password,
-                key_size=key_size,
-                mode=mode,
-                iv=iv,
-                nonce=nonce,
-                rc4_key=rc4_key,
-                logistic_initial=logistic_initial,
-                logistic_parameter=logistic_parameter
-            )
+            if cached is not None:
+                processed_data = cached[0]
+                response.headers["X-Result-Cache"] = "hit"
+            else:
+                processed_data = image_service.partial_process_image(
+                    image_data=image_data,
+                    regions=region_set,
+                    operation=operation,
+                    algorithm=algorithm,
+                    password=password,
+                    key_size=key_size,
+                    mode=mode,
+                    iv=iv,
+                    nonce=nonce,
+                    rc4_key=rc4_key,
+                    logistic_initial=logistic_initial,
+                    logistic_parameter=logistic_parameter,
+                    embed_manifest=embed_manifest,
+                    output_format=output_format,
+                    channels=channels_list
+                )
+                if cache_key is not None:
+                    result_cache.put(cache_key, processed_data)
+                    response.headers["X-Result-Cache"] = "miss"
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
@@ -690,14 +1110,390 @@ async def partial_encrypt_image(
 
         # Encode result back to Base64
         processed_base64 = base64.b64encode(processed_data).decode('utf-8')
+        memory_stats.checkpoint("base64")
         
         # Return the response with the processed image
         return {
             "processed_image": processed_base64,
-            "filename": f"{operation}ed_image.png",
+            "filename": image_codecs.output_filename(f"{operation}ed_image", resolved_format),
+            "mime_type": image_codecs.mime_type(resolved_format),
             "success": "Success"
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _validate_hex(value: Optional[str], name: str) -> None:
+    """Raise a 400 error unless ``value`` is None or an even-length hex string."""
+    if value is None:
+        return
+    if len(value) % 2 != 0:
+        raise HTTPException(status_code=400, detail=f"`{name}` must be an even‑length hex string; got {len(value)} chars")
+    try:
+        binascii.unhexlify(value)
+    except (binascii.Error, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"`{name}` is not valid hex: {e}")
+
+
+def _parse_public_keys(public_keys: str) -> List[str]:
+    """Parse recipient public keys given as a JSON list or as concatenated PEM blocks."""
+    text = public_keys.strip()
+    if text.startswith('['):
+        try:
+            keys = json.loads(text)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="`publicKeys` is not a valid JSON list")
+        if not isinstance(keys, list) or not all(isinstance(k, str) for k in keys):
+            raise HTTPException(status_code=400, detail="`publicKeys` must be a list of PEM strings")
+        return keys
+    end = "-----END PUBLIC KEY-----"
+    return [block.strip() + "\n" + end + "\n" for block in text.split(end) if block.strip()]
+
+
+def _parse_region_string(regions: Optional[str], packed: Optional[str] = None) -> RegionSet:
+    """Parse regions given as "x,y,width,height;x,y,width,height" or as Base64 packed regions."""
+    try:
+        if packed is not None:
+            region_set = RegionSet.from_base64(packed)
+        else:
+            region_set = RegionSet.from_string(regions or "")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not len(region_set):
+        raise HTTPException(status_code=400, detail="No valid regions provided")
+    return region_set
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header into a half-open (start, end) interval.
+
+    Returns None when there is no usable Range header (multiple ranges are
+    ignored and answered with the full content). Unsatisfiable ranges raise 416.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            start, end = max(size - int(last), 0), size
+    except ValueError:
+        return None
+    end = min(end, size)
+    if start >= end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+async def _stream_upload(request: Request, open_file) -> Tuple[Dict[str, str], str]:
+    """
+    Parse a multipart body as it arrives and feed the file part to a CpuPipeline.
+
+    ``open_file(fields, filename)`` is awaited when the file part starts, with
+    the form fields received so far, and returns the pipeline consuming it.
+
+    Returns:
+    - Tuple of the form fields and the uploaded filename
+    """
+    parser = MultipartStream(request.headers.get("content-type", ""))
+    fields: Dict[str, str] = {}
+    filename = None
+    pipeline = None
+    complete = False
+    try:
+        async for chunk in request.stream():
+            for event in parser.feed(chunk):
+                if event[0] == "field":
+                    fields[event[1]] = event[2]
+                elif event[0] == "file":
+                    if pipeline is not None:
+                        raise HTTPException(status_code=400, detail="Only one file can be uploaded")
+                    filename = event[2]
+                    pipeline = await open_file(fields, filename)
+                elif event[0] == "data":
+                    await pipeline.feed(event[1])
+                else:
+                    complete = True
+        if pipeline is None:
+            raise HTTPException(status_code=400, detail="No file was uploaded")
+        if not complete:
+            raise HTTPException(status_code=400, detail="Multipart body is truncated")
+        await pipeline.finish()
+    except BaseException:
+        if pipeline is not None:
+            await pipeline.abort()
+        raise
+    return fields, filename
+
+
+@router.post("/image/animation/process", response_model=ImageEncryptionResponse)
+async def process_animation(request: AnimationEncryptionRequest):
+    """
+    Endpoint to process (encrypt or decrypt) regions across every frame of an animated image.
+
+    Accepts a Base64-encoded GIF or APNG. The same regions are processed in every
+    frame unless per-frame region tracks are given. Frames are streamed through
+    a worker pool and the result is returned as a lossless APNG.
+
+    Parameters:
+    - request: Contains animation content, key, nonce, regions, algorithm, operation
+
+    Returns:
+    - Processed animation (APNG) in Base64 format with filename
+    """
+    try:
+        image_data = base64.b64decode(request.image_content, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="`image_content` is not valid Base64")
+    _validate_hex(request.key, "key")
+    _validate_hex(request.nonce, "nonce")
+
+    try:
+        processed_data = animation_service.process_animation(
+            image_data,
+            request.regions,
+            request.key,
+            request.nonce,
+            request.algorithm,
+            request.operation,
+            request.frame_regions
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return ImageEncryptionResponse(
+        processed_image=base64.b64encode(processed_data).decode('utf-8'),
+        filename="processed_animation.png"
+    )
+
+
+@router.post("/image/frames/process")
+async def process_frame_sequence(
+    frames: List[UploadFile] = File(...),
+    operation: Literal["encrypt", "decrypt"] = Form(...),
+    algorithm: Literal["AES-CTR", "ChaCha20", "RC4", "Logistic XOR", "Logistic Tiled"] = Form(...),
+    key: str = Form(...),
+    regions: str = Form(...),  # String of regions in format "x,y,width,height;x,y,width,height"
+    nonce: Optional[str] = Form(None),
+):
+    """
+    Endpoint to process the same regions across a sequence of raw frames.
+
+    Frames are uploaded as individual image files in order. Processed frames are
+    streamed back as newline-delimited JSON as soon as they are ready, one
+    object per frame with its index and Base64-encoded PNG.
+
+    Parameters:
+    - frames: Ordered frame images
+    - operation: Either "encrypt" or "decrypt"
+    - algorithm: Cryptographic algorithm to use
+    - key: Hex encoded key
+    - regions: String specifying regions in format "x,y,width,height;x,y,width,height"
+    - nonce: Hex encoded nonce (for AES-CTR and ChaCha20)
+
+    Returns:
+    - NDJSON stream of {"index", "frame"} objects
+    """
+    _validate_hex(key, "key")
+    _validate_hex(nonce, "nonce")
+    regions_list = _parse_region_string(regions).to_dicts()
+
+    # The uploads may be closed once this handler returns, before the stream
+    # is consumed, so copy them into spools owned by the response
+    spools = []
+    try:
+        for upload in frames:
+            spool = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_SIZE)
+            spools.append(spool)
+            while True:
+                block = await upload.read(settings.STREAM_READ_SIZE)
+                if not block:
+                    break
+                spool.write(block)
+    except BaseException:
+        for spool in spools:
+            spool.close()
+        raise
+
+    def frame_bytes():
+        for spool in spools:
+            spool.seek(0)
+            yield spool.read()
+
+    def close_spools():
+        for spool in spools:
+            spool.close()
+
+    def ndjson():
+        processed = animation_service.process_frame_sequence(
+            frame_bytes(), regions_list, key, nonce, algorithm, operation
+        )
+        for index, frame in enumerate(processed):
+            yield json.dumps({"index": index, "frame": base64.b64encode(frame).decode('utf-8')}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", background=BackgroundTask(close_spools))
+
+
+@router.post("/image/session", response_model=ImageSessionResponse)
+async def create_image_session(request: ImageSessionCreateRequest):
+    """
+    Endpoint to open an incremental editing session for an image.
+
+    The decoded image is kept server-side so later region changes only process
+    the regions that were added or removed.
+
+    Parameters:
+    - request: Contains image content, key, nonce, algorithm, operation and initial regions
+
+    Returns:
+    - Session id and the processed image in Base64 format
+    """
+    try:
+        image_data = base64.b64decode(request.image_content, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="`image_content` is not valid Base64")
+    _validate_hex(request.key, "key")
+    _validate_hex(request.nonce, "nonce")
+
+    try:
+        session_id, processed_data = image_sessions.create(
+            image_data,
+            request.key,
+            request.nonce,
+            request.algorithm,
+            request.operation,
+            request.regions,
+            output_format=request.output_format,
+            channels=request.channels
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    output_format = image_codecs.resolve_output_format(request.output_format, request.operation)
+    return ImageSessionResponse(
+        session_id=session_id,
+        processed_image=base64.b64encode(processed_data).decode('utf-8'),
+        added=len(request.regions),
+        mime_type=image_codecs.mime_type(output_format)
+    )
+
+
+@router.post("/image/session/{session_id}/regions", response_model=ImageSessionResponse)
+async def update_image_session(session_id: str, request: ImageSessionUpdateRequest):
+    """
+    Endpoint to add or remove regions in an image editing session.
+
+    Only the delta is processed. The response carries either the full image or,
+    with response_mode "patches", just the rectangles that changed.
+
+    Parameters:
+    - session_id: Session returned by /image/session
+    - request: Regions to add and remove, or the full region list
+
+    Returns:
+    - Full image or changed patches, with the number of regions added and removed
+    """
+    try:
+        result = image_sessions.update(
+            session_id,
+            add=request.add,
+            remove=request.remove,
+            regions=request.regions,
+            patches=request.response_mode == "patches"
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown or expired image session")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    session = image_sessions.get(session_id)
+    if "patches" in result:
+        content = {"patches": [
+            dict(patch, image=base64.b64encode(patch["image"]).decode('utf-8'))
+            for patch in result["patches"]
+        ]}
+    else:
+        content = {"processed_image": base64.b64encode(result["image"]).decode('utf-8')}
+    return ImageSessionResponse(
+        session_id=session_id,
+        added=result["added"],
+        removed=result["removed"],
+        mime_type=image_codecs.mime_type(session.output_format),
+        **content
+    )
+
+
+@router.delete("/image/session/{session_id}")
+async def close_image_session(session_id: str):
+    """
+    Endpoint to close an image editing session and free its memory.
+    """
+    if not image_sessions.close(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired image session")
+    return {"message": "Success"}
+
+
+def _require_profile_admin(token: Optional[str]) -> None:
+    """Hide the profile endpoints unless the request carries the admin token."""
+    if not admin_token_valid(token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get("/profiles")
+async def list_profiles(x_profile: Optional[str] = Header(None)):
+    """
+    Endpoint to list stored request profiles, newest first.
+
+    Parameters:
+    - x_profile: The profiling admin token (X-Profile header).
+
+    Returns:
+    - Metadata of each profile: path, status, duration, sample count and trigger.
+    """
+    _require_profile_admin(x_profile)
+    return {"profiles": await run_in_threadpool(profile_store.list)}
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: Literal["speedscope", "collapsed"] = "speedscope",
+                      x_profile: Optional[str] = Header(None)):
+    """
+    Endpoint to download a stored request profile.
+
+    Parameters:
+    - profile_id: The id from the profile list.
+    - format: "speedscope" (JSON for speedscope.app) or "collapsed" (for flamegraph.pl).
+    - x_profile: The profiling admin token (X-Profile header).
+    """
+    _require_profile_admin(x_profile)
+    path = profile_store.path(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Unknown profile")
+    media_type = "application/json" if format == "speedscope" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+
+@router.get("/metrics/memory")
+async def memory_metrics(x_profile: Optional[str] = Header(None)):
+    """
+    Endpoint reporting per-endpoint memory statistics of the worker serving it.
+
+    Parameters:
+    - x_profile: The profiling admin token (X-Profile header).
+
+    Returns:
+    - Worker RSS, per-endpoint RSS growth and per-stage deltas (with the top
+      allocating lines of traced requests), and the leak detector status.
+    """
+    _require_profile_admin(x_profile)
+    return memory_stats.memory_stats.snapshot()
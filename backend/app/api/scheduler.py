@@ -0,0 +1,226 @@
+import json
+import heapq
+import asyncio
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+_lane = threading.local()
+
+
+def _lane_loop() -> asyncio.AbstractEventLoop:
+    """Event loop of the current lane thread, created on first use and kept for later requests."""
+    loop = getattr(_lane, "loop", None)
+    if loop is None:
+        loop = _lane.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    return loop
+
+
+class _RequestClass:
+    """Queue and counters of one endpoint class."""
+
+    def __init__(self, name: str, weight: float, concurrency: int, offload: bool):
+        self.name = name
+        self.weight = weight
+        self.concurrency = concurrency
+        self.offload = offload
+        self.active = 0
+        # Stride scheduling: the class with the lowest pass is served next,
+        # and each dispatch advances it by 1 / weight
+        self.pass_value = 0.0
+        self.queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"lane-{self.name}")
+        return self._executor
+
+    def has_waiters(self) -> bool:
+        while self.queue and self.queue[0][2].cancelled():
+            heapq.heappop(self.queue)
+        return bool(self.queue)
+
+
+class WeightedFairScheduler:
+    """
+    Slots shared by endpoint classes with weighted-fair dispatch.
+
+    At most ``max_concurrency`` requests run at once, and at most the class
+    concurrency within each class. When requests of several classes are
+    waiting, slots go to the classes in proportion to their weights; within a
+    class, higher priority requests go first, then arrival order.
+    """
+
+    def __init__(self, classes: Dict[str, Dict], max_concurrency: int):
+        self.classes = {
+            name: _RequestClass(name, float(spec.get("weight", 1)), int(spec.get("concurrency", max_concurrency)),
+                                bool(spec.get("offload", False)))
+            for name, spec in classes.items()
+        }
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+
+    async def acquire(self, class_name: str, priority: int, timeout: float) -> bool:
+        """Wait for a slot in the class; returns False if none was granted within ``timeout`` seconds."""
+        request_class = self.classes[class_name]
+        if not request_class.has_waiters() and request_class.active == 0:
+            # A class that was idle does not bank credit for the time it was idle
+            request_class.pass_value = max(request_class.pass_value, self._virtual_time)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(request_class.queue, (priority, next(self._sequence), future))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Granted just as the wait ended
+                self.release(class_name)
+            else:
+                future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                return False
+            raise
+        return True
+
+    def release(self, class_name: str):
+        self.classes[class_name].active -= 1
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency:
+            eligible = [c for c in self.classes.values() if c.active < c.concurrency and c.has_waiters()]
+            if not eligible:
+                return
+            request_class = min(eligible, key=lambda c: c.pass_value)
+            _, _, future = heapq.heappop(request_class.queue)
+            request_class.active += 1
+            self.active += 1
+            self._virtual_time = request_class.pass_value
+            request_class.pass_value += 1.0 / request_class.weight
+            future.set_result(None)
+
+
+class SchedulerMiddleware:
+    """
+    ASGI middleware running requests through a WeightedFairScheduler.
+
+    Each request is assigned an endpoint class from its path (large bodies are
+    promoted to the heavy class) and an optional priority from the
+    X-Priority header (high, normal or low). Classes marked ``offload`` run
+    their requests on a dedicated thread lane, each thread with its own event loop, so
+    CPU-bound handlers of that class cannot stall the main event loop that
+    serves the cheap classes. Requests that wait longer than the queue
+    timeout are answered with 503 and a Retry-After header.
+    """
+
+    def __init__(
+        self,
+        app,
+        classes: Dict[str, Dict] = None,
+        endpoint_classes: Dict[str, str] = None,
+        default_class: str = None,
+        heavy_class: str = None,
+        heavy_body_size: int = None,
+        max_concurrency: int = None,
+        queue_timeout: float = None,
+        retry_after: int = None,
+    ):
+        self.app = app
+        self.scheduler = WeightedFairScheduler(
+            classes if classes is not None else settings.SCHEDULER_CLASSES,
+            max_concurrency or settings.SCHEDULER_MAX_CONCURRENCY,
+        )
+        self.endpoint_classes = endpoint_classes if endpoint_classes is not None else settings.SCHEDULER_ENDPOINT_CLASSES
+        self.default_class = default_class or settings.SCHEDULER_DEFAULT_CLASS
+        self.heavy_class = heavy_class or settings.SCHEDULER_HEAVY_CLASS
+        self.heavy_body_size = heavy_body_size or settings.SCHEDULER_HEAVY_BODY_SIZE
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.SCHEDULER_QUEUE_TIMEOUT
+        self.retry_after = retry_after or settings.SCHEDULER_RETRY_AFTER
+
+    def _classify(self, scope) -> Tuple[str, int]:
+        class_name = self.endpoint_classes.get(scope["path"], self.default_class)
+        priority = PRIORITIES["normal"]
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    if int(value) > self.heavy_body_size:
+                        class_name = self.heavy_class
+                except ValueError:
+                    pass
+            elif name == b"x-priority":
+                priority = PRIORITIES.get(value.decode("latin-1").strip().lower(), priority)
+        return class_name, priority
+
+    async def _reject(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [(b"content-type", b"application/json"), (b"retry-after", str(self.retry_after).encode())],
+        })
+        await send({"type": "http.response.body", "body": json.dumps({"detail": "Server is busy, retry later"}).encode()})
+
+    async def _run_offloaded(self, class_name: str, executor: ThreadPoolExecutor, scope, receive, send):
+        """
+        Run the request on a lane thread's event loop, bridging receive/send back.
+
+        The lane thread cannot be cancelled, so the slot is released when the
+        lane finishes the request rather than when this coroutine ends: a
+        client that disconnects mid-request must not free a slot whose thread
+        is still busy.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def lane_receive():
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(receive(), loop))
+
+        async def lane_send(message):
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(send(message), loop))
+
+        def finished(_):
+            try:
+                loop.call_soon_threadsafe(self.scheduler.release, class_name)
+            except RuntimeError:
+                # The main loop is already closed, nothing left to dispatch
+                pass
+
+        try:
+            future = executor.submit(lambda: _lane_loop().run_until_complete(self.app(scope, lane_receive, lane_send)))
+        except BaseException:
+            self.scheduler.release(class_name)
+            raise
+        future.add_done_callback(finished)
+        await asyncio.wrap_future(future)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        class_name, priority = self._classify(scope)
+        if not await self.scheduler.acquire(class_name, priority, self.queue_timeout):
+            logger.warning(f"Rejecting {scope['path']}: no {class_name} slot within {self.queue_timeout}s")
+            await self._reject(send)
+            return
+        request_class = self.scheduler.classes[class_name]
+        if request_class.offload:
+            # Released by the lane once the request is done there
+            await self._run_offloaded(class_name, request_class.executor, scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.scheduler.release(class_name)
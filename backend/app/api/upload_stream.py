@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MultipartStream:
+    """
+    Incremental multipart/form-data parser.
+
+    Unlike UploadFile, nothing is spooled: ``feed`` turns each received chunk
+    into events as soon as it arrives.
+
+    - ("field", name, value): a complete non-file field
+    - ("file", name, filename): start of a file part
+    - ("data", bytes): file contents, in arrival order
+    - ("file_end",): end of the file part
+    """
+
+    def __init__(self, content_type: str, max_field_size: int = 64 * 1024):
+        content_type, params = parse_options_header(content_type or "")
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+        self.max_field_size = max_field_size
+        self._events: List[Tuple] = []
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._name: Optional[str] = None
+        self._is_file = False
+        self._value = bytearray()
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+    def feed(self, chunk: bytes) -> List[Tuple]:
+        """Parse a chunk of the body and return the events it completed."""
+        self._parser.write(chunk)
+        events, self._events = self._events, []
+        return events
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("latin-1")
+        self._is_file = b"filename" in options
+        if self._is_file:
+            self._events.append(("file", self._name, options[b"filename"].decode("latin-1")))
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._is_file:
+            self._events.append(("data", bytes(data[start:end])))
+            return
+        self._value += data[start:end]
+        if len(self._value) > self.max_field_size:
+            raise HTTPException(status_code=413, detail=f"Form field `{self._name}` is too large")
+
+    def _on_part_end(self):
+        if self._is_file:
+            self._events.append(("file_end",))
+        else:
+            self._events.append(("field", self._name, self._value.decode("utf-8")))
+
+
+class CpuPipeline:
+    """
+    Run a CPU-bound consumer on a worker thread while the next data is received.
+
+    Data is coalesced into blocks of ``block_size`` bytes; at most one block is
+    being processed at a time, so blocks are consumed in order and memory stays
+    bounded to about two blocks.
+    """
+
+    def __init__(self, consume: Callable[[bytes], None], block_size: int = None):
+        self.consume = consume
+        self.block_size = block_size or settings.UPLOAD_STREAM_BLOCK_SIZE
+        self._buffer = bytearray()
+        self._pending: Optional[asyncio.Future] = None
+
+    async def feed(self, data: bytes):
+        self._buffer += data
+        if len(self._buffer) >= self.block_size:
+            await self._dispatch()
+
+    async def _dispatch(self):
+        block = bytes(self._buffer)
+        self._buffer.clear()
+        if self._pending is not None:
+            await self._pending
+        self._pending = asyncio.ensure_future(run_in_threadpool(self.consume, block))
+
+    async def finish(self):
+        """Process the remaining data and wait for the last block."""
+        if self._buffer:
+            await self._dispatch()
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            await pending
+
+    async def abort(self):
+        """Wait for an in-flight block after a failure, discarding its outcome."""
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            try:
+                await pending
+            except Exception:
+                pass
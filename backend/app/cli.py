@@ -0,0 +1,320 @@
+"""
+Command-line bulk encryption tool.
+
+Runs EncryptionService directly over files and directory trees, without the
+HTTP layer. Files are streamed through the chunked AES-GCM format, processed
+on a process pool, and recorded in a manifest so interrupted runs can resume.
+
+Files encrypted with --envelope or --public-key use the key-wrapped format: a
+random data key encrypts the payload and only that key is wrapped by the
+password or public key, so ``rewrap`` can change the credential without
+re-encrypting the payload.
+
+Usage:
+    python -m app.cli encrypt SRC DST --password-env SECURECRYPT_PASSWORD [--envelope]
+    python -m app.cli encrypt SRC DST --public-key recipient.pem
+    python -m app.cli decrypt SRC DST --password-env SECURECRYPT_PASSWORD
+    python -m app.cli decrypt SRC DST --private-key recipient.key
+    python -m app.cli rewrap SRC --password-env OLD_PASSWORD --new-password-env NEW_PASSWORD
+    python -m app.cli rewrap SRC --private-key old.key --new-public-key new.pem
+    python -m app.cli hash SRC [--algorithm blake3]
+"""
+import os
+import sys
+import json
+import time
+import getpass
+import hashlib
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import blake3
+
+from app.core.config import settings
+from app.services import key_envelope
+from app.services.encryption_service import EncryptionService
+
+logger = logging.getLogger(__name__)
+
+ENCRYPTED_SUFFIX = ".scf"
+# Output is written under this suffix and renamed into place once complete
+PARTIAL_SUFFIX = ".part"
+MANIFEST_NAME = ".securecrypt-manifest.jsonl"
+
+# One service per worker process, created lazily
+_service: Optional[EncryptionService] = None
+
+
+def _get_service() -> EncryptionService:
+    global _service
+    if _service is None:
+        _service = EncryptionService()
+    return _service
+
+
+def wants_file(name: str, operation: str) -> bool:
+    """
+    Whether a file found in a directory walk is input for the operation.
+
+    Output usually lands next to its source, so encrypt skips files that are
+    already encrypted, decrypt and rewrap take only encrypted files, and
+    nothing picks up the manifest or the partial output of an interrupted run.
+    """
+    if name == MANIFEST_NAME or name.endswith(PARTIAL_SUFFIX):
+        return False
+    if operation == "encrypt":
+        return not name.endswith(ENCRYPTED_SUFFIX)
+    if operation in ("decrypt", "rewrap"):
+        return name.endswith(ENCRYPTED_SUFFIX)
+    return True
+
+
+def iter_files(src: str, operation: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (absolute path, path relative to src) for every input file under src.
+
+    A single file given as src is always used; directory walks are filtered
+    by wants_file.
+    """
+    if os.path.isfile(src):
+        yield src, os.path.basename(src)
+        return
+    for root, dirs, files in os.walk(src):
+        dirs.sort()
+        for name in sorted(files):
+            if not wants_file(name, operation):
+                continue
+            path = os.path.join(root, name)
+            yield path, os.path.relpath(path, src)
+
+
+def output_path(rel: str, dst: str, operation: str) -> str:
+    """Destination path of a file for the given operation."""
+    if operation == "encrypt":
+        rel = rel + ENCRYPTED_SUFFIX
+    elif operation == "decrypt" and rel.endswith(ENCRYPTED_SUFFIX):
+        rel = rel[:-len(ENCRYPTED_SUFFIX)]
+    return os.path.join(dst, rel)
+
+
+def load_manifest(path: str) -> Dict[str, Dict]:
+    """Load completed entries from a manifest, keyed by relative path."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A torn last line from an interrupted run
+                continue
+            done[entry["path"]] = entry
+    return done
+
+
+def process_file(task: Dict) -> Dict:
+    """
+    Encrypt, decrypt, rewrap or hash a single file. Runs in a worker process.
+
+    Encrypted, decrypted and rewrapped output is written to a temporary file
+    and renamed into place only once complete; rewrapped files are synced to
+    disk first, since they replace the only copy of the payload.
+    """
+    service = _get_service()
+    operation, src = task["operation"], task["src"]
+    start = time.perf_counter()
+    result = {"path": task["rel"], "size": task["size"], "mtime": task["mtime"], "op": operation}
+
+    if operation == "hash":
+        hasher = blake3.blake3() if task["algorithm"] == "blake3" else hashlib.sha256()
+        with open(src, "rb") as f:
+            while True:
+                block = f.read(settings.STREAM_READ_SIZE)
+                if not block:
+                    break
+                hasher.update(block)
+        result["hash"] = hasher.hexdigest()
+    elif operation == "rewrap":
+        # Always rewrite through a temporary file: the source is the only copy
+        # of the payload, so it is replaced only once the new file is on disk
+        tmp = src + PARTIAL_SUFFIX
+        try:
+            with open(src, "rb") as fin, open(tmp, "wb") as fout:
+                prefix, old_length = service.rewrap(fin, task["key"], task["new_method"], task["new_key"])
+                fout.write(prefix)
+                fin.seek(old_length)
+                while True:
+                    block = fin.read(settings.STREAM_READ_SIZE)
+                    if not block:
+                        break
+                    fout.write(block)
+                fout.flush()
+                os.fsync(fout.fileno())
+            os.replace(tmp, src)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        # Record the rewritten file so a resumed run skips it
+        stat = os.stat(src)
+        result["size"], result["mtime"] = stat.st_size, stat.st_mtime
+    else:
+        dst = task["dst"]
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        tmp = dst + PARTIAL_SUFFIX
+        try:
+            with open(src, "rb") as fin, open(tmp, "wb") as fout:
+                if operation == "encrypt" and task["wrap_method"]:
+                    service.encrypt_wrapped_stream(fin, fout, task["wrap_method"], task["key"], task["chunk_size"])
+                elif operation == "encrypt":
+                    service.encrypt_stream(fin, fout, task["key"], task["key_size"], task["chunk_size"])
+                elif key_envelope.is_wrapped(fin.read(len(key_envelope.MAGIC))):
+                    fin.seek(0)
+                    service.decrypt_wrapped_stream(fin, fout, task["key"])
+                else:
+                    fin.seek(0)
+                    service.decrypt_stream(fin, fout, task["key"])
+            os.replace(tmp, dst)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def _format_rate(size: int, seconds: float) -> str:
+    return f"{size / max(seconds, 1e-9) / (1024 * 1024):.1f} MiB/s"
+
+
+def _read_password(env: Optional[str], prompt: str) -> str:
+    password = os.environ.get(env) if env else None
+    return password or getpass.getpass(prompt)
+
+
+def _read_key_file(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run a bulk job and return the process exit code."""
+    key = wrap_method = new_method = new_key = None
+    if args.operation == "encrypt" and args.public_key:
+        key = _read_key_file(args.public_key)
+        wrap_method = _get_service().wrap_method(key)
+    elif args.operation in ("decrypt", "rewrap") and args.private_key:
+        key = _read_key_file(args.private_key)
+    elif args.operation != "hash":
+        key = _read_password(args.password_env, "Password: ")
+        if args.operation == "encrypt" and args.envelope:
+            wrap_method = "password"
+    if args.operation == "rewrap":
+        if args.new_public_key:
+            new_key = _read_key_file(args.new_public_key)
+            new_method = _get_service().wrap_method(new_key)
+        else:
+            new_key = _read_password(args.new_password_env, "New password: ")
+            new_method = "password"
+
+    dst = args.dst or (args.src if os.path.isdir(args.src) else os.path.dirname(os.path.abspath(args.src)))
+    manifest_path = args.manifest or os.path.join(dst, MANIFEST_NAME)
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    done = load_manifest(manifest_path) if args.resume else {}
+
+    tasks: List[Dict] = []
+    skipped = 0
+    for path, rel in iter_files(args.src, args.operation):
+        stat = os.stat(path)
+        entry = done.get(rel)
+        if entry and entry["op"] == args.operation and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            skipped += 1
+            continue
+        tasks.append({
+            "operation": args.operation,
+            "src": path,
+            "rel": rel,
+            "dst": output_path(rel, dst, args.operation),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "key": key,
+            "wrap_method": wrap_method,
+            "new_method": new_method,
+            "new_key": new_key,
+            "key_size": args.key_size,
+            "chunk_size": args.chunk_size,
+            "algorithm": args.algorithm,
+        })
+
+    total_bytes = sum(t["size"] for t in tasks)
+    print(f"{len(tasks)} files ({total_bytes} bytes) to {args.operation}, {skipped} already done", file=sys.stderr)
+
+    failures = 0
+    processed_bytes = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor, \
+            open(manifest_path, "a", encoding="utf-8") as manifest:
+        futures = {executor.submit(process_file, task): task for task in tasks}
+        for count, future in enumerate(as_completed(futures), 1):
+            task = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[{count}/{len(tasks)}] FAILED {task['rel']}: {e}", file=sys.stderr)
+                continue
+            manifest.write(json.dumps(result) + "\n")
+            manifest.flush()
+            processed_bytes += task["size"]
+            elapsed = time.perf_counter() - start
+            if args.operation == "hash":
+                print(f"{result['hash']}  {task['rel']}")
+            print(
+                f"[{count}/{len(tasks)}] {task['rel']} {_format_rate(task['size'], result['seconds'])}"
+                f" | total {processed_bytes}/{total_bytes} bytes, {_format_rate(processed_bytes, elapsed)}",
+                file=sys.stderr,
+            )
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Done: {len(tasks) - failures} ok, {failures} failed, {skipped} skipped in {elapsed:.2f}s"
+        f" ({_format_rate(processed_bytes, elapsed)})",
+        file=sys.stderr,
+    )
+    return 1 if failures else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="SecureCrypt bulk file tool")
+    parser.add_argument("operation", choices=["encrypt", "decrypt", "rewrap", "hash"])
+    parser.add_argument("src", help="File or directory to process")
+    parser.add_argument("dst", nargs="?", help="Output directory (defaults to the source directory)")
+    parser.add_argument("--password-env", help="Environment variable holding the password (prompted otherwise)")
+    parser.add_argument("--envelope", action="store_true",
+                        help="Encrypt under a random data key wrapped by the password (allows rewrap)")
+    parser.add_argument("--public-key", help="Encrypt under a data key wrapped for this RSA/ECC public key file")
+    parser.add_argument("--private-key", help="Private key file for decrypt/rewrap of public-key wrapped files")
+    parser.add_argument("--new-password-env", help="Environment variable holding the new password for rewrap")
+    parser.add_argument("--new-public-key", help="Public key file to rewrap files for")
+    parser.add_argument("--key-size", type=int, default=256, choices=[128, 192, 256])
+    parser.add_argument("--chunk-size", type=int, default=settings.STREAM_CHUNK_SIZE,
+                        help="Plaintext bytes per encrypted chunk")
+    parser.add_argument("--algorithm", default="sha256", choices=["sha256", "blake3"], help="Hash algorithm")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--manifest", help=f"Manifest path (defaults to DST/{MANIFEST_NAME})")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Reprocess files already recorded in the manifest")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.getLogger().setLevel(logging.WARNING)
+    return run(build_parser().parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,5 @@
+from typing import Dict, List, Optional
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -23,6 +25,144 @@ class Settings(BaseSettings):
     # RSA Settings
     RSA_KEY_SIZE: int = 2048
     RSA_PUBLIC_EXPONENT: int = 65537
+
+    # ECIES Settings
+    ECIES_COMPACT_FORMAT: bool = True  # False keeps emitting the legacy PEM-prefixed format
+    ECIES_WRAP_WORKERS: int = 4
+    ECIES_PARALLEL_MIN_RECIPIENTS: int = 8  # Smaller recipient lists are wrapped inline
+
+    # AEAD Settings
+    AEAD_AUTO_ALGORITHM: Optional[str] = None  # Force the "aead-auto" choice instead of benchmarking
+    AEAD_BENCHMARK_BYTES: int = 1024 * 1024
+
+    # Chunked Stream Settings
+    STREAM_CHUNK_SIZE: int = 1024 * 1024
+    STREAM_MAX_CHUNK_SIZE: int = 16 * 1024 * 1024  # Larger chunk sizes in stream headers are rejected
+    STREAM_READ_SIZE: int = 4 * 1024 * 1024
+
+    # Key-Wrapped Stream Settings
+    KEY_WRAP_SLOT_SIZE: int = 640  # Reserved wrapped-key bytes; fits RSA-4096 so rewraps stay in place
+
+    # Logistic Tiled keystream threads for very large regions (defaults to the CPU count)
+    LOGISTIC_TILED_WORKERS: Optional[int] = None
+
+    # Parallel Cipher Settings (CTR, CBC decryption, ECB)
+    PARALLEL_CIPHER_WORKERS: Optional[int] = None  # Defaults to the CPU count
+    PARALLEL_CIPHER_MIN_SIZE: int = 4 * 1024 * 1024  # Smaller buffers are processed on one thread
+    PARALLEL_CIPHER_MIN_SEGMENT: int = 1024 * 1024
+
+    # Upload Admission Settings (per worker process)
+    UPLOAD_MAX_BODY_SIZE: int = 64 * 1024 * 1024
+    UPLOAD_ENDPOINT_LIMITS: Dict[str, int] = {
+        "/api/encrypt": 512 * 1024 * 1024,
+        "/api/hash": 4 * 1024 * 1024 * 1024,
+        "/api/image/frames/process": 256 * 1024 * 1024,
+        "/api/decrypt/range": 4 * 1024 * 1024 * 1024,
+        "/api/rewrap": 4 * 1024 * 1024 * 1024,
+        "/api/stream/encrypt": 4 * 1024 * 1024 * 1024,
+        "/api/stream/hash": 4 * 1024 * 1024 * 1024,
+    }
+    UPLOAD_STREAMED_ENDPOINTS: List[str] = [  # Read in chunks, never fully buffered
+        "/api/hash", "/api/decrypt/range", "/api/rewrap", "/api/stream/encrypt", "/api/stream/hash",
+    ]
+    UPLOAD_MEMORY_BUDGET: int = 1024 * 1024 * 1024  # Body bytes buffered at once
+    UPLOAD_ADMISSION_TIMEOUT: float = 2.0  # Seconds to wait for budget before answering 429
+    UPLOAD_RETRY_AFTER: int = 5
+    UPLOAD_SPOOL_SIZE: int = 1024 * 1024  # Uploaded files larger than this are spooled to disk
+    UPLOAD_STREAM_BLOCK_SIZE: int = 1024 * 1024  # Bytes handed to the cipher/hasher at once by /api/stream/*
+
+    # Request Scheduler Settings (per worker process)
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_MAX_CONCURRENCY: int = 32  # Requests running at once across all classes
+    SCHEDULER_CLASSES: Dict[str, Dict] = {
+        # weight: share of slots under contention; offload: run on a dedicated thread lane
+        "interactive": {"weight": 8, "concurrency": 32, "offload": False},
+        "standard": {"weight": 4, "concurrency": 16, "offload": True},
+        "heavy": {"weight": 1, "concurrency": 4, "offload": True},
+    }
+    SCHEDULER_ENDPOINT_CLASSES: Dict[str, str] = {
+        "/": "interactive",
+        "/api/hash": "interactive",
+        "/api/stream/hash": "interactive",
+        "/api/generate-ecc-keys": "interactive",
+        "/api/generate-rsa-keys": "heavy",
+        "/api/encrypt": "heavy",
+        "/api/image/auto-decrypt": "heavy",
+        "/api/image/animation/process": "heavy",
+        "/api/image/frames/process": "heavy",
+    }
+    SCHEDULER_DEFAULT_CLASS: str = "standard"
+    SCHEDULER_HEAVY_CLASS: str = "heavy"
+    SCHEDULER_HEAVY_BODY_SIZE: int = 8 * 1024 * 1024  # Larger bodies are scheduled as heavy
+    SCHEDULER_QUEUE_TIMEOUT: float = 30.0  # Seconds a request may wait for a slot before 503
+    SCHEDULER_RETRY_AFTER: int = 5
+
+    # Result Cache Settings (deterministic image operations)
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MEMORY_BYTES: int = 128 * 1024 * 1024
+    RESULT_CACHE_DISK_BYTES: int = 1024 * 1024 * 1024  # 0 disables the encrypted disk tier
+    RESULT_CACHE_DIR: Optional[str] = None  # Defaults to <tmp>/securecrypt-<uid>/results (mode 0700)
+    RESULT_CACHE_TTL: float = 300.0
+
+    # Derived Key Cache Settings (shared by all worker processes on the host)
+    KEY_CACHE_ENABLED: bool = True
+    KEY_CACHE_PATH: Optional[str] = None  # Defaults to <tmp>/securecrypt-<uid>/keycache.sqlite3 (mode 0700)
+    KEY_CACHE_TTL: float = 600.0
+    KEY_CACHE_MAX_ENTRIES: int = 10000
+
+    # Request Profiling Settings: requests carrying an X-Profile header equal to
+    # the admin token, plus a random PROFILE_SAMPLE_RATE fraction, are profiled
+    PROFILE_ADMIN_TOKEN: Optional[str] = None  # None disables the header and the /profiles endpoints
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_INTERVAL: float = 0.005  # Seconds between stack samples
+    PROFILE_MAX_ACTIVE: int = 2  # Concurrently profiled requests per worker
+    PROFILE_DIR: Optional[str] = None  # Defaults to <tmp>/securecrypt-profiles
+    PROFILE_MAX_FILES: int = 200
+
+    # Memory Accounting Settings (per request RSS by stage, sampled tracemalloc, leak detection)
+    MEMORY_ACCOUNTING_ENABLED: bool = True
+    MEMORY_TRACE_SAMPLE_RATE: float = 0.01  # Fraction of requests traced with tracemalloc
+    MEMORY_TRACE_FRAMES: int = 1
+    MEMORY_LOG_THRESHOLD: int = 256 * 1024 * 1024  # Log stages and requests growing RSS this much
+    MEMORY_LEAK_WINDOW: int = 200  # Requests per leak detection window
+    MEMORY_LEAK_MIN_GROWTH: int = 64 * 1024 * 1024
+    MEMORY_LEAK_MIN_CORRELATION: float = 0.9
+
+    # Response Settings
+    RESPONSE_CHUNK_SIZE: int = 192 * 1024  # Payload bytes serialized per streamed piece
+    RESPONSE_COMPRESSION_MIN_SIZE: int = 1024
+    RESPONSE_COMPRESSION_SAMPLE_SIZE: int = 64 * 1024
+    RESPONSE_COMPRESSION_MAX_RATIO: float = 0.9  # Compress only when the sample shrinks at least this much
+    RESPONSE_COMPRESSION_LEVEL: int = 3
+
+    # Encrypted Region Detection Settings
+    DETECT_PYRAMID_LEVELS: int = 2  # Coarse pass at 1/2**levels scale, 0 scans at full resolution
+    DETECT_CONTRAST_THRESHOLD: int = 50
+    DETECT_STD_THRESHOLD: float = 30.0
+    DETECT_MIN_AREA: int = 25
+    DETECT_REFINE_MARGIN: int = 8
+
+    # Auto-decrypt candidate verification (trial decryption before committing)
+    AUTO_DECRYPT_VERIFY: bool = True
+    AUTO_DECRYPT_SAMPLE_PIXELS: int = 64 * 1024  # Pixels trial-decrypted per candidate
+    AUTO_DECRYPT_MIN_CORRELATION_GAIN: float = 0.25
+    AUTO_DECRYPT_WORKERS: int = 4
+
+    # Most regions accepted in one request (JSON, string or packed form)
+    REGION_MAX_COUNT: int = 100_000
+
+    # Image Output Settings
+    IMAGE_OUTPUT_FORMAT: str = "png"
+    IMAGE_INTERMEDIATE_FORMAT: str = "png-fast"  # Encrypted results that will be decrypted again
+
+    # Image Session Settings (incremental editing)
+    IMAGE_SESSION_MAX_SESSIONS: int = 32
+    IMAGE_SESSION_MAX_BYTES: int = 512 * 1024 * 1024  # Decoded working arrays kept per worker
+    IMAGE_SESSION_TTL: float = 900.0  # Idle seconds before a session is dropped
+
+    # Animation Settings
+    ANIMATION_WORKERS: int = 4
+    ANIMATION_FRAME_WINDOW: int = 8  # Frames decoded or in flight at once
     
     class Config:
         case_sensitive = True
@@ -1,7 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.formparsers import MultiPartParser
 from app.api.routes import router as api_router
+from app.api.admission import AdmissionControlMiddleware
+from app.api.scheduler import SchedulerMiddleware
+from app.api.profiling import ProfilingMiddleware
+from app.api.memory import MemoryAccountingMiddleware
 from app.core.config import settings
+from app.services.encryption_service import preferred_aead
+
+# Uploaded files above this size go to a temporary file instead of RAM
+MultiPartParser.max_file_size = settings.UPLOAD_SPOOL_SIZE
 
 # Initialize FastAPI app with metadata
 app = FastAPI(
@@ -10,6 +19,25 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Per-request memory accounting; innermost so it runs on the same thread
+# and context as the route and the services it calls
+if settings.MEMORY_ACCOUNTING_ENABLED:
+    app.add_middleware(MemoryAccountingMiddleware)
+
+# Sampling profiler for requests selected by admin header or sample rate;
+# inside the scheduler, so queueing in the middlewares below is not profiled
+if settings.PROFILE_ADMIN_TOKEN or settings.PROFILE_SAMPLE_RATE:
+    app.add_middleware(ProfilingMiddleware)
+
+# Weighted-fair scheduling of cheap and expensive endpoint classes; inside
+# admission control so rejected uploads never take a slot
+if settings.SCHEDULER_ENABLED:
+    app.add_middleware(SchedulerMiddleware)
+
+# Bound upload sizes and buffered bytes per worker; added before CORS so
+# rejections still carry CORS headers
+app.add_middleware(AdmissionControlMiddleware)
+
 # Configure CORS middleware to allow cross-origin requests
 # Note: Replace '*' with specific origins in production for security
 app.add_middleware(
@@ -20,6 +48,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def select_aead():
+    """Run the AEAD micro-benchmark at startup rather than on the first request."""
+    preferred_aead()
+
 # Include API routes from the router
 app.include_router(api_router, prefix="/api")
 
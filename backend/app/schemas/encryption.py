@@ -1,6 +1,10 @@
 from pydantic import BaseModel, Field
 from typing import Optional, Literal
 from fastapi import UploadFile, File, Form
+
+# Output profiles for processed images (see app.services.image_codecs)
+ImageOutputFormat = Literal["png", "png-fast", "png-store", "webp-lossless", "tiff", "raw"]
+
 class EncryptionRequest(BaseModel):
     """
     Request object for encryption and decryption of files.
@@ -41,13 +45,18 @@ class ImageEncryptionRequest(BaseModel):
     Request object for encryption and decryption of images.
     """
     image_content: str = Field(..., description="Base64 encoded image content")
-    algorithm: Literal["AES-CTR", "ChaCha20", "RC4", "Logistic XOR"] = Field(..., description="Encryption algorithm to use")
+    algorithm: Literal["AES-CTR", "ChaCha20", "RC4", "Logistic XOR", "Logistic Tiled"] = Field(..., description="Encryption algorithm to use")
     key: str = Field(..., description="Hex encoded encryption key")
     nonce: Optional[str] = Field(None, description="Hex encoded nonce (for AES-CTR and ChaCha20)")
     operation: Literal["encrypt", "decrypt"] = Field(..., description="Operation to perform")
-    regions: list[dict] = Field(..., description="List of regions to process (x, y, width, height)")
+    regions: list[dict] = Field([], description="List of regions to process (x, y, width, height)")
+    regions_packed: Optional[str] = Field(None, description="Base64 packed regions (little-endian int32 left, top, width, height per region), used instead of `regions`")
+    merge_regions: bool = Field(False, description="Coalesce regions whose union is a rectangle before processing; use the same setting to decrypt")
     mode : Optional[str] = Field(None, description="Mode of operation for the encryption algorithm")
     iv : Optional[str] = Field(None, description="Initialization vector for the encryption algorithm")
+    manifest_mode: Optional[Literal["embed", "sidecar"]] = Field(None, description="Embed the region manifest in the PNG or return it as a sidecar blob")
+    output_format: Optional[ImageOutputFormat] = Field(None, description="Output encoding profile; defaults to a fast profile for encryption")
+    channels: Optional[list[int]] = Field(None, description="Channel indices to process; defaults to every channel except alpha")
 
 class ImageEncryptionResponse(BaseModel):
     """
@@ -55,12 +64,72 @@ class ImageEncryptionResponse(BaseModel):
     """
     processed_image: str = Field(..., description="Base64 encoded processed image")
     filename: str = Field(..., description="Name of the processed image file")
+    manifest: Optional[str] = Field(None, description="Region manifest sidecar blob, when requested")
+    mime_type: str = Field("image/png", description="MIME type of the processed image")
 
 class AutoDecryptImageRequest(BaseModel):
     """
     Request object for automatic decryption of images.
     """
     image_content: str = Field(..., description="Base64 encoded image content")
-    algorithm: Literal["AES-CTR", "ChaCha20", "RC4", "Logistic XOR"] = Field(..., description="Encryption algorithm to use")
+    algorithm: Literal["AES-CTR", "ChaCha20", "RC4", "Logistic XOR", "Logistic Tiled"] = Field(..., description="Encryption algorithm to use")
+    key: str = Field(..., description="Hex encoded encryption key")
+    nonce: Optional[str] = Field(None, description="Hex encoded nonce (for AES-CTR and ChaCha20)")
+    manifest: Optional[str] = Field(None, description="Region manifest sidecar blob returned at encryption time")
+    allow_unauthenticated_manifest: bool = Field(False, description="Use a region manifest without a MAC (its regions are not authenticated)")
+    output_format: Optional[ImageOutputFormat] = Field(None, description="Output encoding profile")
+
+class AnimationEncryptionRequest(BaseModel):
+    """
+    Request object for encryption and decryption of animated images (GIF/APNG).
+    """
+    image_content: str = Field(..., description="Base64 encoded animated image content")
+    algorithm: Literal["AES-CTR", "ChaCha20", "RC4", "Logistic XOR", "Logistic Tiled"] = Field(..., description="Encryption algorithm to use")
+    key: str = Field(..., description="Hex encoded encryption key")
+    nonce: Optional[str] = Field(None, description="Hex encoded nonce (for AES-CTR and ChaCha20)")
+    operation: Literal["encrypt", "decrypt"] = Field(..., description="Operation to perform")
+    regions: list[dict] = Field(..., description="List of regions processed in every frame (left, top, width, height)")
+    frame_regions: Optional[dict[int, list[dict]]] = Field(None, description="Per-frame region tracks keyed by frame index, overriding `regions`")
+
+class ImageSessionCreateRequest(BaseModel):
+    """
+    Request object for opening an incremental image editing session.
+    """
+    image_content: str = Field(..., description="Base64 encoded image content")
+    algorithm: Literal["AES-CTR", "ChaCha20", "RC4", "Logistic XOR", "Logistic Tiled"] = Field(..., description="Encryption algorithm to use")
     key: str = Field(..., description="Hex encoded encryption key")
     nonce: Optional[str] = Field(None, description="Hex encoded nonce (for AES-CTR and ChaCha20)")
+    operation: Literal["encrypt", "decrypt"] = Field(..., description="Operation to perform")
+    regions: list[dict] = Field([], description="Initial regions to process (left, top, width, height)")
+    output_format: Optional[ImageOutputFormat] = Field(None, description="Output encoding profile for the image and patches")
+    channels: Optional[list[int]] = Field(None, description="Channel indices to process; defaults to every channel except alpha")
+
+class ImageSessionUpdateRequest(BaseModel):
+    """
+    Request object for applying a region delta to an image editing session.
+    """
+    add: list[dict] = Field([], description="Regions to process")
+    remove: list[dict] = Field([], description="Previously processed regions to restore")
+    regions: Optional[list[dict]] = Field(None, description="Full region list; the delta is computed server-side and `add`/`remove` are ignored")
+    response_mode: Literal["full", "patches"] = Field("full", description="Return the full image or only the changed rectangles")
+
+class ImagePatch(BaseModel):
+    """
+    Changed rectangle of a session image.
+    """
+    left: int
+    top: int
+    width: int
+    height: int
+    image: str = Field(..., description="Base64 encoded pixels of the rectangle")
+
+class ImageSessionResponse(BaseModel):
+    """
+    Response object for image editing sessions.
+    """
+    session_id: str = Field(..., description="Session identifier")
+    processed_image: Optional[str] = Field(None, description="Base64 encoded full image, unless patches were requested")
+    patches: Optional[list[ImagePatch]] = Field(None, description="Changed rectangles, when patches were requested")
+    added: int = Field(0, description="Number of regions processed")
+    removed: int = Field(0, description="Number of regions restored")
+    mime_type: str = Field("image/png", description="MIME type of the image and patches")
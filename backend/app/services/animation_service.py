@@ -0,0 +1,163 @@
+import io
+import hashlib
+import binascii
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from app.core.config import settings
+from app.services import pixel_format
+from app.services.image_service import ImageEncryptionService
+
+logger = logging.getLogger(__name__)
+
+# Algorithms whose keystream can be positioned at an arbitrary byte offset
+SEEKABLE_ALGORITHMS = ("AES-CTR", "ChaCha20", "Logistic Tiled")
+
+
+def ordered_parallel_map(func: Callable, items: Iterable, workers: int, window: int) -> Iterator:
+    """
+    Apply ``func`` to ``items`` on a thread pool, yielding results in input order.
+
+    At most ``window`` items are in flight at once, so memory stays bounded
+    no matter how long the input iterator is.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class AnimationEncryptionService:
+    """
+    Service to encrypt and decrypt regions across animated images and frame sequences.
+
+    Frames are decoded lazily, processed on a worker pool and re-encoded in
+    order, so only a window of frames is held in memory. Each frame gets its
+    own keystream: seekable ciphers (AES-CTR, ChaCha20, Logistic Tiled) continue the keystream
+    at ``frame_index * frame_bytes``, while RC4 and Logistic XOR use a per-frame
+    key derived from the frame index. Frame 0 is processed exactly like a
+    still image.
+    """
+
+    def __init__(self, image_service: Optional[ImageEncryptionService] = None):
+        self.image_service = image_service or ImageEncryptionService()
+
+    def _frame_key_and_offset(self, key: bytes, algorithm: str, index: int,
+                              frame_bytes: int) -> Tuple[bytes, int]:
+        """Derive the key and keystream offset used for a given frame."""
+        if algorithm in SEEKABLE_ALGORITHMS:
+            return key, index * frame_bytes
+        if index == 0:
+            return key, 0
+        digest = hashlib.sha256(key + index.to_bytes(8, "big")).digest()
+        return digest[:len(key)], 0
+
+    def _process_frame(self, frame: Tuple[int, np.ndarray, Dict], regions: List[Dict],
+                       frame_regions: Optional[Dict[int, List[Dict]]], key: bytes,
+                       nonce: Optional[bytes], algorithm: str, operation: str) -> Tuple[int, np.ndarray, Dict]:
+        """Process every region of a single frame in place."""
+        index, array, info = frame
+        # Round the frame size up to whole ChaCha20 blocks so frame keystreams never overlap
+        frame_bytes = -(-array.nbytes // 64) * 64
+        frame_key, offset = self._frame_key_and_offset(key, algorithm, index, frame_bytes)
+        track = frame_regions.get(index, regions) if frame_regions else regions
+        for region in track:
+            self.image_service._apply_region(array, region, frame_key, nonce, algorithm, operation, offset)
+        return index, array, info
+
+    def iter_frames(self, image_data: bytes) -> Iterator[Tuple[int, np.ndarray, Dict]]:
+        """
+        Lazily decode the frames of a GIF, APNG or still image.
+
+        Frames are decoded in their native layout (see pixel_format.native_array),
+        so alpha is kept and, unless selected, left in the clear.
+
+        Yields tuples of (frame index, array, frame info such as duration).
+        """
+        img = Image.open(io.BytesIO(image_data))
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            info = {"duration": frame.info.get("duration", img.info.get("duration", 100))}
+            yield index, pixel_format.native_array(frame), info
+
+    def process_frames(self, frames: Iterable[Tuple[int, np.ndarray, Dict]], regions: List[Dict], key: str,
+                       nonce: Optional[str], algorithm: str, operation: str,
+                       frame_regions: Optional[Dict[int, List[Dict]]] = None) -> Iterator[Tuple[int, np.ndarray, Dict]]:
+        """
+        Process a stream of frames in parallel while preserving their order.
+
+        Parameters:
+        - frames: Iterable of (frame index, array, info) tuples
+        - regions: Regions applied to every frame
+        - key: Encryption key in hex format
+        - nonce: Optional nonce in hex format
+        - algorithm: Encryption algorithm to use
+        - operation: Either "encrypt" or "decrypt"
+        - frame_regions: Optional per-frame region tracks overriding ``regions``
+
+        Returns:
+        - Iterator over processed (frame index, array, info) tuples
+        """
+        key_bytes = binascii.unhexlify(key)
+        nonce_bytes = binascii.unhexlify(nonce) if nonce else None
+
+        def work(frame):
+            return self._process_frame(frame, regions, frame_regions, key_bytes, nonce_bytes, algorithm, operation)
+
+        return ordered_parallel_map(work, frames, settings.ANIMATION_WORKERS, settings.ANIMATION_FRAME_WINDOW)
+
+    def process_animation(self, image_data: bytes, regions: List[Dict], key: str, nonce: Optional[str],
+                          algorithm: str, operation: str,
+                          frame_regions: Optional[Dict[int, List[Dict]]] = None) -> bytes:
+        """
+        Process regions across all frames of an animated GIF or APNG.
+
+        The result is always written as a lossless APNG, since re-quantizing to a
+        GIF palette would destroy the ciphertext. Pillow's APNG writer needs all
+        frames up front, so processed frames are collected before encoding;
+        decoding and encryption stay bounded by the frame window. Use
+        ``process_frame_sequence`` for fully streaming output.
+
+        Returns:
+        - Processed animation as APNG bytes
+        """
+        processed = self.process_frames(self.iter_frames(image_data), regions, key, nonce,
+                                        algorithm, operation, frame_regions)
+        images = []
+        durations = []
+        for _, array, info in processed:
+            images.append(Image.fromarray(array))
+            durations.append(info["duration"])
+        if not images:
+            raise ValueError("Image contains no frames")
+
+        output = io.BytesIO()
+        images[0].save(output, format="PNG", save_all=True, append_images=images[1:], loop=0,
+                       duration=durations, default_image=False)
+        return output.getvalue()
+
+    def process_frame_sequence(self, frames: Iterable[bytes], regions: List[Dict], key: str,
+                               nonce: Optional[str], algorithm: str, operation: str,
+                               frame_regions: Optional[Dict[int, List[Dict]]] = None) -> Iterator[bytes]:
+        """
+        Process a sequence of individually encoded frames, yielding PNG frames in order.
+
+        Frames are only decoded when the worker window has room for them.
+        """
+        def decoded() -> Iterator[Tuple[int, np.ndarray, Dict]]:
+            for index, data in enumerate(frames):
+                yield index, pixel_format.native_array(Image.open(io.BytesIO(data))), {}
+
+        for _, array, _ in self.process_frames(decoded(), regions, key, nonce, algorithm,
+                                               operation, frame_regions):
+            output = io.BytesIO()
+            Image.fromarray(array).save(output, format="PNG")
+            yield output.getvalue()
@@ -0,0 +1,240 @@
+import os
+import struct
+from typing import BinaryIO, Dict, Iterator
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from app.core.config import settings
+
+# Chunked AES-GCM stream format
+#
+#   header:  magic(4) | version(1) | flags(1) | key size in bits(2) | chunk size(4) | salt(16) | nonce prefix(8)
+#   chunks:  AES-GCM(chunk) = ciphertext || tag(16), one per chunk_size bytes of plaintext
+#
+# Chunk i uses the nonce prefix || i (32-bit big endian) and authenticates the
+# header plus a final-chunk flag, so chunks cannot be reordered, dropped,
+# truncated or moved between files.
+MAGIC = b"SCCF"
+VERSION = 1
+HEADER = struct.Struct(">4sBBHI16s8s")
+TAG_LENGTH = 16
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNKS = 2 ** 32
+
+
+def build_header(key_size: int, chunk_size: int, salt: bytes, nonce_prefix: bytes, flags: int = 0) -> bytes:
+    """Serialize a stream header. Raises ValueError for chunk sizes readers would reject."""
+    if not 0 < chunk_size <= settings.STREAM_MAX_CHUNK_SIZE:
+        raise ValueError(f"Chunk size must be between 1 and {settings.STREAM_MAX_CHUNK_SIZE} bytes")
+    return HEADER.pack(MAGIC, VERSION, flags, key_size, chunk_size, salt, nonce_prefix)
+
+
+def parse_header(data: bytes) -> Dict:
+    """
+    Parse a stream header.
+
+    Raises ValueError when the data is not a chunked stream. The chunk size
+    comes from untrusted input and sets how much a decryptor buffers, so it
+    is capped at settings.STREAM_MAX_CHUNK_SIZE.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("Encrypted stream header is truncated")
+    magic, version, flags, key_size, chunk_size, salt, nonce_prefix = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a chunked encrypted stream")
+    if version != VERSION:
+        raise ValueError(f"Unsupported chunked stream version: {version}")
+    if key_size not in (128, 192, 256) or chunk_size <= 0:
+        raise ValueError("Corrupted chunked stream header")
+    if chunk_size > settings.STREAM_MAX_CHUNK_SIZE:
+        raise ValueError(f"Chunk size {chunk_size} exceeds the maximum of {settings.STREAM_MAX_CHUNK_SIZE} bytes")
+    return {
+        "flags": flags,
+        "key_size": key_size,
+        "chunk_size": chunk_size,
+        "salt": salt,
+        "nonce_prefix": nonce_prefix,
+        "header": bytes(data[:HEADER.size]),
+    }
+
+
+def is_chunked(data: bytes) -> bool:
+    """Whether the data starts with a chunked stream header."""
+    return data[:4] == MAGIC
+
+
+def _nonce(prefix: bytes, index: int) -> bytes:
+    if index >= MAX_CHUNKS:
+        raise ValueError("Stream exceeds the maximum number of chunks")
+    return prefix + index.to_bytes(4, "big")
+
+
+def _open_chunk(aead: AESGCM, header: bytes, prefix: bytes, index: int, sealed: bytes, final: bool) -> bytes:
+    aad = header + (b"\x01" if final else b"\x00")
+    try:
+        return aead.decrypt(_nonce(prefix, index), sealed, aad)
+    except Exception:
+        raise ValueError(f"Chunk {index} failed authentication")
+
+
+class ChunkedEncryptor:
+    """
+    Incremental encryptor producing the chunked stream format.
+
+    Feed plaintext with ``update`` and call ``finalize`` once; both return the
+    ciphertext bytes ready to be written. The header is returned by the first
+    ``update`` or ``finalize`` call.
+    """
+
+    def __init__(self, key: bytes, header: bytes):
+        info = parse_header(header)
+        self._aead = AESGCM(key)
+        self._header = info["header"]
+        self._prefix = info["nonce_prefix"]
+        self._chunk_size = info["chunk_size"]
+        self._buffer = bytearray()
+        self._index = 0
+        self._header_sent = False
+
+    def _seal(self, chunk: bytes, final: bool) -> bytes:
+        aad = self._header + (b"\x01" if final else b"\x00")
+        sealed = self._aead.encrypt(_nonce(self._prefix, self._index), chunk, aad)
+        self._index += 1
+        return sealed
+
+    def _take_header(self) -> bytes:
+        if self._header_sent:
+            return b""
+        self._header_sent = True
+        return self._header
+
+    def update(self, data: bytes) -> bytes:
+        """Encrypt as many whole chunks as possible, holding back the last one."""
+        self._buffer += data
+        out = [self._take_header()]
+        # Keep at least one chunk buffered: only finalize knows which chunk is last
+        while len(self._buffer) > self._chunk_size:
+            out.append(self._seal(bytes(self._buffer[:self._chunk_size]), final=False))
+            del self._buffer[:self._chunk_size]
+        return b"".join(out)
+
+    def finalize(self) -> bytes:
+        """Encrypt the remaining data as the final chunk."""
+        out = self._take_header() + self._seal(bytes(self._buffer), final=True)
+        self._buffer.clear()
+        return out
+
+
+class ChunkedDecryptor:
+    """
+    Incremental decryptor for the chunked stream format.
+
+    ``update`` accepts the stream from its first byte (header included).
+    Authentication failures, truncation and trailing data raise ValueError.
+    """
+
+    def __init__(self, derive_key):
+        """
+        :param derive_key: Callable taking the parsed header dict and returning the AES key.
+        """
+        self._derive_key = derive_key
+        self._aead = None
+        self._buffer = bytearray()
+        self._index = 0
+        self._done = False
+
+    def _open(self, sealed: bytes, final: bool) -> bytes:
+        chunk = _open_chunk(self._aead, self._header, self._prefix, self._index, sealed, final)
+        self._index += 1
+        return chunk
+
+    def update(self, data: bytes) -> bytes:
+        """Decrypt every complete chunk except the last one seen so far."""
+        if self._done:
+            raise ValueError("Data after the final chunk")
+        self._buffer += data
+        if self._aead is None:
+            if len(self._buffer) < HEADER.size:
+                return b""
+            info = parse_header(bytes(self._buffer[:HEADER.size]))
+            self._header = info["header"]
+            self._prefix = info["nonce_prefix"]
+            self._sealed_size = info["chunk_size"] + TAG_LENGTH
+            self._aead = AESGCM(self._derive_key(info))
+            del self._buffer[:HEADER.size]
+
+        out = []
+        while len(self._buffer) > self._sealed_size:
+            out.append(self._open(bytes(self._buffer[:self._sealed_size]), final=False))
+            del self._buffer[:self._sealed_size]
+        return b"".join(out)
+
+    def finalize(self) -> bytes:
+        """Decrypt and verify the final chunk."""
+        if self._aead is None:
+            raise ValueError("Encrypted stream header is truncated")
+        if len(self._buffer) < TAG_LENGTH:
+            raise ValueError("Encrypted stream is truncated")
+        out = self._open(bytes(self._buffer), final=True)
+        self._buffer.clear()
+        self._done = True
+        return out
+
+
+class ChunkedReader:
+    """
+    Random access to the plaintext of a chunked stream stored in a seekable file.
+
+    Every chunk but the last has the same sealed size, so the chunk covering
+    any plaintext offset follows from the header; the stream needs no separate
+    index. Only the chunks overlapping a requested range are read, decrypted
+    and authenticated. The final chunk is authenticated up front so that
+    ``size`` cannot be forged by truncating or extending the file.
+    """
+
+    def __init__(self, src: BinaryIO, derive_key):
+        """
+        :param src: Seekable file positioned anywhere; the stream must start at offset 0.
+        :param derive_key: Callable taking the parsed header dict and returning the AES key.
+        """
+        self._src = src
+        src.seek(0)
+        info = parse_header(src.read(HEADER.size))
+        self._header = info["header"]
+        self._prefix = info["nonce_prefix"]
+        self.chunk_size = info["chunk_size"]
+        self._sealed_size = self.chunk_size + TAG_LENGTH
+
+        src.seek(0, os.SEEK_END)
+        body = src.tell() - HEADER.size
+        self.chunk_count = max(1, -(-body // self._sealed_size))
+        last = body - (self.chunk_count - 1) * self._sealed_size
+        if last < TAG_LENGTH:
+            raise ValueError("Encrypted stream is truncated")
+        self.size = (self.chunk_count - 1) * self.chunk_size + last - TAG_LENGTH
+
+        self._aead = AESGCM(derive_key(info))
+        self._last = None
+        self._last = self._read_chunk(self.chunk_count - 1)
+
+    def _read_chunk(self, index: int) -> bytes:
+        final = index == self.chunk_count - 1
+        if final and self._last is not None:
+            return self._last
+        self._src.seek(HEADER.size + index * self._sealed_size)
+        sealed = self._src.read(self._sealed_size)
+        return _open_chunk(self._aead, self._header, self._prefix, index, sealed, final)
+
+    def read(self, start: int, end: int) -> Iterator[bytes]:
+        """
+        Yield the plaintext bytes in [start, end), one chunk at a time.
+
+        Raises ValueError for ranges outside the plaintext or chunks that fail
+        authentication.
+        """
+        if not 0 <= start <= end <= self.size:
+            raise ValueError(f"Range {start}-{end} is outside the {self.size} byte plaintext")
+        for index in range(start // self.chunk_size, -(-end // self.chunk_size)):
+            base = index * self.chunk_size
+            chunk = self._read_chunk(index)
+            yield chunk[max(start - base, 0):end - base]
@@ -0,0 +1,335 @@
+import os
+import struct
+import base64
+import hashlib
+import binascii
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, x25519
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from app.core.config import settings
+
+# Curve ids used by the binary ECIES formats. X25519 points are raw 32-byte keys.
+CURVES: Dict[int, Dict] = {
+    1: {"name": "secp256r1", "curve": ec.SECP256R1, "point_size": 33},
+    2: {"name": "secp256k1", "curve": ec.SECP256K1, "point_size": 33},
+    3: {"name": "x25519", "curve": None, "point_size": 32},
+}
+X25519_ID = 3
+CURVE_IDS = {info["name"]: curve_id for curve_id, info in CURVES.items()}
+
+# Compact single-recipient format
+#
+#   version(1) | curve id(1) | ephemeral point | nonce(12) | ciphertext + tag(16)
+#
+# Every field has a fixed size for its curve, so decoding is plain slicing. The
+# legacy format (PEM ephemeral key first) always starts with "-".
+COMPACT_VERSION = 0x01
+COMPACT_HEADER = struct.Struct(">BB")
+LEGACY_PREFIX = b"-----BEGIN"
+
+# Multi-recipient format
+#
+#   header:     version(1) | curve id(1) | recipient count(2) | ephemeral point | payload nonce(12)
+#   recipients: key id(8) | wrapped content key(32 + 16 tag), one per recipient
+#   payload:    AES-GCM(content key, payload nonce, plaintext, aad=header + recipients)
+#
+# A single ephemeral key is shared by all recipients; each wrapping key is
+# derived from the ECDH secret and both public points, so wraps are bound to
+# their recipient. Key ids (truncated SHA-256 of the recipient point) let a
+# recipient find its slot without trial decryption.
+MULTI_VERSION = 0x10
+MULTI_HEADER = struct.Struct(">BBH")
+KEY_ID_LENGTH = 8
+CONTENT_KEY_LENGTH = 32
+NONCE_LENGTH = 12
+TAG_LENGTH = 16
+WRAPPED_KEY_LENGTH = CONTENT_KEY_LENGTH + TAG_LENGTH
+MAX_RECIPIENTS = 0xFFFF
+# Wrapping keys are single-use, so a fixed nonce is safe
+_WRAP_NONCE = bytes(NONCE_LENGTH)
+
+
+def curve_id(curve_name: str) -> int:
+    """Curve id for a curve name. Raises ValueError for unsupported curves."""
+    try:
+        return CURVE_IDS[curve_name.lower()]
+    except (KeyError, AttributeError):
+        raise ValueError(f"Unsupported curve: {curve_name}")
+
+
+def _curve_info(cid: int) -> Dict:
+    info = CURVES.get(cid)
+    if info is None:
+        raise ValueError(f"Unknown curve id: {cid}")
+    return info
+
+
+def curve_name_of(key) -> str:
+    """Curve name of a private or public key object."""
+    if isinstance(key, (x25519.X25519PrivateKey, x25519.X25519PublicKey)):
+        return "x25519"
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        return key.curve.name
+    raise ValueError("Unsupported key type for ECIES")
+
+
+def encode_point(public_key) -> bytes:
+    """Compressed SEC1 encoding of a public key (raw bytes for X25519)."""
+    if isinstance(public_key, x25519.X25519PublicKey):
+        return public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return public_key.public_bytes(serialization.Encoding.X962, serialization.PublicFormat.CompressedPoint)
+
+
+def decode_point(cid: int, data: bytes):
+    """Load a public key from its compressed (or raw X25519) encoding."""
+    if cid == X25519_ID:
+        return x25519.X25519PublicKey.from_public_bytes(bytes(data))
+    return ec.EllipticCurvePublicKey.from_encoded_point(_curve_info(cid)["curve"](), bytes(data))
+
+
+def _raw_key_bytes(text: str) -> bytes:
+    """Decode a raw 32-byte key given as hex or Base64."""
+    text = text.strip()
+    try:
+        raw = binascii.unhexlify(text) if len(text) == 64 else base64.b64decode(text, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Raw keys must be 32 bytes, hex or Base64 encoded")
+    if len(raw) != 32:
+        raise ValueError("Raw keys must be 32 bytes, hex or Base64 encoded")
+    return raw
+
+
+def _supported(key):
+    """Return ``key`` if ECIES supports its type and curve; ValueError otherwise."""
+    if curve_name_of(key) not in CURVE_IDS:
+        raise ValueError(f"Unsupported curve for ECIES: {curve_name_of(key)}")
+    return key
+
+
+def load_public_key(text: str):
+    """
+    Load a recipient public key from PEM or, for X25519, raw hex/Base64.
+
+    Raw keys skip PEM parsing entirely; they cannot be told apart from other
+    32-byte keys (e.g. Ed25519), so only X25519 keys may be given raw. PEM
+    keys of other types or curves raise ValueError.
+    """
+    if text.lstrip().startswith("-----BEGIN"):
+        return _supported(serialization.load_pem_public_key(text.encode("utf-8")))
+    return x25519.X25519PublicKey.from_public_bytes(_raw_key_bytes(text))
+
+
+def load_private_key(text: str):
+    """Load a private key from PEM or, for X25519, raw hex/Base64."""
+    if text.lstrip().startswith("-----BEGIN"):
+        return _supported(serialization.load_pem_private_key(text.encode("utf-8"), password=None))
+    return x25519.X25519PrivateKey.from_private_bytes(_raw_key_bytes(text))
+
+
+def key_id(point: bytes) -> bytes:
+    """Short identifier of a recipient public point."""
+    return hashlib.sha256(point).digest()[:KEY_ID_LENGTH]
+
+
+def generate_ephemeral(cid: int):
+    """Generate an ephemeral private key on the given curve."""
+    if cid == X25519_ID:
+        return x25519.X25519PrivateKey.generate()
+    return ec.generate_private_key(_curve_info(cid)["curve"]())
+
+
+def exchange(private_key, public_key) -> bytes:
+    """Raw ECDH (or X25519) shared secret."""
+    if isinstance(private_key, x25519.X25519PrivateKey):
+        shared = private_key.exchange(public_key)
+        if shared == bytes(32):
+            # Low-order peer point
+            raise ValueError("Invalid X25519 public key")
+        return shared
+    return private_key.exchange(ec.ECDH(), public_key)
+
+
+def _wrapping_key(shared: bytes, ephemeral_point: bytes, recipient_point: bytes) -> bytes:
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"securecrypt-ecies-wrap" + ephemeral_point + recipient_point,
+    ).derive(shared)
+
+
+def _message_key(shared: bytes, ephemeral_point: bytes) -> bytes:
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"securecrypt-ecies-v1" + ephemeral_point,
+    ).derive(shared)
+
+
+def check_curve(public_key, cid: int):
+    """Raise ValueError unless the public key is on the curve with the given id."""
+    if curve_name_of(public_key) != _curve_info(cid)["name"]:
+        raise ValueError(f"Recipient key is not on {_curve_info(cid)['name']}")
+
+
+def encrypt_compact(plaintext: bytes, public_key, cid: int) -> bytes:
+    """
+    Encrypt for a single recipient in the compact format.
+
+    :param plaintext: The data to encrypt.
+    :param public_key: Recipient public key object on the given curve.
+    :param cid: Curve id.
+    :return: The compact message.
+    """
+    check_curve(public_key, cid)
+    ephemeral = generate_ephemeral(cid)
+    ephemeral_point = encode_point(ephemeral.public_key())
+    header = COMPACT_HEADER.pack(COMPACT_VERSION, cid) + ephemeral_point
+    nonce = os.urandom(NONCE_LENGTH)
+    key = _message_key(exchange(ephemeral, public_key), ephemeral_point)
+    return header + nonce + AESGCM(key).encrypt(nonce, plaintext, header)
+
+
+def is_compact(data: bytes) -> bool:
+    """Whether the data is a compact single-recipient message."""
+    return len(data) > 0 and data[0] == COMPACT_VERSION
+
+
+def is_legacy(data: bytes) -> bool:
+    """Whether the data is a legacy message with an embedded PEM ephemeral key."""
+    return data[:len(LEGACY_PREFIX)] == LEGACY_PREFIX
+
+
+def decrypt_compact(data: bytes, private_key) -> bytes:
+    """
+    Decrypt a compact single-recipient message.
+
+    Raises ValueError for malformed messages, curve mismatches and
+    authentication failures.
+    """
+    if len(data) < COMPACT_HEADER.size:
+        raise ValueError("Encrypted data is too short")
+    version, cid = COMPACT_HEADER.unpack_from(data)
+    if version != COMPACT_VERSION:
+        raise ValueError(f"Unsupported ECIES version: {version}")
+    point_size = _curve_info(cid)["point_size"]
+    header_size = COMPACT_HEADER.size + point_size
+    if len(data) < header_size + NONCE_LENGTH + TAG_LENGTH:
+        raise ValueError("Encrypted data is too short")
+    if curve_name_of(private_key) != _curve_info(cid)["name"]:
+        raise ValueError(f"Message was encrypted for {_curve_info(cid)['name']}, not {curve_name_of(private_key)}")
+
+    header = data[:header_size]
+    ephemeral_point = bytes(data[COMPACT_HEADER.size:header_size])
+    nonce = data[header_size:header_size + NONCE_LENGTH]
+    key = _message_key(exchange(private_key, decode_point(cid, ephemeral_point)), ephemeral_point)
+    try:
+        return AESGCM(key).decrypt(nonce, data[header_size + NONCE_LENGTH:], header)
+    except Exception:
+        raise ValueError("Decryption failed: wrong key or corrupted data")
+
+
+def encrypt_multi(plaintext: bytes, recipients: Sequence, cid: int, workers: int = None) -> bytes:
+    """
+    Encrypt a payload once for many recipients.
+
+    :param plaintext: The data to encrypt.
+    :param recipients: Recipient public key objects, all on the given curve.
+    :param cid: Curve id.
+    :param workers: Threads used to wrap the content key (defaults to settings.ECIES_WRAP_WORKERS).
+    :return: The multi-recipient message.
+    """
+    if not recipients:
+        raise ValueError("At least one recipient is required")
+    if len(recipients) > MAX_RECIPIENTS:
+        raise ValueError(f"Too many recipients (max {MAX_RECIPIENTS})")
+    for public_key in recipients:
+        check_curve(public_key, cid)
+
+    content_key = AESGCM.generate_key(bit_length=256)
+    ephemeral = generate_ephemeral(cid)
+    ephemeral_point = encode_point(ephemeral.public_key())
+    payload_nonce = os.urandom(NONCE_LENGTH)
+
+    def wrap(public_key) -> bytes:
+        point = encode_point(public_key)
+        kek = _wrapping_key(exchange(ephemeral, public_key), ephemeral_point, point)
+        return key_id(point) + AESGCM(kek).encrypt(_WRAP_NONCE, content_key, None)
+
+    workers = workers or settings.ECIES_WRAP_WORKERS
+    if workers > 1 and len(recipients) >= settings.ECIES_PARALLEL_MIN_RECIPIENTS:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            slots = list(executor.map(wrap, recipients))
+    else:
+        slots = [wrap(public_key) for public_key in recipients]
+
+    header = MULTI_HEADER.pack(MULTI_VERSION, cid, len(recipients)) + ephemeral_point + payload_nonce
+    header += b"".join(slots)
+    return header + AESGCM(content_key).encrypt(payload_nonce, plaintext, header)
+
+
+def is_multi(data: bytes) -> bool:
+    """Whether the data is a multi-recipient message."""
+    return len(data) > 0 and data[0] == MULTI_VERSION
+
+
+def recipient_ids(data: bytes) -> List[bytes]:
+    """Key ids of the recipients of a multi-recipient message."""
+    _, cid, count = MULTI_HEADER.unpack_from(data)
+    start = MULTI_HEADER.size + _curve_info(cid)["point_size"] + NONCE_LENGTH
+    slot = KEY_ID_LENGTH + WRAPPED_KEY_LENGTH
+    return [data[start + i * slot:start + i * slot + KEY_ID_LENGTH] for i in range(count)]
+
+
+def decrypt_multi(data: bytes, private_key) -> bytes:
+    """
+    Decrypt a multi-recipient message with one recipient's private key.
+
+    Raises ValueError when the key is not a recipient or authentication fails.
+    """
+    if len(data) < MULTI_HEADER.size:
+        raise ValueError("Encrypted data is too short")
+    version, cid, count = MULTI_HEADER.unpack_from(data)
+    if version != MULTI_VERSION:
+        raise ValueError(f"Unsupported multi-recipient version: {version}")
+    point_size = _curve_info(cid)["point_size"]
+    offset = MULTI_HEADER.size
+    ephemeral_point = data[offset:offset + point_size]
+    offset += point_size
+    payload_nonce = data[offset:offset + NONCE_LENGTH]
+    offset += NONCE_LENGTH
+    slot = KEY_ID_LENGTH + WRAPPED_KEY_LENGTH
+    payload_start = offset + count * slot
+    if len(data) < payload_start + TAG_LENGTH:
+        raise ValueError("Encrypted data is too short")
+
+    own_point = encode_point(private_key.public_key())
+    own_id = key_id(own_point)
+    ephemeral = decode_point(cid, ephemeral_point)
+    kek = _wrapping_key(exchange(private_key, ephemeral), bytes(ephemeral_point), own_point)
+
+    content_key = None
+    for i in range(count):
+        start = offset + i * slot
+        if data[start:start + KEY_ID_LENGTH] != own_id:
+            continue
+        try:
+            content_key = AESGCM(kek).decrypt(_WRAP_NONCE, data[start + KEY_ID_LENGTH:start + slot], None)
+            break
+        except Exception:
+            # Key id collision with another recipient; keep looking
+            continue
+    if content_key is None:
+        raise ValueError("Private key is not a recipient of this message")
+
+    header = data[:payload_start]
+    try:
+        return AESGCM(content_key).decrypt(payload_nonce, data[payload_start:], header)
+    except Exception:
+        raise ValueError("Decryption failed: message was modified")
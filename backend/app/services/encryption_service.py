@@ -1,18 +1,116 @@
 import os
+import time
+import struct
 import base64
 import logging
 import binascii
+from cryptography.exceptions import UnsupportedAlgorithm
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, AESGCMSIV, ChaCha20Poly1305
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives.asymmetric import rsa, ec, x25519, padding
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.padding import PKCS7
+from io import BytesIO
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.chunked_format import ChunkedEncryptor, ChunkedDecryptor, ChunkedReader, build_header
+from app.services import ecies, key_cache, key_envelope, parallel_cipher
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# AEAD file formats. Explicit algorithms produce salt(16) | nonce(12) | ciphertext+tag;
+# "aead-auto" prefixes that with the id of the AEAD that was picked.
+AEAD_IDS = {"aes-gcm": 1, "chacha20-poly1305": 2, "aes-gcm-siv": 3}
+AEAD_KEY_SIZES = {"aes-gcm": (128, 192, 256), "chacha20-poly1305": (256,), "aes-gcm-siv": (128, 256)}
+AEAD_NONCE_LENGTH = 12
+
+_preferred_aead: Optional[str] = None
+_available_aeads: Optional[List[str]] = None
+
+
+def available_aeads() -> List[str]:
+    """
+    AEADs the linked OpenSSL supports.
+
+    AES-GCM-SIV needs OpenSSL 3.2 or newer and is missing from some builds;
+    the others are always available.
+    """
+    global _available_aeads
+    if _available_aeads is None:
+        available = []
+        for name in AEAD_IDS:
+            try:
+                _aead(name, bytes(32))
+            except ValueError as e:
+                logger.warning(str(e))
+                continue
+            available.append(name)
+        _available_aeads = available
+    return _available_aeads
+
+
+def benchmark_aeads(sample_size: int = None, rounds: int = 3) -> Dict[str, float]:
+    """
+    Measure the encryption throughput of each AEAD on this host.
+
+    :param sample_size: Bytes encrypted per round (defaults to settings.AEAD_BENCHMARK_BYTES).
+    :param rounds: Rounds per algorithm; the best one is kept.
+    :return: Throughput in MiB/s per available algorithm.
+    """
+    sample = os.urandom(sample_size or settings.AEAD_BENCHMARK_BYTES)
+    nonce = bytes(AEAD_NONCE_LENGTH)
+    results = {}
+    for name in available_aeads():
+        aead = _aead(name, os.urandom(32))
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            aead.encrypt(nonce, sample, None)
+            best = min(best, time.perf_counter() - start)
+        results[name] = len(sample) / max(best, 1e-9) / (1024 * 1024)
+    return results
+
+
+def preferred_aead() -> str:
+    """
+    AEAD used by "aead-auto": settings.AEAD_AUTO_ALGORITHM if set, otherwise the
+    fastest available one in a micro-benchmark run once per process (e.g.
+    AES-GCM with AES-NI, ChaCha20-Poly1305 on CPUs without AES instructions).
+    """
+    global _preferred_aead
+    if _preferred_aead is None:
+        if settings.AEAD_AUTO_ALGORITHM:
+            if settings.AEAD_AUTO_ALGORITHM not in available_aeads():
+                raise ValueError(f"Unsupported AEAD: {settings.AEAD_AUTO_ALGORITHM}")
+            _preferred_aead = settings.AEAD_AUTO_ALGORITHM
+        else:
+            results = benchmark_aeads()
+            _preferred_aead = max(results, key=results.get)
+            logger.info(
+                "AEAD benchmark: " + ", ".join(f"{k} {v:.0f} MiB/s" for k, v in results.items())
+                + f"; using {_preferred_aead}"
+            )
+    return _preferred_aead
+
+
+def _aead(algorithm: str, key: bytes):
+    """Create the AEAD primitive for an algorithm name; ValueError if it is unknown or unavailable."""
+    try:
+        if algorithm == "aes-gcm":
+            return AESGCM(key)
+        if algorithm == "chacha20-poly1305":
+            return ChaCha20Poly1305(key)
+        if algorithm == "aes-gcm-siv":
+            return AESGCMSIV(key)
+    except UnsupportedAlgorithm:
+        raise ValueError(f"{algorithm} is not supported by this host's OpenSSL build")
+    raise ValueError(f"Unsupported AEAD: {algorithm}")
+
+
 class EncryptionService:
     """Service for encrypting and decrypting data using various algorithms."""
 
@@ -20,14 +118,20 @@ class EncryptionService:
         pass
 
     def _derive_key(self, password: str, salt: bytes, key_size: int) -> bytes:
-        """Derive a key from a password using PBKDF2."""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=key_size // 8,
-            salt=salt,
-            iterations=100_000,
+        """Derive a key from a password using PBKDF2, shared across workers through the key cache."""
+        def derive() -> bytes:
+            kdf = PBKDF2HMAC(
+                algorithm=hashes.SHA256(),
+                length=key_size // 8,
+                salt=salt,
+                iterations=100_000,
+            )
+            return kdf.derive(password.encode("utf-8"))
+
+        # Same KDF and parameters as ImageEncryptionService, so entries are interchangeable
+        return key_cache.cached_key(
+            "pbkdf2-sha256:100000", [password.encode("utf-8"), salt, struct.pack(">I", key_size // 8)], derive
         )
-        return kdf.derive(password.encode("utf-8"))
 
     def _pad_data(self, data: bytes, block_size: int = 16) -> bytes:
         """Apply PKCS7 padding to the data."""
@@ -65,23 +169,19 @@ class EncryptionService:
             elif mode in ["cbc", "ctr"]:
                 iv_bytes = self._get_iv(iv, 16)
                 if mode == "cbc":
-                    # Add PKCS7 padding for CBC mode
+                    # Add PKCS7 padding for CBC mode; CBC encryption is inherently sequential
                     padded_data = self._pad_data(plaintext)
                     cipher = Cipher(algorithms.AES(key), modes.CBC(iv_bytes))
-                else:  # ctr
-                    cipher = Cipher(algorithms.AES(key), modes.CTR(iv_bytes))
-                    padded_data = plaintext  # CTR mode doesn't need padding
-
-                encryptor = cipher.encryptor()
-                ciphertext = encryptor.update(padded_data) + encryptor.finalize()
+                    encryptor = cipher.encryptor()
+                    ciphertext = encryptor.update(padded_data) + encryptor.finalize()
+                else:  # ctr, no padding needed
+                    ciphertext = parallel_cipher.ctr_xcrypt(algorithms.AES(key), iv_bytes, plaintext)
                 return salt + iv_bytes + ciphertext
 
             elif mode == "ecb":
                 # Add PKCS7 padding for ECB mode
                 padded_data = self._pad_data(plaintext)
-                cipher = Cipher(algorithms.AES(key), modes.ECB())
-                encryptor = cipher.encryptor()
-                ciphertext = encryptor.update(padded_data) + encryptor.finalize()
+                ciphertext = parallel_cipher.ecb_crypt(algorithms.AES(key), padded_data, encrypt=True)
                 return salt + ciphertext
 
             else:
@@ -135,14 +235,10 @@ class EncryptionService:
                 
                 key = self._derive_key(password, salt, key_size)
                 if mode == "cbc":
-                    cipher = Cipher(algorithms.AES(key), modes.CBC(iv))
-                    decryptor = cipher.decryptor()
-                    padded_data = decryptor.update(ciphertext) + decryptor.finalize()
+                    padded_data = parallel_cipher.cbc_decrypt(algorithms.AES(key), iv, ciphertext)
                     return self._unpad_data(padded_data)
                 else:  # ctr
-                    cipher = Cipher(algorithms.AES(key), modes.CTR(iv))
-                    decryptor = cipher.decryptor()
-                    return decryptor.update(ciphertext) + decryptor.finalize()
+                    return bytes(parallel_cipher.ctr_xcrypt(algorithms.AES(key), iv, ciphertext))
 
             elif mode == "ecb":
                 if len(encrypted_data) < 16:  # 16 (salt)
@@ -151,9 +247,7 @@ class EncryptionService:
                 ciphertext = encrypted_data[16:]
                 
                 key = self._derive_key(password, salt, key_size)
-                cipher = Cipher(algorithms.AES(key), modes.ECB())
-                decryptor = cipher.decryptor()
-                padded_data = decryptor.update(ciphertext) + decryptor.finalize()
+                padded_data = parallel_cipher.ecb_crypt(algorithms.AES(key), ciphertext, encrypt=False)
                 return self._unpad_data(padded_data)
 
             else:
@@ -163,50 +257,363 @@ class EncryptionService:
             logger.error(f"AES decryption error: {str(e)}")
             raise ValueError(f"Decryption failed: {str(e)}")
 
+    # ===== AEAD (ChaCha20-Poly1305, AES-GCM-SIV, auto) =====
+    def aead_encrypt(self, plaintext: bytes, password: str, algorithm: str, key_size: int = 256,
+                     nonce: str = None) -> bytes:
+        """
+        Encrypt data with an AEAD.
+
+        :param plaintext: The data to encrypt.
+        :param password: Password for key derivation.
+        :param algorithm: 'aes-gcm', 'chacha20-poly1305' or 'aes-gcm-siv'.
+        :param key_size: Size of the key in bits (ChaCha20-Poly1305 only supports 256).
+        :param nonce: Optional hex nonce (12 bytes); generated when omitted.
+        :return: salt + nonce + ciphertext (tag included).
+        """
+        if algorithm not in AEAD_IDS:
+            raise ValueError(f"Unsupported AEAD: {algorithm}")
+        if key_size not in AEAD_KEY_SIZES[algorithm]:
+            raise ValueError(f"Unsupported key size for {algorithm}: {key_size}")
+        salt = os.urandom(16)
+        nonce_bytes = self._get_iv(nonce, AEAD_NONCE_LENGTH)
+        key = self._derive_key(password, salt, key_size)
+        return salt + nonce_bytes + _aead(algorithm, key).encrypt(nonce_bytes, plaintext, None)
+
+    def aead_decrypt(self, encrypted_data: bytes, password: str, algorithm: str, key_size: int = 256) -> bytes:
+        """
+        Decrypt data produced by aead_encrypt.
+
+        :param encrypted_data: salt + nonce + ciphertext (tag included).
+        :param password: Password for key derivation.
+        :param algorithm: 'aes-gcm', 'chacha20-poly1305' or 'aes-gcm-siv'.
+        :param key_size: Size of the key in bits.
+        :return: Decrypted plaintext.
+        """
+        if algorithm not in AEAD_IDS:
+            raise ValueError(f"Unsupported AEAD: {algorithm}")
+        if len(encrypted_data) < 16 + AEAD_NONCE_LENGTH + 16:
+            raise ValueError("Encrypted data is too short")
+        salt = encrypted_data[:16]
+        nonce = encrypted_data[16:16 + AEAD_NONCE_LENGTH]
+        key = self._derive_key(password, salt, key_size)
+        aead = _aead(algorithm, key)
+        try:
+            return aead.decrypt(nonce, encrypted_data[16 + AEAD_NONCE_LENGTH:], None)
+        except Exception:
+            raise ValueError("Decryption failed: authentication tag mismatch (wrong password or corrupted data)")
+
+    def aead_auto_encrypt(self, plaintext: bytes, password: str) -> bytes:
+        """
+        Encrypt data with the fastest AEAD for this host and a 256-bit key.
+
+        :return: AEAD id (1 byte) + salt + nonce + ciphertext (tag included).
+        """
+        algorithm = preferred_aead()
+        return bytes([AEAD_IDS[algorithm]]) + self.aead_encrypt(plaintext, password, algorithm, 256)
+
+    def aead_auto_decrypt(self, encrypted_data: bytes, password: str) -> bytes:
+        """
+        Decrypt data produced by aead_auto_encrypt, whichever AEAD was picked.
+        """
+        if not encrypted_data:
+            raise ValueError("Encrypted data is too short")
+        names = {v: k for k, v in AEAD_IDS.items()}
+        algorithm = names.get(encrypted_data[0])
+        if algorithm is None:
+            raise ValueError(f"Unknown AEAD id: {encrypted_data[0]}")
+        return self.aead_decrypt(encrypted_data[1:], password, algorithm, 256)
+
+    # ===== Chunked streams (AES-GCM) =====
+    def chunked_encryptor(self, password: str, key_size: int, chunk_size: Optional[int] = None) -> ChunkedEncryptor:
+        """
+        Create an incremental encryptor for the chunked stream format.
+
+        :param password: Password for key derivation.
+        :param key_size: Size of the key in bits.
+        :param chunk_size: Plaintext bytes per chunk (defaults to settings.STREAM_CHUNK_SIZE).
+        :return: A ChunkedEncryptor whose output starts with the stream header.
+        """
+        if key_size not in (128, 192, 256):
+            raise ValueError(f"Unsupported key size: {key_size}")
+        salt = os.urandom(16)
+        header = build_header(key_size, chunk_size or settings.STREAM_CHUNK_SIZE, salt, os.urandom(8))
+        return ChunkedEncryptor(self._derive_key(password, salt, key_size), header)
+
+    def chunked_decryptor(self, password: str) -> ChunkedDecryptor:
+        """
+        Create an incremental decryptor for the chunked stream format.
+
+        The key size and salt are read from the stream header.
+
+        :param password: Password for key derivation.
+        :return: A ChunkedDecryptor.
+        """
+        return ChunkedDecryptor(lambda info: self._derive_key(password, info["salt"], info["key_size"]))
+
+    def chunked_reader(self, src: BinaryIO, password: str) -> ChunkedReader:
+        """
+        Open a stored chunked stream for random-access decryption.
+
+        :param src: Seekable file holding the whole stream.
+        :param password: Password for key derivation.
+        :return: A ChunkedReader; its final chunk has already been authenticated.
+        """
+        return ChunkedReader(src, lambda info: self._derive_key(password, info["salt"], info["key_size"]))
+
+    def encrypt_stream(self, src: BinaryIO, dst: BinaryIO, password: str, key_size: int,
+                       chunk_size: Optional[int] = None) -> int:
+        """
+        Encrypt a file-like object into the chunked stream format without loading it in memory.
+
+        :return: Number of plaintext bytes read.
+        """
+        encryptor = self.chunked_encryptor(password, key_size, chunk_size)
+        total = 0
+        while True:
+            block = src.read(settings.STREAM_READ_SIZE)
+            if not block:
+                break
+            total += len(block)
+            dst.write(encryptor.update(block))
+        dst.write(encryptor.finalize())
+        return total
+
+    def decrypt_stream(self, src: BinaryIO, dst: BinaryIO, password: str) -> int:
+        """
+        Decrypt a chunked stream from a file-like object without loading it in memory.
+
+        Output is written chunk by chunk after each chunk is authenticated; on
+        failure a ValueError is raised and the partial output must be discarded.
+
+        :return: Number of plaintext bytes written.
+        """
+        decryptor = self.chunked_decryptor(password)
+        total = 0
+        while True:
+            block = src.read(settings.STREAM_READ_SIZE)
+            if not block:
+                break
+            plain = decryptor.update(block)
+            total += len(plain)
+            dst.write(plain)
+        plain = decryptor.finalize()
+        dst.write(plain)
+        return total + len(plain)
+
+    # ===== Key-wrapped streams (random data key wrapped by password, RSA or ECC) =====
+    def wrap_method(self, key: str) -> str:
+        """
+        Infer the wrap method ("rsa" or "ecc") of a public or private key.
+
+        :param key: PEM key, or raw hex/Base64 X25519 key.
+        :return: The wrap method name.
+        """
+        if "-----BEGIN" in key:
+            data = key.encode("utf-8")
+            try:
+                obj = serialization.load_pem_public_key(data)
+            except ValueError:
+                obj = serialization.load_pem_private_key(data, password=None)
+            if isinstance(obj, (rsa.RSAPublicKey, rsa.RSAPrivateKey)):
+                return "rsa"
+        return "ecc"
+
+    def _wrap_data_key(self, data_key: bytes, method: str, key: str) -> bytes:
+        if method == "password":
+            salt, nonce = os.urandom(16), os.urandom(AEAD_NONCE_LENGTH)
+            kek = self._derive_key(key, salt, 256)
+            return salt + nonce + AESGCM(kek).encrypt(nonce, data_key, key_envelope.MAGIC)
+        if method == "rsa":
+            return self.rsa_encrypt(data_key, key)
+        if method == "ecc":
+            public_key = ecies.load_public_key(key)
+            return ecies.encrypt_compact(data_key, public_key, ecies.curve_id(ecies.curve_name_of(public_key)))
+        raise ValueError(f"Unsupported wrap method: {method}")
+
+    def _unwrap_data_key(self, method: str, wrapped: bytes, key: str) -> bytes:
+        if method == "password":
+            salt, nonce = wrapped[:16], wrapped[16:16 + AEAD_NONCE_LENGTH]
+            kek = self._derive_key(key, salt, 256)
+            try:
+                return AESGCM(kek).decrypt(nonce, wrapped[16 + AEAD_NONCE_LENGTH:], key_envelope.MAGIC)
+            except Exception:
+                raise ValueError("Wrong password or corrupted key slot")
+        if method == "rsa":
+            return self.rsa_decrypt(wrapped, key)
+        return ecies.decrypt_compact(wrapped, ecies.load_private_key(key))
+
+    def _wrapped_prefix(self, data_key: bytes, method: str, key: str) -> bytes:
+        wrapped = self._wrap_data_key(data_key, method, key)
+        return key_envelope.build_prefix(method, wrapped, settings.KEY_WRAP_SLOT_SIZE)
+
+    def encrypt_wrapped_stream(self, src: BinaryIO, dst: BinaryIO, method: str, key: str,
+                               chunk_size: Optional[int] = None) -> int:
+        """
+        Encrypt a stream under a random data key wrapped with a password or public key.
+
+        :param method: "password", "rsa" or "ecc".
+        :param key: The password, or the recipient public key.
+        :param chunk_size: Plaintext bytes per chunk (defaults to settings.STREAM_CHUNK_SIZE).
+        :return: Number of plaintext bytes read.
+        """
+        data_key = os.urandom(key_envelope.DATA_KEY_SIZE)
+        dst.write(self._wrapped_prefix(data_key, method, key))
+        header = build_header(8 * key_envelope.DATA_KEY_SIZE, chunk_size or settings.STREAM_CHUNK_SIZE,
+                              os.urandom(16), os.urandom(8))
+        encryptor = ChunkedEncryptor(data_key, header)
+        total = 0
+        while True:
+            block = src.read(settings.STREAM_READ_SIZE)
+            if not block:
+                break
+            total += len(block)
+            dst.write(encryptor.update(block))
+        dst.write(encryptor.finalize())
+        return total
+
+    def decrypt_wrapped_stream(self, src: BinaryIO, dst: BinaryIO, key: str) -> int:
+        """
+        Decrypt a key-wrapped stream.
+
+        :param key: The password, or the private key matching the wrapping public key.
+        :return: Number of plaintext bytes written.
+        """
+        info = key_envelope.read_prefix(src)
+        data_key = self._unwrap_data_key(info["method"], info["wrapped_key"], key)
+        decryptor = ChunkedDecryptor(lambda header: data_key)
+        total = 0
+        while True:
+            block = src.read(settings.STREAM_READ_SIZE)
+            if not block:
+                break
+            plain = decryptor.update(block)
+            total += len(plain)
+            dst.write(plain)
+        plain = decryptor.finalize()
+        dst.write(plain)
+        return total + len(plain)
+
+    def encrypt_wrapped(self, plaintext: bytes, method: str, key: str) -> bytes:
+        """In-memory variant of encrypt_wrapped_stream."""
+        out = BytesIO()
+        self.encrypt_wrapped_stream(BytesIO(plaintext), out, method, key)
+        return out.getvalue()
+
+    def decrypt_wrapped(self, encrypted_data: bytes, key: str) -> bytes:
+        """In-memory variant of decrypt_wrapped_stream."""
+        out = BytesIO()
+        self.decrypt_wrapped_stream(BytesIO(encrypted_data), out, key)
+        return out.getvalue()
+
+    def rewrap(self, src: BinaryIO, old_key: str, new_method: str, new_key: str) -> Tuple[bytes, int]:
+        """
+        Re-wrap the data key of a key-wrapped stream for a new password or key pair.
+
+        Only the prefix is read and rebuilt; the payload is left untouched, so
+        the cost does not depend on the file size.
+
+        :param src: Stream positioned at the start of the key-wrapped data.
+        :param old_key: Current password, or private key matching the current wrapping key.
+        :param new_method: "password", "rsa" or "ecc".
+        :param new_key: New password, or new recipient public key.
+        :return: The new prefix and the length of the prefix it replaces. When
+                 both lengths match the prefix can be overwritten in place.
+        """
+        info = key_envelope.read_prefix(src)
+        data_key = self._unwrap_data_key(info["method"], info["wrapped_key"], old_key)
+        wrapped = self._wrap_data_key(data_key, new_method, new_key)
+        # Keep the existing slot size when the new key fits, so the rewrite stays in place
+        slot_size = max(info["length"] - key_envelope.PREFIX.size, settings.KEY_WRAP_SLOT_SIZE)
+        return key_envelope.build_prefix(new_method, wrapped, slot_size), info["length"]
+
     # ===== ECC (ECIES-style) =====
     def ecc_encrypt(self, plaintext: bytes, public_key_pem: str, curve_name: str) -> str:
         """
         Encrypt plaintext using ECIES (EC Diffie-Hellman with Integrated Encryption Scheme) based on the specified curve.
 
+        Output uses the compact binary format (version, curve id, compressed
+        ephemeral point, nonce, ciphertext) unless settings.ECIES_COMPACT_FORMAT
+        is disabled, in which case the legacy PEM-prefixed format is produced.
+
         :param plaintext: The plaintext to encrypt.
-        :param public_key_pem: The PEM representation of the public key.
-        :param curve_name: The name of the elliptic curve (e.g., "secp256r1").
+        :param public_key_pem: The PEM representation of the public key (raw hex/Base64 for x25519).
+        :param curve_name: The name of the elliptic curve ("secp256r1", "secp256k1" or "x25519").
         :return: The encrypted ciphertext as a base64 string.
         """
-        if curve_name.lower()=='secp256r1': curve=ec.SECP256R1()
-        elif curve_name.lower()=='secp256k1': curve=ec.SECP256K1()
-        else: raise ValueError(f'Unsupported curve: {curve_name}')
-        pub = serialization.load_pem_public_key(public_key_pem.encode('utf-8'))
-        eph_priv = ec.generate_private_key(curve)
+        cid = ecies.curve_id(curve_name)
+        pub = ecies.load_public_key(public_key_pem)
+        ecies.check_curve(pub, cid)
+        # X25519 has no legacy (PEM) representation
+        if settings.ECIES_COMPACT_FORMAT or cid == ecies.X25519_ID:
+            return base64.b64encode(ecies.encrypt_compact(plaintext, pub, cid)).decode('utf-8')
+        return base64.b64encode(self._ecc_encrypt_legacy(plaintext, pub, cid)).decode('utf-8')
+
+    def _ecc_encrypt_legacy(self, plaintext: bytes, pub, cid: int) -> bytes:
+        """Legacy ECIES format: PEM ephemeral public key + nonce + ciphertext."""
+        eph_priv = ecies.generate_ephemeral(cid)
         shared = eph_priv.exchange(ec.ECDH(), pub)
         key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'ecies').derive(shared)
         nonce=os.urandom(12)
         cipher=AESGCM(key)
         ct=cipher.encrypt(nonce, plaintext, None)
         eph_pub = eph_priv.public_key().public_bytes(serialization.Encoding.PEM,serialization.PublicFormat.SubjectPublicKeyInfo)
-        return base64.b64encode(eph_pub+nonce+ct).decode('utf-8')
+        return eph_pub+nonce+ct
 
     def ecc_decrypt(self, payload_b64: str, private_key_pem: str, curve_name: str) -> bytes:
         """
         Decrypt ciphertext using ECIES (EC Diffie-Hellman with Integrated Encryption Scheme) based on the specified curve.
 
+        Compact, multi-recipient and legacy PEM-prefixed messages are told apart
+        by their first byte.
+
         :param payload_b64: The base64 representation of the ciphertext.
-        :param private_key_pem: The PEM representation of the private key.
+        :param private_key_pem: The PEM representation of the private key (raw hex/Base64 for x25519).
         :param curve_name: The name of the elliptic curve (e.g., "secp256r1").
         :return: The decrypted plaintext.
         """
         data=base64.b64decode(payload_b64)
+        priv=ecies.load_private_key(private_key_pem)
+        if ecies.is_compact(data):
+            return ecies.decrypt_compact(data, priv)
+        if ecies.is_multi(data):
+            return ecies.decrypt_multi(data, priv)
+        if not ecies.is_legacy(data):
+            raise ValueError("Unrecognized ECIES message format")
         pem_end=b'-----END PUBLIC KEY-----\n'
         idx=data.find(pem_end)+len(pem_end)
         eph_pub=data[:idx]; rest=data[idx:]
         eph_key=serialization.load_pem_public_key(eph_pub)
-        priv=serialization.load_pem_private_key(private_key_pem.encode('utf-8'),password=None)
         shared=priv.exchange(ec.ECDH(), eph_key)
         key=HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'ecies').derive(shared)
         nonce,ct=rest[:12],rest[12:]
         return AESGCM(key).decrypt(nonce, ct, None)
-    
-    
+
+    def ecc_encrypt_multi(self, plaintext: bytes, public_key_pems: List[str], curve_name: str) -> bytes:
+        """
+        Encrypt plaintext once for several recipients.
+
+        The payload is encrypted with a random content key, which is then wrapped
+        for each recipient public key (in parallel for large recipient lists).
+
+        :param plaintext: The plaintext to encrypt.
+        :param public_key_pems: PEM representations of the recipient public keys (raw hex/Base64 for x25519).
+        :param curve_name: The name of the elliptic curve (e.g., "secp256r1").
+        :return: The multi-recipient message (see ecies.encrypt_multi).
+        """
+        cid = ecies.curve_id(curve_name)
+        recipients = [ecies.load_public_key(pem) for pem in public_key_pems]
+        return ecies.encrypt_multi(plaintext, recipients, cid)
+
+    def ecc_decrypt_multi(self, data: bytes, private_key_pem: str) -> bytes:
+        """
+        Decrypt a multi-recipient message with one recipient's private key.
+
+        :param data: The multi-recipient message.
+        :param private_key_pem: The PEM representation of the private key (raw hex/Base64 for x25519).
+        :return: The decrypted plaintext.
+        """
+        return ecies.decrypt_multi(data, ecies.load_private_key(private_key_pem))
+
     def rsa_encrypt(self, plaintext: bytes, public_key: str) -> bytes:
         """
         Encrypts plaintext with the given RSA public key.
@@ -402,9 +809,7 @@ class EncryptionService:
                     except Exception as e:
                         raise ValueError(f"Invalid key format: {str(e)}")
                 
-                cipher = Cipher(algorithms.TripleDES(b''.join(keys)), modes.CBC(iv))
-                decryptor = cipher.decryptor()
-                padded_data = decryptor.update(ciphertext) + decryptor.finalize()
+                padded_data = parallel_cipher.cbc_decrypt(algorithms.TripleDES(b''.join(keys)), iv, ciphertext)
                 return self._unpad_data(padded_data, block_size=8)
 
             else:  # ECB mode
@@ -441,9 +846,7 @@ class EncryptionService:
                     except Exception as e:
                         raise ValueError(f"Invalid key format: {str(e)}")
                 
-                cipher = Cipher(algorithms.TripleDES(b''.join(keys)), modes.ECB())
-                decryptor = cipher.decryptor()
-                padded_data = decryptor.update(ciphertext) + decryptor.finalize()
+                padded_data = parallel_cipher.ecb_crypt(algorithms.TripleDES(b''.join(keys)), ciphertext, encrypt=False)
                 return self._unpad_data(padded_data, block_size=8)
 
         except Exception as e:
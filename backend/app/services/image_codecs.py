@@ -0,0 +1,154 @@
+import io
+import struct
+import logging
+from typing import Dict, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+from app.services import region_manifest
+
+logger = logging.getLogger(__name__)
+
+# Raw array passthrough: magic, version, bits per channel, channels, reserved, width, height
+RAW_MAGIC = b"SCRW"
+RAW_VERSION = 1
+RAW_HEADER = struct.Struct(">4sBBBBII")
+
+# Output profiles selectable per request
+OUTPUT_FORMATS: Dict[str, Dict] = {
+    "png": {"format": "PNG", "params": {"compress_level": 6}, "mime": "image/png", "ext": "png"},
+    "png-fast": {"format": "PNG", "params": {"compress_level": 1}, "mime": "image/png", "ext": "png"},
+    "png-store": {"format": "PNG", "params": {"compress_level": 0}, "mime": "image/png", "ext": "png"},
+    # exact: keep the RGB of fully transparent pixels, which may hold ciphertext
+    "webp-lossless": {"format": "WEBP", "params": {"lossless": True, "quality": 0, "method": 0, "exact": True},
+                      "mime": "image/webp", "ext": "webp"},
+    "tiff": {"format": "TIFF", "params": {"compression": "raw"}, "mime": "image/tiff", "ext": "tiff"},
+    "raw": {"format": None, "params": {}, "mime": "application/octet-stream", "ext": "raw"},
+}
+
+_RAW_MODES = {(8, 1): "L", (8, 2): "LA", (8, 3): "RGB", (8, 4): "RGBA", (16, 1): "I;16"}
+
+
+def resolve_output_format(output_format: Optional[str], operation: str) -> str:
+    """
+    Pick the output profile for a request.
+
+    Encrypted results are usually decrypted again, so they default to the fast
+    intermediate profile; everything else defaults to the final profile.
+    """
+    if output_format is None:
+        output_format = settings.IMAGE_INTERMEDIATE_FORMAT if operation == "encrypt" else settings.IMAGE_OUTPUT_FORMAT
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    return output_format
+
+
+def check_output_format(output_format: str, image: Union[Image.Image, np.ndarray]) -> None:
+    """
+    Check that an image can be stored losslessly with the given output profile.
+
+    WebP only holds 8-bit RGB and RGBA; grayscale would come back as RGB and
+    16-bit samples would be truncated. Raises ValueError for such images.
+    """
+    if OUTPUT_FORMATS[output_format]["format"] != "WEBP":
+        return
+    if isinstance(image, Image.Image):
+        supported = image.mode in ("RGB", "RGBA")
+    else:
+        supported = image.dtype == np.uint8 and image.ndim == 3 and image.shape[2] in (3, 4)
+    if not supported:
+        raise ValueError(f"Output format {output_format} only supports 8-bit RGB and RGBA images; use png or tiff")
+
+
+def supports_manifest(output_format: str) -> bool:
+    """Whether region manifests can be embedded in the given output profile."""
+    return OUTPUT_FORMATS[output_format]["format"] == "PNG"
+
+
+def check_manifest_embedding(output_format: str) -> None:
+    """Raise ValueError if a region manifest cannot be embedded in the given output profile."""
+    if not supports_manifest(output_format):
+        raise ValueError(f"Region manifests can only be embedded in PNG output, not {output_format}; "
+                         "use a png profile or the sidecar manifest")
+
+
+def mime_type(output_format: str) -> str:
+    """MIME type of the given output profile."""
+    return OUTPUT_FORMATS[output_format]["mime"]
+
+
+def output_filename(stem: str, output_format: str) -> str:
+    """File name with the extension of the given output profile."""
+    return f"{stem}.{OUTPUT_FORMATS[output_format]['ext']}"
+
+
+def is_raw(data: bytes) -> bool:
+    """Whether the data uses the raw array passthrough format."""
+    return data[:4] == RAW_MAGIC
+
+
+def open_image(image_data: bytes) -> Image.Image:
+    """
+    Open encoded image data, including the raw array passthrough format.
+
+    Raises ValueError for malformed raw data.
+    """
+    if not is_raw(image_data):
+        return Image.open(io.BytesIO(image_data))
+
+    if len(image_data) < RAW_HEADER.size:
+        raise ValueError("Raw image header is truncated")
+    _, version, bits, channels, _, width, height = RAW_HEADER.unpack_from(image_data)
+    if version != RAW_VERSION:
+        raise ValueError(f"Unsupported raw image version: {version}")
+    mode = _RAW_MODES.get((bits, channels))
+    if mode is None:
+        raise ValueError(f"Unsupported raw image layout: {bits}-bit, {channels} channels")
+    expected = width * height * channels * bits // 8
+    payload = memoryview(image_data)[RAW_HEADER.size:]
+    if len(payload) != expected:
+        raise ValueError(f"Raw image payload is {len(payload)} bytes, expected {expected}")
+    return Image.frombuffer(mode, (width, height), payload, "raw", mode, 0, 1)
+
+
+def encode_image(image: Union[Image.Image, np.ndarray], output_format: str,
+                 manifest: Optional[Dict] = None) -> bytes:
+    """
+    Encode an image with the given output profile.
+
+    Parameters:
+    - image: PIL image or decoded image array
+    - output_format: Key of OUTPUT_FORMATS
+    - manifest: Optional region manifest to embed (PNG profiles only)
+
+    Returns:
+    - Encoded image bytes
+
+    Raises ValueError if the profile cannot store the image (see check_output_format)
+    or the manifest.
+    """
+    profile = OUTPUT_FORMATS[output_format]
+    check_output_format(output_format, image)
+    if manifest is not None:
+        check_manifest_embedding(output_format)
+
+    if profile["format"] is None:
+        array = np.ascontiguousarray(np.asarray(image))
+        if array.dtype.itemsize > 1:
+            # Multi-byte samples are always stored little-endian
+            array = array.astype(array.dtype.newbyteorder("<"), copy=False)
+        channels = 1 if array.ndim == 2 else array.shape[2]
+        height, width = array.shape[:2]
+        header = RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, array.dtype.itemsize * 8, channels, 0, width, height)
+        return header + array.tobytes()
+
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    params = dict(profile["params"])
+    if manifest is not None:
+        params["pnginfo"] = region_manifest.png_info(manifest)
+    output = io.BytesIO()
+    image.save(output, format=profile["format"], **params)
+    return output.getvalue()
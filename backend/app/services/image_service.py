@@ -1,18 +1,60 @@
 import os
+import struct
 import binascii
 import numpy as np
 from PIL import Image
 from Crypto.Cipher import AES, ChaCha20, ARC4
 from Crypto.Util import Counter
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple, Union
 import io
 import base64
 import cv2
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from Crypto.Util.Padding import pad, unpad
+from app.core.config import settings
+from app.services import image_codecs, key_cache, logistic_tiled, memory_stats, pixel_format, region_manifest
+from app.services.region_set import RegionSet
 
 logger = logging.getLogger(__name__)
 
+# Detected components covering at least this fraction of their bounding box
+# are taken as one rectangle; others are cut into rectangles, at most this deep
+_RECTANGLE_FILL = 0.9
+_MAX_SPLIT_DEPTH = 6
+
+
+def _boxes_overlap(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> bool:
+    """Whether two (x0, y0, x1, y1) boxes share at least one pixel."""
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _merge_windows(windows: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    """
+    Replace overlapping or touching (x0, y0, x1, y1) refinement windows by their bounding box.
+
+    Windows of nearby candidates (or of fragments of one encrypted area)
+    overlap through their margins; refining them separately would report the
+    shared pixels more than once, or cut an area at the window edge.
+    """
+    merged = list(windows)
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        for window in merged:
+            for i, other in enumerate(result):
+                if _boxes_overlap(window, (other[0] - 1, other[1] - 1, other[2] + 1, other[3] + 1)):
+                    result[i] = (min(window[0], other[0]), min(window[1], other[1]),
+                                 max(window[2], other[2]), max(window[3], other[3]))
+                    changed = True
+                    break
+            else:
+                result.append(window)
+        merged = result
+    return merged
+
+
 class ImageEncryptionService:
     """
     Service to encrypt and decrypt images with multiple regions using various algorithms.
@@ -34,38 +76,77 @@ class ImageEncryptionService:
         - algorithm: Encryption algorithm to use
         - operation: Either "encrypt" or "decrypt"
         """
-        x = int(region["left"])
-        y = int(region["top"])
-        width = int(region["width"] * region.get("scaleX", 1))
-        height = int(region["height"] * region.get("scaleY", 1))
-
         # Convert image data to numpy array
         img = Image.open(io.BytesIO(image_data))
-        img_array = np.array(img)
-        
-        # Extract region
-        h, w, _ = img_array.shape
-        x = max(0, min(x, w - 1))
-        y = max(0, min(y, h - 1))
-        width = max(1, min(width, w - x))
-        height = max(1, min(height, h - y))
+        img_array = pixel_format.native_array(img)
+
+        self._apply_region(img_array, region, key, nonce, algorithm, operation)
+
+        # Convert back to image and return bytes
+        processed_img = Image.fromarray(img_array)
+        output = io.BytesIO()
+        processed_img.save(output, format='PNG')
+        return output.getvalue()
+
+    def _apply_region(self, img_array: np.ndarray, region: Dict, key: bytes, nonce: Optional[bytes],
+                      algorithm: str, operation: str, offset: int = 0,
+                      channels: Optional[Sequence[int]] = None) -> Dict:
+        """
+        Process a single region of a decoded image array in place.
+
+        Parameters:
+        - img_array: Decoded image array, modified in place
+        - region: Dictionary containing coordinates and size of the region
+        - key: Encryption key bytes
+        - nonce: Nonce bytes (for AES-CTR and ChaCha20)
+        - algorithm: Encryption algorithm to use
+        - operation: Either "encrypt" or "decrypt"
+        - offset: Keystream offset in bytes (AES-CTR, ChaCha20 and Logistic Tiled only)
+        - channels: Channel indices to process; a "channels" entry in the region
+          takes precedence. Defaults to every channel except alpha.
+
+        Returns:
+        - The clamped region that was actually processed
+        """
+        x, y, width, height = self._clamp_region(img_array, region)
+        return self._apply_rect(img_array, x, y, width, height, key, nonce, algorithm, operation, offset,
+                                region.get("channels", channels))
+
+    def _apply_rect(self, img_array: np.ndarray, x: int, y: int, width: int, height: int, key: bytes,
+                    nonce: Optional[bytes], algorithm: str, operation: str, offset: int = 0,
+                    channels: Optional[Sequence[int]] = None) -> Dict:
+        """
+        Process an already clamped rectangle of a decoded image array in place.
+
+        Takes the same parameters as _apply_region, with the region given as
+        x, y, width and height inside the image.
+        """
+        selected = pixel_format.resolve_channels(img_array, channels)
         
-        region_data = img_array[y:y+height, x:x+width].tobytes()
+        region_data = pixel_format.read_region(img_array, x, y, width, height, selected)
 
         # Process region based on algorithm
         if algorithm == "AES-CTR":
             # Use a 64-bit counter with the provided nonce as the prefix
-            ctr = Counter.new(64, prefix=nonce, initial_value=0)
+            ctr = Counter.new(64, prefix=nonce, initial_value=offset // 16)
             cipher = AES.new(key, AES.MODE_CTR, counter=ctr)
+            if offset % 16:
+                # Skip into the middle of the first counter block
+                cipher.encrypt(bytes(offset % 16))
             processed = cipher.encrypt(region_data) if operation == "encrypt" else cipher.decrypt(region_data)
         elif algorithm == "ChaCha20":
             # Use the provided nonce as the nonce for ChaCha20
             cipher = ChaCha20.new(key=key, nonce=nonce)
+            if offset:
+                cipher.seek(offset)
             processed = cipher.encrypt(region_data) if operation == "encrypt" else cipher.decrypt(region_data)
         elif algorithm == "RC4":
             # Use the provided key for RC4
             cipher = ARC4.new(key)
             processed = cipher.encrypt(region_data)
+        elif algorithm == "Logistic Tiled":
+            # Independent per-tile orbits; seekable like the stream ciphers
+            processed = logistic_tiled.xor(region_data, key, offset)
         else:  # Logistic XOR
             # Use the provided key to seed the Logistic XOR algorithm
             seed_int = int.from_bytes(key, 'big')
@@ -77,64 +158,344 @@ class ImageEncryptionService:
                 ks[i] = int((x0 % 1) * 256)
             processed = bytes(b ^ k for b, k in zip(region_data, ks))
 
-        # Convert processed bytes back to numpy array
-        processed_array = np.frombuffer(processed[:width*height*3], dtype=np.uint8).reshape((height, width, 3))
-        
         # Update the original image array
-        img_array[y:y+height, x:x+width] = processed_array
-        
-        # Convert back to image and return bytes
-        processed_img = Image.fromarray(img_array)
-        output = io.BytesIO()
-        processed_img.save(output, format='PNG')
-        return output.getvalue()
-    def process_image(self, image_data: bytes, regions: List[Dict], key: str, nonce: Optional[str], 
-                     algorithm: str, operation: str) -> bytes:
+        pixel_format.write_region(img_array, x, y, width, height, processed, selected)
+
+        if selected is None:
+            selected = list(range(pixel_format.channel_count(img_array)))
+        return {"left": x, "top": y, "width": width, "height": height, "offset": offset, "channels": selected}
+
+    def _clamp_region(self, img_array: np.ndarray, region: Dict) -> Tuple[int, int, int, int]:
+        """Clamp a region (with optional scaleX/scaleY) to the image, as (x, y, width, height)."""
+        h, w = img_array.shape[:2]
+        x = max(0, min(int(region["left"]), w - 1))
+        y = max(0, min(int(region["top"]), h - 1))
+        width = max(1, min(int(region["width"] * region.get("scaleX", 1)), w - x))
+        height = max(1, min(int(region["height"] * region.get("scaleY", 1)), h - y))
+        return x, y, width, height
+
+    def process_image(self, image_data: bytes, regions: Union[List[Dict], RegionSet], key: str, nonce: Optional[str], 
+                     algorithm: str, operation: str, output_format: Optional[str] = None,
+                     channels: Optional[Sequence[int]] = None) -> bytes:
         """
         Process an image with multiple regions using the specified algorithm.
 
         Parameters:
         - image_data: The original image data in bytes
-        - regions: List of regions to process
+        - regions: Regions to process, as a list of region dicts or a RegionSet
         - key: Encryption key in hex format
         - nonce: Optional nonce in hex format
         - algorithm: Encryption algorithm to use
         - operation: Either "encrypt" or "decrypt"
+        - output_format: Output profile (see image_codecs.OUTPUT_FORMATS)
+        - channels: Channel indices to process (defaults to every channel except alpha)
 
         Returns:
         - Processed image data in bytes
         """
+        processed_data, _ = self.process_image_with_manifest(
+            image_data, regions, key, nonce, algorithm, operation, embed_manifest=False,
+            output_format=output_format, channels=channels
+        )
+        return processed_data
+
+    def process_image_with_manifest(self, image_data: bytes, regions: Union[List[Dict], RegionSet], key: str,
+                                    nonce: Optional[str], algorithm: str, operation: str,
+                                    embed_manifest: bool = True,
+                                    output_format: Optional[str] = None,
+                                    channels: Optional[Sequence[int]] = None) -> Tuple[bytes, str]:
+        """
+        Process an image with multiple regions and describe the result in a region manifest.
+
+        The image is decoded once, every region is processed in place and the
+        result is encoded once. The manifest lists the regions exactly as they
+        were applied so that auto-decryption can skip region detection.
+
+        Parameters:
+        - image_data: The original image data in bytes
+        - regions: Regions to process, as a list of region dicts or a RegionSet
+        - key: Encryption key in hex format
+        - nonce: Optional nonce in hex format
+        - algorithm: Encryption algorithm to use
+        - operation: Either "encrypt" or "decrypt"
+        - embed_manifest: Store the manifest in an iTXt chunk of the output PNG
+        - output_format: Output profile (see image_codecs.OUTPUT_FORMATS)
+        - channels: Channel indices to process (defaults to every channel except alpha)
+
+        Returns:
+        - Tuple of processed image data and the serialized manifest (sidecar blob)
+        """
         # Convert hex strings to bytes
         key_bytes = binascii.unhexlify(key)
         nonce_bytes = binascii.unhexlify(nonce) if nonce else None
 
-        # Process each region
-        processed_data = image_data
-        for region in regions:
-            processed_data = self.process_image_region(processed_data, region, key_bytes, nonce_bytes, 
-                                                     algorithm, operation)
-        
-        return processed_data
-        
-    def detect_encrypted_regions(self, image_data: bytes) -> List[Dict]:
+        output_format = image_codecs.resolve_output_format(output_format, operation)
+        region_set = RegionSet.coerce(regions)
+        img = image_codecs.open_image(image_data)
+        if embed_manifest and operation == "encrypt":
+            image_codecs.check_manifest_embedding(output_format)
+        img_array = pixel_format.native_array(img)
+        image_codecs.check_output_format(output_format, img_array)
+        memory_stats.checkpoint("decode")
+
+        # Clamp all regions at once, then process each of them
+        h, w = img_array.shape[:2]
+        clamped = region_set.clamp(w, h)
+        region_channels = clamped.channels or [None] * len(clamped)
+        applied = [
+            self._apply_rect(img_array, x, y, width, height, key_bytes, nonce_bytes, algorithm, operation,
+                             channels=own if own is not None else channels)
+            for (x, y, width, height), own in zip(clamped.rects.tolist(), region_channels)
+        ]
+        memory_stats.checkpoint("regions")
+        manifest = region_manifest.build_manifest(
+            applied, algorithm, mac_key=key_bytes,
+            channels=applied[0]["channels"] if applied else None
+        )
+
+        embedded = manifest if embed_manifest and operation == "encrypt" else None
+        processed_data = image_codecs.encode_image(img_array, output_format, manifest=embedded)
+        memory_stats.checkpoint("encode")
+        return processed_data, region_manifest.serialize_manifest(manifest)
+
+    def _manifest_regions(self, image_data: bytes, key: str, manifest: Optional[str], algorithm: str,
+                          allow_unauthenticated: bool = False) -> Optional[List[Dict]]:
+        """
+        Look up the region manifest for an image, from the sidecar blob or the PNG itself.
+
+        The manifest must carry a MAC made with ``key`` (unless
+        ``allow_unauthenticated``). Returns the manifest regions, or None if no
+        usable manifest exists. Raises ValueError if the manifest was written
+        for another algorithm: its regions would decrypt with the wrong
+        keystream.
+        """
+        try:
+            if manifest:
+                parsed = region_manifest.parse_manifest(manifest)
+            elif image_codecs.is_raw(image_data):
+                return None
+            else:
+                parsed = region_manifest.read_manifest(Image.open(io.BytesIO(image_data)))
+        except ValueError as e:
+            logger.warning(f"Region manifest rejected: {e}")
+            return None
+        if parsed is None:
+            return None
+        if not region_manifest.algorithm_matches(parsed, algorithm):
+            raise ValueError(f"Region manifest was written for {parsed['alg']}, not {algorithm}")
+        if not region_manifest.verify_manifest(parsed, binascii.unhexlify(key), algorithm, allow_unauthenticated):
+            logger.warning("Region manifest is unauthenticated or does not match the key and algorithm, "
+                           "falling back to detection")
+            return None
+        return region_manifest.manifest_regions(parsed)
+
+    def detect_encrypted_regions(self, image_data: bytes, pyramid_levels: Optional[int] = None) -> List[Dict]:
         """
         Detect potentially encrypted regions in an image.
 
+        By default a coarse pass runs on a decimated pyramid level to find
+        candidate areas, and boundaries are refined at full resolution only
+        inside those candidates, so the cost scales with the encrypted area.
+        With zero pyramid levels the whole image is scanned at full resolution.
+
         Parameters:
         - image_data: The original image data in bytes
+        - pyramid_levels: Number of 2x pyramid levels for the coarse pass
+          (defaults to settings.DETECT_PYRAMID_LEVELS)
 
         Returns:
         - List of detected regions that are likely encrypted
         """
-        print("Starting region detection...")
+        logger.debug("Starting region detection")
         # Convert image data to numpy array
-        img = Image.open(io.BytesIO(image_data))
+        img = image_codecs.open_image(image_data)
         img_array = np.array(img)
-        print(f"Image shape: {img_array.shape}")
-        
-        # Convert to grayscale for processing
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        
+        logger.debug(f"Image shape: {img_array.shape}")
+
+        levels = settings.DETECT_PYRAMID_LEVELS if pyramid_levels is None else pyramid_levels
+        if levels > 0:
+            regions = self._detect_coarse_to_fine(img_array, levels)
+        else:
+            regions = self._detect_full_resolution(self._to_gray(img_array))
+
+        logger.debug(f"Total regions detected: {len(regions)}")
+        return regions
+
+    def _to_gray(self, img_array: np.ndarray) -> np.ndarray:
+        """Convert a decoded image array to 8-bit grayscale."""
+        if img_array.dtype == np.uint16:
+            img_array = (img_array >> 8).astype(np.uint8)
+        elif img_array.dtype != np.uint8:
+            img_array = img_array.astype(np.uint8)
+        if img_array.ndim == 2:
+            return img_array
+        if img_array.shape[2] == 4:
+            return cv2.cvtColor(img_array, cv2.COLOR_RGBA2GRAY)
+        if img_array.shape[2] == 2:
+            return np.ascontiguousarray(img_array[:, :, 0])
+        return cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+
+    def _detect_coarse_to_fine(self, img_array: np.ndarray, levels: int) -> List[Dict]:
+        """
+        Find candidate areas on a decimated copy of the image, then refine each
+        one at full resolution.
+
+        Decimation (rather than pyrDown averaging) keeps the pixel statistics of
+        ciphertext intact, so the same standard deviation threshold applies at
+        every pyramid level.
+        """
+        step = 2 ** levels
+        h, w = img_array.shape[:2]
+        coarse = self._to_gray(np.ascontiguousarray(img_array[::step, ::step]))
+        mask = self._high_variance_mask(coarse)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        logger.debug(f"Found {count - 1} candidate areas at 1/{step} scale")
+
+        margin = settings.DETECT_REFINE_MARGIN
+        min_coarse_area = max(1, settings.DETECT_MIN_AREA // (step * step))
+        windows = []
+        for cx, cy, cw, ch, area in stats[1:]:
+            if area < min_coarse_area:
+                continue
+            # Map the candidate back to full resolution with a safety margin
+            windows.append((
+                max(0, int(cx) * step - margin),
+                max(0, int(cy) * step - margin),
+                min(w, int(cx + cw) * step + margin),
+                min(h, int(cy + ch) * step + margin),
+            ))
+
+        regions = []
+        accepted = []
+        for x0, y0, x1, y1 in _merge_windows(windows):
+            gray = self._to_gray(np.ascontiguousarray(img_array[y0:y1, x0:x1]))
+            for region in self._refine_candidate(gray, x0, y0):
+                rect = (region["left"], region["top"], region["left"] + region["width"],
+                        region["top"] + region["height"])
+                # Processing a pixel twice would undo the decryption there
+                if any(_boxes_overlap(rect, other) for other in accepted):
+                    logger.debug(f"Dropping detected region {rect} overlapping an earlier one")
+                    continue
+                accepted.append(rect)
+                regions.append(region)
+        return regions
+
+    def _high_variance_mask(self, gray: np.ndarray) -> np.ndarray:
+        """Mark pixels whose 3x3 neighbourhood standard deviation exceeds the threshold."""
+        gray = gray.astype(np.float32)
+        mean = cv2.blur(gray, (3, 3))
+        mean_sq = cv2.blur(gray * gray, (3, 3))
+        local_std = np.sqrt(np.maximum(mean_sq - mean * mean, 0))
+        return (local_std > settings.DETECT_STD_THRESHOLD).astype(np.uint8)
+
+    def _refine_candidate(self, gray: np.ndarray, offset_x: int, offset_y: int) -> List[Dict]:
+        """
+        Find the exact bounds of the encrypted areas inside a full-resolution crop.
+
+        Neighbouring ciphertext pixels differ strongly while natural image
+        content changes smoothly, so pixels differing strongly from both
+        neighbours along a row or a column are marked as ciphertext. A coarse
+        candidate may cover several encrypted areas (the coarse pass merges
+        areas a few pixels apart) or an area that is not a rectangle, so the
+        marked pixels are split into connected components and every component
+        is cut into rectangles (see _split_component).
+        """
+        g = gray.astype(np.int16)
+        threshold = settings.DETECT_STD_THRESHOLD
+        dx = np.abs(np.diff(g, axis=1)) > threshold
+        dy = np.abs(np.diff(g, axis=0)) > threshold
+        mask = np.zeros(gray.shape, dtype=np.uint8)
+        mask[:, 1:-1] |= dx[:, :-1] & dx[:, 1:]
+        mask[1:-1, :] |= dy[:-1, :] & dy[1:, :]
+        if not mask.any():
+            return []
+        closed = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(closed, connectivity=8)
+        regions = []
+        for label in range(1, count):
+            x, y, width, height, area = (int(v) for v in stats[label])
+            if area <= settings.DETECT_MIN_AREA:
+                continue
+            component = labels[y:y+height, x:x+width] == label
+            for bx, by, bw, bh in self._split_component(component):
+                region = self._bound_region(gray, mask, x + bx, y + by, bw, bh)
+                if region is not None:
+                    x0, y0, w0, h0 = region
+                    logger.debug(
+                        f"Detected encrypted region at ({x0 + offset_x}, {y0 + offset_y}) - size: {w0}x{h0}"
+                    )
+                    regions.append({
+                        "left": x0 + offset_x,
+                        "top": y0 + offset_y,
+                        "width": w0,
+                        "height": h0,
+                        "scaleX": 1,
+                        "scaleY": 1
+                    })
+        return regions
+
+    def _split_component(self, component: np.ndarray, depth: int = 0) -> List[Tuple[int, int, int, int]]:
+        """
+        Cut a component mask into rectangles (x, y, width, height).
+
+        A component filling most of its bounding box is one rectangle.
+        Otherwise it is cut across the row or column where the fraction of
+        covered pixels changes the most (the inner corner of an L shape) and
+        both parts are cut again.
+        """
+        rows = np.flatnonzero(component.any(axis=1))
+        cols = np.flatnonzero(component.any(axis=0))
+        if len(rows) == 0:
+            return []
+        y0, y1, x0, x1 = int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+        box = component[y0:y1, x0:x1]
+        if box.mean() >= _RECTANGLE_FILL or depth >= _MAX_SPLIT_DEPTH or min(box.shape) < 2:
+            return [(x0, y0, x1 - x0, y1 - y0)]
+        row_jump = np.abs(np.diff(box.mean(axis=1)))
+        col_jump = np.abs(np.diff(box.mean(axis=0)))
+        if row_jump.max() >= col_jump.max():
+            cut = int(row_jump.argmax()) + 1
+            parts = [(box[:cut], 0, 0), (box[cut:], 0, cut)]
+        else:
+            cut = int(col_jump.argmax()) + 1
+            parts = [(box[:, :cut], 0, 0), (box[:, cut:], cut, 0)]
+        rects = []
+        for part, px, py in parts:
+            for x, y, w, h in self._split_component(part, depth + 1):
+                rects.append((x0 + px + x, y0 + py + y, w, h))
+        return rects
+
+    def _bound_region(self, gray: np.ndarray, mask: np.ndarray, x: int, y: int, width: int,
+                      height: int) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Trim a rectangle to the rows and columns where most pixels are marked.
+
+        Returns the exact bounds, or None if the area is too small or too
+        uniform to be ciphertext.
+        """
+        box = mask[y:y+height, x:x+width]
+        row_hits = box.sum(axis=1)
+        col_hits = box.sum(axis=0)
+        rows = np.flatnonzero(row_hits > row_hits.max() // 2)
+        cols = np.flatnonzero(col_hits > col_hits.max() // 2)
+        x, y = x + int(cols[0]), y + int(rows[0])
+        width, height = int(cols[-1]) - int(cols[0]) + 1, int(rows[-1]) - int(rows[0]) + 1
+        if width * height <= settings.DETECT_MIN_AREA:
+            return None
+        if np.std(gray[y:y+height, x:x+width]) <= settings.DETECT_STD_THRESHOLD:
+            return None
+        return x, y, width, height
+
+    def _detect_in_gray(self, gray: np.ndarray, offset_x: int = 0, offset_y: int = 0) -> List[Dict]:
+        """
+        Locate high-contrast, high-variance contours in a grayscale image.
+
+        Coordinates are shifted by the given offsets so that crops report
+        positions in the full image.
+        """
         # Calculate local contrast using Gaussian Blur
         kernel_size = 3
         blurred = cv2.GaussianBlur(gray, (kernel_size, kernel_size), 0)
@@ -144,7 +505,7 @@ class ImageEncryptionService:
         contrast = cv2.normalize(contrast, None, 0, 255, cv2.NORM_MINMAX)
         
         # Threshold to find high contrast regions
-        _, binary = cv2.threshold(contrast, 50, 255, cv2.THRESH_BINARY)
+        _, binary = cv2.threshold(contrast, settings.DETECT_CONTRAST_THRESHOLD, 255, cv2.THRESH_BINARY)
         
         # Apply morphological operations to clean up the binary image
         kernel = np.ones((3,3), np.uint8)
@@ -153,10 +514,10 @@ class ImageEncryptionService:
         
         # Find contours in the binary image
         contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        print(f"Found {len(contours)} high contrast regions")
+        logger.debug(f"Found {len(contours)} high contrast regions")
         
         regions = []
-        min_area = 25  # Small minimum area to catch all potential regions
+        min_area = settings.DETECT_MIN_AREA  # Small minimum area to catch all potential regions
         
         for contour in contours:
             area = cv2.contourArea(contour)
@@ -168,24 +529,29 @@ class ImageEncryptionService:
                 if region.size > 0:
                     mean = np.mean(region)
                     std = np.std(region)
-                    print(f"Region at ({x}, {y}) - size: {w}x{h}, mean: {mean:.2f}, std: {std:.2f}")
+                    logger.debug(f"Region at ({x + offset_x}, {y + offset_y}) - size: {w}x{h}, mean: {mean:.2f}, std: {std:.2f}")
                     
                     # Regions with high standard deviation are likely encrypted
-                    if std > 30:  # Threshold for standard deviation
-                        print(f"Detected encrypted region at ({x}, {y})")
+                    if std > settings.DETECT_STD_THRESHOLD:  # Threshold for standard deviation
+                        logger.debug(f"Detected encrypted region at ({x + offset_x}, {y + offset_y})")
                         # Don't expand the region to prevent merging
                         regions.append({
-                            "left": int(x),
-                            "top": int(y),
+                            "left": int(x + offset_x),
+                            "top": int(y + offset_y),
                             "width": int(w),
                             "height": int(h),
                             "scaleX": 1,
                             "scaleY": 1
                         })
+        return regions
+
+    def _detect_full_resolution(self, gray: np.ndarray) -> List[Dict]:
+        """Scan the whole grayscale image, with a block-based fallback."""
+        regions = self._detect_in_gray(gray)
         
         # If no regions were detected or more precision is needed, try block-based detection
         if len(regions) < 2:  # We expect to find at least 2 regions
-            print("Trying block-based detection for more precision...")
+            logger.debug("Trying block-based detection for more precision...")
             # Try to detect regions based on local statistics
             h, w = gray.shape
             block_size = 8  # Smaller block size for finer detection
@@ -196,8 +562,8 @@ class ImageEncryptionService:
                     block = gray[y:min(y+block_size, h), x:min(x+block_size, w)]
                     if block.size > 0:
                         std = np.std(block)
-                        if std > 30:  # Consistent threshold
-                            print(f"Detected encrypted block at ({x}, {y}) - std: {std:.2f}")
+                        if std > settings.DETECT_STD_THRESHOLD:  # Consistent threshold
+                            logger.debug(f"Detected encrypted block at ({x}, {y}) - std: {std:.2f}")
                             block_regions.append({
                                 "left": int(x),
                                 "top": int(y),
@@ -211,7 +577,6 @@ class ImageEncryptionService:
             if len(block_regions) > len(regions):
                 regions = block_regions
         
-        print(f"Total regions detected: {len(regions)}")
         return regions
     
     def _is_likely_encrypted(self, region: np.ndarray) -> bool:
@@ -234,39 +599,143 @@ class ImageEncryptionService:
         # Encrypted regions typically have high standard deviation
         is_encrypted = std > 30
         if is_encrypted:
-            print(f"Region detected as encrypted - mean: {mean:.2f}, std: {std:.2f}")
+            logger.debug(f"Region detected as encrypted - mean: {mean:.2f}, std: {std:.2f}")
         return is_encrypted
     
-    def auto_decrypt_image(self, image_data: bytes, key: str, nonce: Optional[str], algorithm: str) -> bytes:
+    def _naturalness(self, gray: np.ndarray) -> Tuple[float, float]:
+        """
+        Cheap natural-image statistics of a grayscale patch.
+
+        Returns the correlation between horizontally and vertically adjacent
+        pixels (close to 1 for natural content, close to 0 for ciphertext) and
+        the histogram entropy in bits (close to 8 for ciphertext).
+        """
+        gray = gray.astype(np.float64)
+        pairs = [(gray[:, :-1].ravel(), gray[:, 1:].ravel())]
+        if gray.shape[0] > 1:
+            pairs.append((gray[:-1].ravel(), gray[1:].ravel()))
+        a = np.concatenate([p[0] for p in pairs])
+        b = np.concatenate([p[1] for p in pairs])
+        if a.size < 2 or a.std() == 0 or b.std() == 0:
+            correlation = 1.0  # Flat content is as smooth as it gets
+        else:
+            correlation = float(np.corrcoef(a, b)[0, 1])
+        counts = np.bincount(gray.astype(np.uint8).ravel(), minlength=256)
+        p = counts[counts > 0] / gray.size
+        entropy = float(-(p * np.log2(p)).sum())
+        return correlation, entropy
+
+    def _trial_decrypt(self, img_array: np.ndarray, region: Dict, key: bytes, nonce: Optional[bytes],
+                       algorithm: str) -> Dict:
+        """
+        Trial-decrypt the top band of a candidate region and score the result.
+
+        The keystream is laid out row by row from the region's top-left corner,
+        so decrypting a band of the first rows on its own yields exactly the
+        bytes a full decryption would, at a fraction of the cost.
+        """
+        x, y, width, height = self._clamp_region(img_array, region)
+        rows = min(height, max(2, settings.AUTO_DECRYPT_SAMPLE_PIXELS // width))
+        band = img_array[y:y + rows, x:x + width].copy()
+        before = self._naturalness(self._to_gray(band))
+        band_region = {"left": 0, "top": 0, "width": width, "height": rows}
+        if "channels" in region:
+            band_region["channels"] = region["channels"]
+        self._apply_region(band, band_region, key, nonce, algorithm, "decrypt")
+        after = self._naturalness(self._to_gray(band))
+        accepted = (after[0] - before[0] >= settings.AUTO_DECRYPT_MIN_CORRELATION_GAIN
+                    and after[1] <= before[1])
+        return {"accepted": accepted, "before": before, "after": after}
+
+    def verify_candidates(self, image_data: bytes, regions: List[Dict], key: str, nonce: Optional[str],
+                          algorithm: str) -> List[Dict]:
+        """
+        Keep only the candidate regions whose trial decryption looks like a natural image.
+
+        Each candidate is trial-decrypted in parallel and accepted when the
+        neighbour correlation rises by at least AUTO_DECRYPT_MIN_CORRELATION_GAIN
+        without the entropy rising, which rejects detector false positives
+        such as textured areas.
+
+        Parameters:
+        - image_data: The image data in bytes
+        - regions: Candidate regions from detect_encrypted_regions
+        - key: Encryption key in hex format
+        - nonce: Optional nonce in hex format
+        - algorithm: Encryption algorithm to use
+
+        Returns:
+        - The accepted regions, in their original order
+        """
+        img_array = pixel_format.native_array(image_codecs.open_image(image_data))
+        key_bytes = binascii.unhexlify(key)
+        nonce_bytes = binascii.unhexlify(nonce) if nonce else None
+
+        def trial(region):
+            return self._trial_decrypt(img_array, region, key_bytes, nonce_bytes, algorithm)
+
+        with ThreadPoolExecutor(max_workers=settings.AUTO_DECRYPT_WORKERS) as executor:
+            results = list(executor.map(trial, regions))
+
+        accepted = []
+        for region, result in zip(regions, results):
+            logger.info(
+                f"Candidate {region}: correlation {result['before'][0]:.2f} -> {result['after'][0]:.2f}, "
+                f"entropy {result['before'][1]:.2f} -> {result['after'][1]:.2f}, "
+                f"{'accepted' if result['accepted'] else 'rejected'}"
+            )
+            if result["accepted"]:
+                accepted.append(region)
+        return accepted
+
+    def auto_decrypt_image(self, image_data: bytes, key: str, nonce: Optional[str], algorithm: str,
+                           manifest: Optional[str] = None, output_format: Optional[str] = None,
+                           allow_unauthenticated_manifest: bool = False) -> bytes:
         """
         Automatically detect and decrypt encrypted regions in an image.
         
-        This method detects regions that are likely encrypted, then attempts to
-        decrypt them using the provided key and algorithm.
+        If the image carries a region manifest (embedded or passed as a sidecar
+        blob), its regions are decrypted directly. Otherwise this method detects
+        regions that are likely encrypted, keeps the candidates whose trial
+        decryption with the provided key and algorithm looks like a natural
+        image (see verify_candidates), and decrypts those. Manifests must be
+        authenticated with the key, unless ``allow_unauthenticated_manifest``
+        accepts manifests without a MAC, and a manifest written for another
+        algorithm is an error.
         """
-        print("\nStarting auto-decryption...")
-        # Detect encrypted regions
-        encrypted_regions = self.detect_encrypted_regions(image_data)
+        logger.debug("Starting auto-decryption")
+        encrypted_regions = self._manifest_regions(image_data, key, manifest, algorithm,
+                                                   allow_unauthenticated_manifest)
+        if encrypted_regions is not None:
+            logger.debug(f"Using region manifest with {len(encrypted_regions)} regions")
+        else:
+            # Detect encrypted regions
+            encrypted_regions = self.detect_encrypted_regions(image_data)
+            memory_stats.checkpoint("detect")
+            if encrypted_regions and settings.AUTO_DECRYPT_VERIFY:
+                encrypted_regions = self.verify_candidates(image_data, encrypted_regions, key, nonce, algorithm)
+                memory_stats.checkpoint("verify")
         
         # If no encrypted regions found, return the original image
         if not encrypted_regions:
-            print("No encrypted regions detected, returning original image")
+            logger.debug("No encrypted regions detected, returning original image")
             return image_data
             
-        print(f"Attempting to decrypt {len(encrypted_regions)} regions...")
+        logger.debug(f"Attempting to decrypt {len(encrypted_regions)} regions")
         # Decrypt detected regions
         try:
-            result = self.process_image(image_data, encrypted_regions, key, nonce, algorithm, "decrypt")
-            print("Decryption completed successfully")
+            result = self.process_image(image_data, encrypted_regions, key, nonce, algorithm, "decrypt",
+                                        output_format=output_format)
+            logger.debug("Decryption completed successfully")
             return result
         except Exception as e:
-            print(f"Error during decryption: {str(e)}")
-            raise 
+            logger.error(f"Error during decryption: {str(e)}")
+            raise
 
     def partial_process_image(
         self,
         image_data: bytes,
-        regions: List[Dict],
+        regions: Union[List[Dict], RegionSet],
         operation: str,
         algorithm: str,
         password: Optional[str] = None,
@@ -276,48 +745,57 @@ class ImageEncryptionService:
         nonce: Optional[str] = None,
         rc4_key: Optional[str] = None,
         logistic_initial: Optional[float] = None,
-        logistic_parameter: Optional[float] = None
+        logistic_parameter: Optional[float] = None,
+        embed_manifest: bool = False,
+        output_format: Optional[str] = None,
+        channels: Optional[Sequence[int]] = None
     ) -> bytes:
-        """Process specific regions of an image with the specified algorithm."""
+        """Process specific regions of an image with the specified algorithm.
+
+        When ``embed_manifest`` is set on encryption, the processed regions are
+        recorded in a region manifest stored in the output PNG. ``output_format``
+        selects the output profile (see image_codecs.OUTPUT_FORMATS). Images are
+        processed in their native layout; ``channels`` selects the channels to
+        process and defaults to every channel except alpha. ``regions`` is a
+        list of region dicts or a RegionSet.
+        """
         try:
-            logger.info(f"Starting image processing with {len(regions)} regions")
+            region_set = RegionSet.coerce(regions)
+            logger.info(f"Starting image processing with {len(region_set)} regions")
             logger.info(f"Operation: {operation}, Algorithm: {algorithm}")
             
             # Convert image data to numpy array
-            img = Image.open(io.BytesIO(image_data))
+            output_format = image_codecs.resolve_output_format(output_format, operation)
+            if embed_manifest and operation == "encrypt":
+                image_codecs.check_manifest_embedding(output_format)
+            img = image_codecs.open_image(image_data)
             logger.info(f"Original image size: {img.size}, mode: {img.mode}")
             
-            # Convert to RGB if needed
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
+            # Decode in the native channel layout and bit depth
+            img_array = pixel_format.native_array(img)
+            logger.info(f"Image array shape: {img_array.shape}, dtype: {img_array.dtype}")
+            image_codecs.check_output_format(output_format, img_array)
+            selected = pixel_format.resolve_channels(img_array, channels)
             
-            img_array = np.array(img)
-            logger.info(f"Image array shape: {img_array.shape}")
+            memory_stats.checkpoint("decode")
             
             # Create a copy for the output
             out = img_array.copy()
+            applied = []
+            # Key bytes the cipher consumed; they also authenticate the manifest
+            cipher_key = None
+            memory_stats.checkpoint("copy")
+            
+            # Ensure coordinates are within bounds, for all regions at once
+            h, w = img_array.shape[:2]
+            clamped = region_set.clamp(w, h)
             
             # Process each region
-            for i, region in enumerate(regions):
-                logger.info(f"Processing region {i+1}: {region}")
-                
-                x = int(region["left"])
-                y = int(region["top"])
-                width = int(region["width"])
-                height = int(region["height"])
+            for i, (x, y, width, height) in enumerate(clamped.rects.tolist()):
+                logger.info(f"Region {i+1} bounds: x={x}, y={y}, width={width}, height={height}")
                 
-                # Ensure coordinates are within bounds
-                h, w, _ = img_array.shape
-                x = max(0, min(x, w - 1))
-                y = max(0, min(y, h - 1))
-                width = max(1, min(width, w - x))
-                height = max(1, min(height, h - y))
-                
-                logger.info(f"Region bounds: x={x}, y={y}, width={width}, height={height}")
-                
-                # Extract region and ensure it's contiguous
-                segment = img_array[y:y+height, x:x+width].copy()
-                segment_bytes = segment.tobytes()
+                # Extract the selected channels of the region as contiguous bytes
+                segment_bytes = pixel_format.read_region(img_array, x, y, width, height, selected)
                 logger.info(f"Segment size: {len(segment_bytes)} bytes")
                 
                 # Process region based on algorithm
@@ -326,8 +804,7 @@ class ImageEncryptionService:
                         raise ValueError("Password, key size, and mode are required for AES")
                     
                     # Generate key from password
-                    key = self._derive_key(password, key_size)
-                    print("key", key)
+                    key = cipher_key = self._derive_key(password, key_size)
                     logger.info(f"Using AES-{key_size} in {mode} mode")
                     
                     # Handle different AES modes
@@ -427,7 +904,7 @@ class ImageEncryptionService:
                         raise ValueError("Nonce is required for ChaCha20")
                     
                     # Generate key from password
-                    key = self._derive_key(password, 256)  # ChaCha20 uses 256-bit keys
+                    key = cipher_key = self._derive_key(password, 256)  # ChaCha20 uses 256-bit keys
                     try:
                         nonce_bytes = binascii.unhexlify(nonce)
                     except:
@@ -442,7 +919,8 @@ class ImageEncryptionService:
                         raise ValueError("RC4 key is required")
                     
                     # RC4 is symmetric, so encryption and decryption are the same operation
-                    cipher = ARC4.new(rc4_key.encode())
+                    cipher_key = rc4_key.encode()
+                    cipher = ARC4.new(cipher_key)
                     proc = cipher.encrypt(segment_bytes)
                     
                 elif algorithm.lower() == "logistic":
@@ -456,9 +934,11 @@ class ImageEncryptionService:
                     # Generate keystream using logistic map
                     # Use password if provided, otherwise use logistic_initial
                     if password:
-                        seed_int = int.from_bytes(password.encode(), 'big')
+                        cipher_key = password.encode()
+                        seed_int = int.from_bytes(cipher_key, 'big')
                         x0 = seed_int / (2**128 - 1)
                     else:
+                        cipher_key = struct.pack(">dd", logistic_initial, logistic_parameter)
                         x0 = float(logistic_initial)
                     
                     mu = float(logistic_parameter)
@@ -471,6 +951,22 @@ class ImageEncryptionService:
                     
                     # XOR is symmetric, so encryption and decryption are the same operation
                     proc = bytes(b ^ k for b, k in zip(segment_bytes, ks))
+
+                elif algorithm.lower() == "logistic-tiled":
+                    if logistic_initial is None or logistic_parameter is None:
+                        raise ValueError("Initial value and parameter are required for Logistic Tiled")
+                    if not (0 < logistic_initial < 1) or logistic_initial == 0.5:
+                        raise ValueError("Initial value must be between 0 and 1, excluding 0, 0.5, and 1")
+                    if not (3.57 <= logistic_parameter <= 4):
+                        raise ValueError("Parameter must be between 3.57 and 4")
+
+                    # Tile seeds are derived from the password, or from the initial value and parameter
+                    if password:
+                        key_material = password.encode()
+                    else:
+                        key_material = struct.pack(">dd", logistic_initial, logistic_parameter)
+                    cipher_key = key_material
+                    proc = logistic_tiled.xor(segment_bytes, key_material, mu=float(logistic_parameter))
                     
                 else:
                     raise ValueError(f"Unsupported algorithm: {algorithm}")
@@ -479,26 +975,30 @@ class ImageEncryptionService:
                 
                 # Convert processed bytes back to numpy array
                 try:
-                    patch = np.frombuffer(proc[:width*height*3], dtype=np.uint8).reshape((height, width, 3))
-                    # Ensure the patch has the correct shape
-                    if patch.shape != (height, width, 3):
-                        raise ValueError(f"Invalid patch shape: {patch.shape}, expected {(height, width, 3)}")
                     # Update the output image array
-                    out[y:y+height, x:x+width] = patch
+                    pixel_format.write_region(out, x, y, width, height, proc, selected)
+                    applied.append({"left": x, "top": y, "width": width, "height": height})
                     logger.info(f"Successfully updated region {i+1} in output image")
                 except Exception as e:
                     logger.error(f"Error processing region {i+1}: {str(e)}")
                     raise ValueError(f"Failed to process region at ({x}, {y}): {str(e)}")
             
+            memory_stats.checkpoint("regions")
+            
             # Convert back to image and return bytes
             processed_img = Image.fromarray(out)
             logger.info(f"Final image size: {processed_img.size}, mode: {processed_img.mode}")
             
-            # Save to bytes with high quality
-            output = io.BytesIO()
-            processed_img.save(output, format='PNG', quality=95)
-            output.seek(0)
-            result_bytes = output.getvalue()
+            # Encode with the selected output profile
+            manifest = None
+            if embed_manifest and operation == "encrypt":
+                # AES manifests name the mode, which auto-decrypt cannot replay
+                name = f"aes-{mode}" if algorithm.lower() == "aes" else algorithm
+                manifest = region_manifest.build_manifest(
+                    applied, name, mac_key=cipher_key, channels=selected
+                )
+            result_bytes = image_codecs.encode_image(processed_img, output_format, manifest=manifest)
+            memory_stats.checkpoint("encode")
             logger.info(f"Final output size: {len(result_bytes)} bytes")
             
             return result_bytes
@@ -529,13 +1029,16 @@ class ImageEncryptionService:
         # Use a fixed salt for consistency between encryption and decryption
         salt = b'fixed_salt_for_demo'
         
-        # Derive key using PBKDF2 with more iterations for better security
-        key = PBKDF2(
-            password.encode(),
-            salt,
-            dkLen=key_size_bytes,
-            count=100000,
-            hmac_hash_module=SHA256
+        # Derive key using PBKDF2 with more iterations for better security;
+        # the result is shared with the other workers through the key cache
+        return key_cache.cached_key(
+            "pbkdf2-sha256:100000",
+            [password.encode(), salt, struct.pack(">I", key_size_bytes)],
+            lambda: PBKDF2(
+                password.encode(),
+                salt,
+                dkLen=key_size_bytes,
+                count=100000,
+                hmac_hash_module=SHA256
+            ),
         )
-        
-        return key
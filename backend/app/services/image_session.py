@@ -0,0 +1,215 @@
+import time
+import secrets
+import binascii
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services import image_codecs, pixel_format
+from app.services.image_service import ImageEncryptionService
+
+logger = logging.getLogger(__name__)
+
+RegionId = Tuple[int, int, int, int, Tuple[int, ...]]
+
+
+class ImageSession:
+    """
+    Decoded working image of an editing session.
+
+    Every image algorithm XORs the region with a keystream that only depends on
+    the key, nonce and the region itself, so regions commute and applying a
+    region twice restores it. Adding a region therefore processes just that
+    region, and removing one processes it again.
+    """
+
+    def __init__(self, array: np.ndarray, key: bytes, nonce: Optional[bytes], algorithm: str,
+                 operation: str, output_format: str, channels: Optional[Sequence[int]]):
+        self.array = array
+        self.key = key
+        self.nonce = nonce
+        self.algorithm = algorithm
+        self.operation = operation
+        self.output_format = output_format
+        self.channels = channels
+        self.regions: "OrderedDict[RegionId, Dict]" = OrderedDict()
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self.array.nbytes
+
+
+class ImageSessionStore:
+    """
+    Keeps working arrays of image editing sessions between requests.
+
+    Sessions are evicted least recently used first once the number of sessions
+    or their combined size exceeds the configured limits, and after sitting
+    idle for the session TTL.
+    """
+
+    def __init__(self, image_service: Optional[ImageEncryptionService] = None, max_sessions: int = None,
+                 max_bytes: int = None, ttl: float = None):
+        self.image_service = image_service or ImageEncryptionService()
+        self.max_sessions = max_sessions or settings.IMAGE_SESSION_MAX_SESSIONS
+        self.max_bytes = max_bytes or settings.IMAGE_SESSION_MAX_BYTES
+        self.ttl = ttl or settings.IMAGE_SESSION_TTL
+        self._sessions: "OrderedDict[str, ImageSession]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def create(self, image_data: bytes, key: str, nonce: Optional[str], algorithm: str, operation: str,
+               regions: Iterable[Dict] = (), output_format: Optional[str] = None,
+               channels: Optional[Sequence[int]] = None) -> Tuple[str, bytes]:
+        """
+        Decode an image into a new session and process the initial regions.
+
+        Parameters:
+        - image_data: The original image data in bytes
+        - key: Encryption key in hex format, kept in memory for the session only
+        - nonce: Optional nonce in hex format
+        - algorithm: Encryption algorithm to use
+        - operation: Either "encrypt" or "decrypt"
+        - regions: Initial regions to process
+        - output_format: Output profile (see image_codecs.OUTPUT_FORMATS)
+        - channels: Channel indices to process (defaults to every channel except alpha)
+
+        Returns:
+        - Tuple of the session id and the processed image
+        """
+        output_format = image_codecs.resolve_output_format(output_format, operation)
+        array = pixel_format.native_array(image_codecs.open_image(image_data))
+        image_codecs.check_output_format(output_format, array)
+        # Own the buffer: native_array may return a read-only view of the decoder output
+        array = np.array(array, copy=True)
+        session = ImageSession(
+            array, binascii.unhexlify(key), binascii.unhexlify(nonce) if nonce else None,
+            algorithm, operation, output_format, channels
+        )
+        self._apply(session, list(regions), [])
+
+        session_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._sessions[session_id] = session
+            self._bytes += session.nbytes
+            self._evict()
+        return session_id, image_codecs.encode_image(session.array, output_format)
+
+    def get(self, session_id: str) -> ImageSession:
+        """Look up a live session. Raises KeyError for unknown or expired sessions."""
+        with self._lock:
+            self._evict()
+            session = self._sessions[session_id]
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session
+
+    def close(self, session_id: str) -> bool:
+        """Drop a session. Returns False if it did not exist."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._bytes -= session.nbytes
+            return True
+
+    def update(self, session_id: str, add: Iterable[Dict] = (), remove: Iterable[Dict] = (),
+               regions: Optional[Iterable[Dict]] = None, patches: bool = False) -> Dict:
+        """
+        Apply a region delta to a session.
+
+        Parameters:
+        - session_id: Session to update
+        - add: Regions to process
+        - remove: Previously processed regions to restore
+        - regions: Full region list; when given, the delta against the current
+          regions is computed here and ``add``/``remove`` are ignored
+        - patches: Return only the changed rectangles instead of the full image
+
+        Returns:
+        - Dictionary with the numbers of added and removed regions and either
+          "image" (encoded full image) or "patches" (list of rectangles with
+          their encoded pixels)
+        """
+        session = self.get(session_id)
+        with session.lock:
+            if regions is not None:
+                wanted = OrderedDict((self._region_id(session, r), r) for r in regions)
+                add = [r for rid, r in wanted.items() if rid not in session.regions]
+                remove = [session.regions[rid] for rid in session.regions if rid not in wanted]
+            changed = self._apply(session, list(add), list(remove))
+
+            result = {"added": changed["added"], "removed": changed["removed"]}
+            if patches:
+                result["patches"] = [
+                    dict(rect, image=image_codecs.encode_image(
+                        session.array[rect["top"]:rect["top"] + rect["height"],
+                                      rect["left"]:rect["left"] + rect["width"]],
+                        session.output_format
+                    ))
+                    for rect in changed["rects"]
+                ]
+            else:
+                result["image"] = image_codecs.encode_image(session.array, session.output_format)
+            return result
+
+    def _region_id(self, session: ImageSession, region: Dict) -> RegionId:
+        """Identity of a region once clamped to the image, as it would be applied."""
+        h, w = session.array.shape[:2]
+        x = max(0, min(int(region["left"]), w - 1))
+        y = max(0, min(int(region["top"]), h - 1))
+        width = max(1, min(int(region["width"] * region.get("scaleX", 1)), w - x))
+        height = max(1, min(int(region["height"] * region.get("scaleY", 1)), h - y))
+        channels = pixel_format.resolve_channels(session.array, region.get("channels", session.channels))
+        if channels is None:
+            channels = range(pixel_format.channel_count(session.array))
+        return x, y, width, height, tuple(channels)
+
+    def _apply(self, session: ImageSession, add: List[Dict], remove: List[Dict]) -> Dict:
+        """Process added regions and re-process removed ones, skipping no-ops."""
+        rects = []
+        removed = 0
+        for region in remove:
+            rid = self._region_id(session, region)
+            applied = session.regions.pop(rid, None)
+            if applied is None:
+                continue
+            self._transform(session, applied)
+            rects.append(applied)
+            removed += 1
+        added = 0
+        for region in add:
+            rid = self._region_id(session, region)
+            if rid in session.regions:
+                continue
+            applied = self._transform(session, region)
+            session.regions[rid] = applied
+            rects.append(applied)
+            added += 1
+        return {
+            "added": added,
+            "removed": removed,
+            "rects": [{k: r[k] for k in ("left", "top", "width", "height")} for r in rects],
+        }
+
+    def _transform(self, session: ImageSession, region: Dict) -> Dict:
+        return self.image_service._apply_region(
+            session.array, region, session.key, session.nonce, session.algorithm, session.operation,
+            channels=session.channels
+        )
+
+    def _evict(self):
+        """Drop idle sessions, then least recently used ones over the limits (lock held)."""
+        now = time.monotonic()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_used > self.ttl]:
+            self._bytes -= self._sessions.pop(session_id).nbytes
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            session_id, session = self._sessions.popitem(last=False)
+            self._bytes -= session.nbytes
+            logger.info(f"Evicted image session {session_id[:8]} ({session.nbytes} bytes)")
@@ -0,0 +1,220 @@
+import os
+import stat
+import time
+import struct
+import sqlite3
+import logging
+import tempfile
+import threading
+from typing import Callable, Optional, Sequence, Tuple
+
+import blake3
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Host secret that keys every lookup id and entry secret. Without it the
+# cached entries cannot be matched to passwords, so the cache file does not
+# offer a faster-than-PBKDF2 way of guessing them.
+SECRET_LENGTH = 32
+# Expired and excess entries are purged every this many writes
+_PURGE_INTERVAL = 64
+_LENGTH = struct.Struct(">I")
+
+
+def default_dir() -> str:
+    """Per-user directory for host-local state, under the system temp dir."""
+    return os.path.join(tempfile.gettempdir(), f"securecrypt-{os.getuid()}")
+
+
+def check_private(st: os.stat_result, path: str):
+    """Raise PermissionError unless ``st`` belongs to this user and grants nothing to others."""
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(f"{path} must be owned by this user and not accessible to others")
+
+
+def private_dir(path: str) -> str:
+    """Create ``path`` with mode 0700, or check that the existing directory is private."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"{path} is not a directory")
+    check_private(st, path)
+    return path
+
+
+def private_file(path: str):
+    """Create an empty file with mode 0600 if missing, and check that it is private."""
+    fd = os.open(path, os.O_RDONLY | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    try:
+        check_private(os.fstat(fd), path)
+    finally:
+        os.close(fd)
+
+
+def host_secret(path: str) -> bytes:
+    """
+    Read the host secret stored at ``path``, creating it on first use.
+
+    The file is created with mode 0600 and an existing one is only trusted
+    if it belongs to this user and is not accessible to others; anything
+    else raises PermissionError, so callers fail closed.
+    """
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+    except FileExistsError:
+        secret = _read_secret(path)
+        if len(secret) != SECRET_LENGTH:
+            # Another worker is still writing it
+            time.sleep(0.05)
+            secret = _read_secret(path)
+    else:
+        secret = os.urandom(SECRET_LENGTH)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secret)
+    if len(secret) != SECRET_LENGTH:
+        raise ValueError(f"Corrupted host secret {path}")
+    return secret
+
+
+def _read_secret(path: str) -> bytes:
+    fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    with os.fdopen(fd, "rb") as f:
+        check_private(os.fstat(f.fileno()), path)
+        return f.read()
+
+
+class SharedKeyCache:
+    """
+    Cache of derived keys shared by every worker process on the host.
+
+    Entries live in a local SQLite database (WAL mode, so readers never block
+    each other) and are sealed with AES-GCM under a secret derived from the
+    request itself: an entry can only be opened by a caller who already knows
+    the password, and the lookup ids reveal nothing about it. Entries expire
+    after the TTL and the oldest are dropped beyond ``max_entries``.
+
+    Any database error degrades to a cache miss; deriving the key is always
+    the fallback. If the database or the host secret is not private to this
+    user, the cache disables itself.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = None, max_entries: int = None):
+        # A configured path is used as given; the default lives in a private per-user directory
+        self._private_dir = None if path or settings.KEY_CACHE_PATH else default_dir()
+        self.path = path or settings.KEY_CACHE_PATH or os.path.join(self._private_dir, "keycache.sqlite3")
+        self.ttl = settings.KEY_CACHE_TTL if ttl is None else ttl
+        self.max_entries = settings.KEY_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self._local = threading.local()
+        self._secret: Optional[bytes] = None
+        self._writes = 0
+        self.disabled = False
+
+    # Connection and host secret
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and process; connections must not cross a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # The host secret (read first) has already checked the default directory
+            private_file(self.path)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS keys (id TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS keys_expires ON keys (expires)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _host_secret(self) -> bytes:
+        """Read the host secret, creating it on first use (readable by this user only)."""
+        if self._secret is None:
+            if self._private_dir:
+                private_dir(self._private_dir)
+            self._secret = host_secret(self.path + ".secret")
+        return self._secret
+
+    def _lookup(self, namespace: str, parts: Sequence[bytes]) -> Tuple[str, bytes]:
+        """Derive (lookup id, entry secret) from the namespace and request parts."""
+        hasher = blake3.blake3(key=self._host_secret())
+        for part in (namespace.encode("utf-8"), *parts):
+            hasher.update(_LENGTH.pack(len(part)))
+            hasher.update(part)
+        digest = hasher.digest(length=64)
+        return digest[:32].hex(), digest[32:]
+
+    # Public API
+
+    def get_or_derive(self, namespace: str, parts: Sequence[bytes], derive: Callable[[], bytes]) -> bytes:
+        """
+        Return the cached key for the request, deriving and storing it on a miss.
+
+        :param namespace: KDF name and parameters that are not part of ``parts``.
+        :param parts: Every input of the derivation (password, salt, length...).
+        :param derive: Callable computing the key on a miss.
+        :return: The derived key.
+        """
+        if self.disabled:
+            return derive()
+        try:
+            lookup_id, secret = self._lookup(namespace, parts)
+            row = self._connection().execute(
+                "SELECT value FROM keys WHERE id = ? AND expires > ?", (lookup_id, time.time())
+            ).fetchone()
+            if row is not None:
+                sealed = row[0]
+                return AESGCM(secret).decrypt(sealed[:12], sealed[12:], lookup_id.encode())
+        except PermissionError as e:
+            logger.error(f"Key cache disabled: {e}")
+            self.disabled = True
+            return derive()
+        except Exception as e:
+            logger.warning(f"Key cache lookup failed: {e}")
+            return derive()
+
+        key = derive()
+        try:
+            nonce = os.urandom(12)
+            sealed = nonce + AESGCM(secret).encrypt(nonce, key, lookup_id.encode())
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO keys (id, value, expires) VALUES (?, ?, ?)",
+                (lookup_id, sealed, time.time() + self.ttl),
+            )
+            self._writes += 1
+            if self._writes % _PURGE_INTERVAL == 0:
+                self._purge(conn)
+        except Exception as e:
+            logger.warning(f"Key cache store failed: {e}")
+        return key
+
+    def _purge(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM keys WHERE expires <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM keys WHERE id IN (SELECT id FROM keys ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        """Drop every entry."""
+        self._connection().execute("DELETE FROM keys")
+
+
+_cache: Optional[SharedKeyCache] = None
+_cache_lock = threading.Lock()
+
+
+def cached_key(namespace: str, parts: Sequence[bytes], derive: Callable[[], bytes]) -> bytes:
+    """Derive a key through the shared cache, or directly when the cache is disabled."""
+    global _cache
+    if not settings.KEY_CACHE_ENABLED:
+        return derive()
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SharedKeyCache()
+    return _cache.get_or_derive(namespace, parts, derive)
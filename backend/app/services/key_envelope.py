@@ -0,0 +1,60 @@
+import struct
+from typing import BinaryIO, Dict
+
+# Key-wrapped stream format
+#
+#   prefix:  magic(4) | version(1) | wrap method(1) | slot size(2) | wrapped key length(2)
+#   slot:    wrapped data key, zero-padded to the slot size
+#   payload: chunked AES-GCM stream (see chunked_format) under the random data key
+#
+# The payload never depends on the password or key pair that wraps the data
+# key, so changing them only rewrites the prefix and slot. The slot is
+# reserved larger than needed so a rewrap normally fits in place.
+MAGIC = b"SCKW"
+VERSION = 1
+PREFIX = struct.Struct(">4sBBHH")
+DATA_KEY_SIZE = 32
+
+WRAP_METHODS = {"password": 1, "rsa": 2, "ecc": 3}
+WRAP_METHOD_NAMES = {v: k for k, v in WRAP_METHODS.items()}
+
+
+def build_prefix(method: str, wrapped_key: bytes, slot_size: int) -> bytes:
+    """Serialize the prefix and slot for a wrapped data key."""
+    slot_size = max(slot_size, len(wrapped_key))
+    if slot_size > 0xFFFF:
+        raise ValueError("Wrapped key is too large")
+    prefix = PREFIX.pack(MAGIC, VERSION, WRAP_METHODS[method], slot_size, len(wrapped_key))
+    return prefix + wrapped_key + bytes(slot_size - len(wrapped_key))
+
+
+def is_wrapped(data: bytes) -> bool:
+    """Whether the data starts with a key-wrapped stream prefix."""
+    return data[:4] == MAGIC
+
+
+def read_prefix(src: BinaryIO) -> Dict:
+    """
+    Read the prefix and slot from the start of a key-wrapped stream.
+
+    Leaves ``src`` positioned at the payload. Raises ValueError when the data
+    is not a key-wrapped stream.
+    """
+    head = src.read(PREFIX.size)
+    if len(head) < PREFIX.size:
+        raise ValueError("Key-wrapped stream header is truncated")
+    magic, version, method_id, slot_size, key_length = PREFIX.unpack(head)
+    if magic != MAGIC:
+        raise ValueError("Not a key-wrapped stream")
+    if version != VERSION:
+        raise ValueError(f"Unsupported key-wrapped stream version: {version}")
+    if method_id not in WRAP_METHOD_NAMES or key_length > slot_size:
+        raise ValueError("Corrupted key-wrapped stream header")
+    slot = src.read(slot_size)
+    if len(slot) < slot_size:
+        raise ValueError("Key-wrapped stream header is truncated")
+    return {
+        "method": WRAP_METHOD_NAMES[method_id],
+        "wrapped_key": slot[:key_length],
+        "length": PREFIX.size + slot_size,
+    }
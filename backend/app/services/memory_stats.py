@@ -0,0 +1,221 @@
+import os
+import time
+import logging
+import threading
+import tracemalloc
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import psutil
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Per-request memory accounting
+#
+# Every request records the worker RSS at its start, at each checkpoint and
+# at its end, so the stage that grew memory shows up in the log even when the
+# worker is OOM-killed right after. A sampled fraction of requests is also
+# traced with tracemalloc, which adds the Python (and numpy) bytes allocated
+# and peaking in each stage, and the source lines holding them. Only one
+# request per worker is traced at a time; concurrent requests still add to
+# its numbers, so treat them as upper bounds on a busy worker.
+
+_process = psutil.Process(os.getpid())
+_current: ContextVar[Optional["RequestMemory"]] = ContextVar("request_memory", default=None)
+_trace_lock = threading.Lock()
+_tracing = False
+_TOP_LINES = 3
+
+
+def rss() -> int:
+    """Resident set size of this worker in bytes."""
+    return _process.memory_info().rss
+
+
+class RequestMemory:
+    """Memory record of one request, filled in by ``checkpoint``."""
+
+    def __init__(self, endpoint: str, traced: bool):
+        self.endpoint = endpoint
+        self.traced = traced
+        self.rss_start = self._rss_last = self.rss_peak = rss()
+        self.stages: List[Dict] = []
+        self.traced_peak = 0
+        self._token = None
+        if traced:
+            tracemalloc.reset_peak()
+            self._traced_start = self._traced_last = tracemalloc.get_traced_memory()[0]
+            self._snapshot = _snapshot()
+
+    def checkpoint(self, name: str):
+        """Close the stage that started at the previous checkpoint (or the request start)."""
+        now = rss()
+        stage = {"stage": name, "rss_delta": now - self._rss_last, "rss": now}
+        self._rss_last = now
+        self.rss_peak = max(self.rss_peak, now)
+        if self.traced:
+            current, peak = tracemalloc.get_traced_memory()
+            stage["alloc_delta"] = current - self._traced_last
+            stage["alloc_peak"] = peak - self._traced_last
+            self.traced_peak = max(self.traced_peak, peak - self._traced_start)
+            snapshot = _snapshot()
+            stage["top"] = [
+                f"{diff.traceback[0].filename}:{diff.traceback[0].lineno} {diff.size_diff:+d}"
+                for diff in snapshot.compare_to(self._snapshot, "lineno")[:_TOP_LINES]
+            ]
+            self._snapshot = snapshot
+            tracemalloc.reset_peak()
+            self._traced_last = current
+        self.stages.append(stage)
+        if stage["rss_delta"] >= settings.MEMORY_LOG_THRESHOLD:
+            logger.warning(
+                f"{self.endpoint}: stage {name} grew RSS by {stage['rss_delta']} bytes to {now} bytes"
+            )
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+
+
+def begin(endpoint: str, traced: bool = False) -> RequestMemory:
+    """Start accounting the current request; ``traced`` is honoured only if no other request is traced."""
+    global _tracing
+    if traced:
+        with _trace_lock:
+            traced, _tracing = not _tracing, True
+        if traced and not tracemalloc.is_tracing():
+            tracemalloc.start(settings.MEMORY_TRACE_FRAMES)
+    record = RequestMemory(endpoint, traced)
+    record._token = _current.set(record)
+    return record
+
+
+def end(record: RequestMemory) -> RequestMemory:
+    """Finish accounting the request; the remainder becomes the "response" stage."""
+    global _tracing
+    record.checkpoint("response")
+    _current.reset(record._token)
+    if record.traced:
+        tracemalloc.stop()
+        with _trace_lock:
+            _tracing = False
+    return record
+
+
+def checkpoint(name: str):
+    """Record a stage boundary for the current request; a no-op outside accounted requests."""
+    record = _current.get()
+    if record is not None:
+        record.checkpoint(name)
+
+
+class LeakDetector:
+    """
+    Flags steady RSS growth across requests.
+
+    The RSS after each request is collected into windows of ``window``
+    requests. A window is flagged when RSS grew by at least ``min_growth``
+    bytes across it along a near-linear trend (correlation with the request
+    count of at least ``min_correlation``), which separates leaks from the
+    one-off growth of warming caches and allocator arenas.
+    """
+
+    def __init__(self, window: int = None, min_growth: int = None, min_correlation: float = None):
+        self.window = window or settings.MEMORY_LEAK_WINDOW
+        self.min_growth = min_growth or settings.MEMORY_LEAK_MIN_GROWTH
+        self.min_correlation = min_correlation or settings.MEMORY_LEAK_MIN_CORRELATION
+        self.samples: deque = deque(maxlen=self.window)
+        self.requests = 0
+        self.flagged_windows = 0
+        self.last_window: Optional[Dict] = None
+
+    def record(self, rss_after: int):
+        self.samples.append(rss_after)
+        self.requests += 1
+        if self.requests % self.window == 0:
+            self._check()
+
+    def _check(self):
+        n = len(self.samples)
+        mean_x = (n - 1) / 2
+        mean_y = sum(self.samples) / n
+        sxx = sum((i - mean_x) ** 2 for i in range(n))
+        syy = sum((y - mean_y) ** 2 for y in self.samples)
+        sxy = sum((i - mean_x) * (y - mean_y) for i, y in enumerate(self.samples))
+        slope = sxy / sxx
+        correlation = sxy / (sxx * syy) ** 0.5 if syy else 0.0
+        growth = slope * (n - 1)
+        leaking = growth >= self.min_growth and correlation >= self.min_correlation
+        self.last_window = {
+            "requests": self.requests,
+            "growth": int(growth),
+            "bytes_per_request": round(slope, 1),
+            "correlation": round(correlation, 3),
+            "leaking": leaking,
+            "checked": time.time(),
+        }
+        if leaking:
+            self.flagged_windows += 1
+            logger.warning(
+                f"Possible memory leak: RSS grew {int(growth)} bytes over the last {n} requests"
+                f" ({slope:.0f} bytes/request, correlation {correlation:.2f})"
+            )
+
+    def status(self) -> Dict:
+        return {"requests": self.requests, "flagged_windows": self.flagged_windows, "last_window": self.last_window}
+
+
+class MemoryStats:
+    """Per-endpoint aggregates of request memory records for this worker."""
+
+    def __init__(self, leak_detector: LeakDetector = None):
+        self.endpoints: Dict[str, Dict] = {}
+        self.leak_detector = leak_detector or LeakDetector()
+        self._lock = threading.Lock()
+
+    def add(self, record: RequestMemory):
+        growth = record.rss_peak - record.rss_start
+        with self._lock:
+            entry = self.endpoints.setdefault(record.endpoint, {
+                "requests": 0, "traced": 0, "max_rss_growth": 0, "total_rss_growth": 0,
+                "max_traced_peak": 0, "stages": {},
+            })
+            entry["requests"] += 1
+            entry["total_rss_growth"] += growth
+            entry["max_rss_growth"] = max(entry["max_rss_growth"], growth)
+            if record.traced:
+                entry["traced"] += 1
+                entry["max_traced_peak"] = max(entry["max_traced_peak"], record.traced_peak)
+            for stage in record.stages:
+                agg = entry["stages"].setdefault(stage["stage"], {"count": 0, "max_rss_delta": 0})
+                agg["count"] += 1
+                agg["max_rss_delta"] = max(agg["max_rss_delta"], stage["rss_delta"])
+                if "alloc_peak" in stage and stage["alloc_peak"] >= agg.get("max_alloc_peak", -1):
+                    agg["max_alloc_peak"] = stage["alloc_peak"]
+                    agg["top"] = stage["top"]
+            self.leak_detector.record(record.stages[-1]["rss"])
+        if growth >= settings.MEMORY_LOG_THRESHOLD:
+            breakdown = ", ".join(f"{s['stage']} {s['rss_delta']:+d}" for s in record.stages)
+            logger.warning(f"{record.endpoint}: RSS peaked {growth} bytes above its start ({breakdown})")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            endpoints = {
+                name: {**entry, "stages": {k: dict(v) for k, v in entry["stages"].items()}}
+                for name, entry in self.endpoints.items()
+            }
+        return {
+            "pid": os.getpid(),
+            "rss": rss(),
+            "endpoints": endpoints,
+            "leak": self.leak_detector.status(),
+        }
+
+
+memory_stats = MemoryStats()
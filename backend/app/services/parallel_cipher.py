@@ -0,0 +1,141 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from cryptography.hazmat.primitives.ciphers import Cipher, modes
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Parallel block cipher engine
+#
+# CTR keystream segments only depend on their counter offset, and CBC/ECB
+# decryption of a block only needs the previous ciphertext block, so large
+# buffers can be split into block-aligned segments processed concurrently.
+# OpenSSL releases the GIL while it runs, so the segments use every core.
+# Each segment is written straight into one preallocated output buffer and
+# the result is byte-identical to a single update() over the whole buffer.
+
+
+def _segments(length: int, block_size: int, workers: int) -> List[Tuple[int, int]]:
+    """Split ``length`` bytes into block-aligned (start, end) ranges, one per worker at most."""
+    size = max(settings.PARALLEL_CIPHER_MIN_SEGMENT, -(-length // workers))
+    size = -(-size // block_size) * block_size
+    return [(start, min(start + size, length)) for start in range(0, length, size)]
+
+
+def _workers(length: int, workers: Optional[int]) -> int:
+    if length < settings.PARALLEL_CIPHER_MIN_SIZE:
+        return 1
+    return workers or settings.PARALLEL_CIPHER_WORKERS or os.cpu_count() or 1
+
+
+def _run(data: bytes, block_size: int, workers: Optional[int],
+         make_context: Callable[[int], object]) -> bytearray:
+    """
+    Process ``data`` in segments with contexts created by ``make_context(start)``.
+
+    Every segment but the last writes with update_into into its slice of the
+    output; update_into wants room for one block less a byte past the input,
+    which the next segment's slice provides. That slack is only safe because
+    the segments are block-aligned and the contexts do not pad, so each
+    writes exactly its own bytes; both are checked. The last segment uses update.
+    """
+    length = len(data)
+    ranges = _segments(length, block_size, _workers(length, workers))
+    if any(start % block_size or end % block_size for start, end in ranges[:-1]):
+        raise ValueError("Parallel cipher segments must be block-aligned")
+    output = bytearray(length)
+    if len(ranges) <= 1:
+        context = make_context(0)
+        output[:] = context.update(data) + context.finalize()
+        return output
+
+    source = memoryview(data)
+    target = memoryview(output)
+
+    def process(bounds: Tuple[int, int]):
+        start, end = bounds
+        context = make_context(start)
+        if end == length:
+            target[start:end] = context.update(source[start:end]) + context.finalize()
+        else:
+            written = context.update_into(source[start:end], target[start:end + block_size - 1])
+            context.finalize()
+            if written != end - start:
+                # Bytes past ``end`` belong to the next segment
+                raise ValueError(f"Cipher context wrote {written} bytes for a {end - start} byte segment")
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            # list() re-raises the first worker exception
+            list(executor.map(process, ranges))
+    finally:
+        source.release()
+        target.release()
+    return output
+
+
+def ctr_xcrypt(algorithm, iv: bytes, data: bytes, workers: Optional[int] = None) -> bytearray:
+    """
+    Encrypt or decrypt with CTR mode, segments in parallel.
+
+    :param algorithm: Block cipher instance (e.g. algorithms.AES(key)).
+    :param iv: Initial counter block.
+    :param data: Plaintext or ciphertext.
+    :param workers: Threads to use (defaults to settings.PARALLEL_CIPHER_WORKERS or the CPU count).
+    :return: The transformed data.
+    """
+    block_size = algorithm.block_size // 8
+    counter = int.from_bytes(iv, "big")
+    modulus = 1 << (8 * block_size)
+
+    def make_context(start: int):
+        # The counter block wraps around like OpenSSL's big-endian increment
+        block = ((counter + start // block_size) % modulus).to_bytes(block_size, "big")
+        return Cipher(algorithm, modes.CTR(block)).encryptor()
+
+    return _run(data, block_size, workers, make_context)
+
+
+def cbc_decrypt(algorithm, iv: bytes, ciphertext: bytes, workers: Optional[int] = None) -> bytearray:
+    """
+    Decrypt CBC ciphertext, segments in parallel.
+
+    Each segment's IV is the ciphertext block preceding it. Padding is left
+    for the caller to remove.
+
+    :param algorithm: Block cipher instance (e.g. algorithms.AES(key)).
+    :param iv: Initialization vector.
+    :param ciphertext: Block-aligned ciphertext.
+    :param workers: Threads to use (defaults to settings.PARALLEL_CIPHER_WORKERS or the CPU count).
+    :return: The padded plaintext.
+    """
+    block_size = algorithm.block_size // 8
+
+    def make_context(start: int):
+        segment_iv = iv if start == 0 else bytes(ciphertext[start - block_size:start])
+        return Cipher(algorithm, modes.CBC(segment_iv)).decryptor()
+
+    return _run(ciphertext, block_size, workers, make_context)
+
+
+def ecb_crypt(algorithm, data: bytes, encrypt: bool, workers: Optional[int] = None) -> bytearray:
+    """
+    Encrypt or decrypt block-aligned data with ECB mode, segments in parallel.
+
+    :param algorithm: Block cipher instance (e.g. algorithms.AES(key)).
+    :param data: Block-aligned plaintext or ciphertext.
+    :param encrypt: True to encrypt, False to decrypt.
+    :param workers: Threads to use (defaults to settings.PARALLEL_CIPHER_WORKERS or the CPU count).
+    :return: The transformed data.
+    """
+    block_size = algorithm.block_size // 8
+    cipher = Cipher(algorithm, modes.ECB())
+
+    def make_context(start: int):
+        return cipher.encryptor() if encrypt else cipher.decryptor()
+
+    return _run(data, block_size, workers, make_context)
@@ -0,0 +1,99 @@
+import logging
+from typing import List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Modes processed in their native layout and bit depth
+NATIVE_MODES = ("L", "LA", "RGB", "RGBA", "I;16", "I;16L", "I;16B")
+
+# Modes whose alpha channel is the last channel
+ALPHA_MODES = ("LA", "RGBA")
+
+
+def native_array(img: Image.Image) -> np.ndarray:
+    """
+    Decode an image into an array in its native channel layout and bit depth.
+
+    Grayscale, grayscale+alpha, RGB, RGBA and 16-bit grayscale are used as-is.
+    Other modes (palette, bilevel, CMYK, ...) have no byte layout that survives
+    re-encoding, so they are converted to RGB, or RGBA when they carry
+    transparency.
+    """
+    if img.mode == "I":
+        # Older Pillow releases decode 16-bit grayscale PNGs as 32-bit "I";
+        # keep them 16-bit instead of clipping them to 8-bit RGB
+        array = np.array(img)
+        if array.size and 0 <= array.min() and array.max() <= 0xFFFF:
+            return array.astype(np.uint16)
+    if img.mode not in NATIVE_MODES:
+        has_alpha = img.mode == "PA" or "transparency" in img.info
+        target = "RGBA" if has_alpha else "RGB"
+        logger.info(f"Converting {img.mode} image to {target}")
+        img = img.convert(target)
+    return np.array(img)
+
+
+def channel_count(array: np.ndarray) -> int:
+    """Number of channels of a decoded image array."""
+    return 1 if array.ndim == 2 else array.shape[2]
+
+
+def default_channels(array: np.ndarray, encrypt_alpha: bool = False) -> Optional[List[int]]:
+    """
+    Channels to process when the caller did not choose any.
+
+    The alpha channel of LA and RGBA images is left in the clear unless
+    ``encrypt_alpha`` is set. None means all channels.
+    """
+    count = channel_count(array)
+    if encrypt_alpha or count not in (2, 4):
+        return None
+    return list(range(count - 1))
+
+
+def resolve_channels(array: np.ndarray, channels: Optional[Sequence[int]]) -> Optional[List[int]]:
+    """
+    Validate a channel selection against an image array.
+
+    Returns None when every channel is selected, so callers can use a plain slice.
+    """
+    if channels is None:
+        return default_channels(array)
+    count = channel_count(array)
+    selected = sorted(set(int(c) for c in channels))
+    if not selected or selected[0] < 0 or selected[-1] >= count:
+        raise ValueError(f"Channels must be between 0 and {count - 1}, got {list(channels)}")
+    if len(selected) == count:
+        return None
+    return selected
+
+
+def read_region(array: np.ndarray, x: int, y: int, width: int, height: int,
+                channels: Optional[List[int]] = None) -> bytes:
+    """Return the raw bytes of a region, restricted to the selected channels."""
+    segment = array[y:y+height, x:x+width]
+    if channels is not None:
+        segment = segment[..., channels]
+    return np.ascontiguousarray(segment).tobytes()
+
+
+def write_region(array: np.ndarray, x: int, y: int, width: int, height: int, data: bytes,
+                 channels: Optional[List[int]] = None) -> None:
+    """
+    Write processed bytes back into a region of the array in place.
+
+    Extra trailing bytes (e.g. block cipher padding) are ignored.
+    """
+    target = array[y:y+height, x:x+width]
+    shape = target.shape if channels is None else target.shape[:2] + (len(channels),)
+    size = int(np.prod(shape)) * array.dtype.itemsize
+    if len(data) < size:
+        raise ValueError(f"Processed region is {len(data)} bytes, expected {size}")
+    patch = np.frombuffer(data, dtype=array.dtype, count=size // array.dtype.itemsize).reshape(shape)
+    if channels is None:
+        array[y:y+height, x:x+width] = patch
+    else:
+        array[y:y+height, x:x+width, channels] = patch
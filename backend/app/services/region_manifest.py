@@ -0,0 +1,177 @@
+import json
+import hmac
+import hashlib
+import logging
+from typing import List, Dict, Optional
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+logger = logging.getLogger(__name__)
+
+# iTXt keyword under which the manifest is stored inside PNG files
+MANIFEST_KEYWORD = "securecrypt:regions"
+MANIFEST_VERSION = 1
+
+# Algorithm names of the partial-encrypt form fields, mapped to the names used
+# by /image/process and auto-decrypt where both produce the same keystream from
+# the same key (RC4 only). The partial logistic variants take x0 and mu from
+# the form, unlike "Logistic XOR" and "Logistic Tiled", so they get names of
+# their own that auto-decrypt never matches.
+_ALGORITHM_NAMES = {
+    "rc4": "RC4",
+    "logistic": "partial-logistic",
+    "logistic-tiled": "partial-logistic-tiled",
+}
+
+
+def _canonical(manifest: Dict) -> bytes:
+    """Serialize the manifest fields covered by the MAC in a stable order."""
+    body = {k: v for k, v in manifest.items() if k != "mac"}
+    return json.dumps(body, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def canonical_algorithm(algorithm: str) -> str:
+    """Normalize an algorithm name so both image endpoints name a cipher the same way."""
+    return _ALGORITHM_NAMES.get(algorithm.lower(), algorithm)
+
+
+def _mac(manifest: Dict, mac_key: bytes) -> str:
+    """
+    Compute the truncated HMAC-SHA256 tag of a manifest.
+
+    ``mac_key`` is always the key bytes the region cipher consumed (the hex
+    key of /image/process, the derived or raw key of partial-encrypt), so a
+    manifest verifies with the key auto-decrypt is given for that cipher.
+    """
+    # Domain-separate the MAC key from the encryption key it is derived from
+    key = hashlib.sha256(b"securecrypt-manifest" + mac_key).digest()
+    return hmac.new(key, _canonical(manifest), hashlib.sha256).hexdigest()[:32]
+
+
+def build_manifest(regions: List[Dict], algorithm: str, mac_key: Optional[bytes] = None,
+                   channels: Optional[List[int]] = None) -> Dict:
+    """
+    Build a compact manifest describing the regions that were processed.
+
+    Parameters:
+    - regions: Clamped regions as applied, each with left, top, width, height and
+      an optional keystream offset in bytes ("offset")
+    - algorithm: Algorithm name used for the regions (stored in canonical form)
+    - mac_key: Key bytes of the region cipher, used to authenticate the manifest
+    - channels: Channel indices that were processed, if not all of them
+
+    Returns:
+    - Manifest dictionary ready to be serialized
+    """
+    manifest = {
+        "v": MANIFEST_VERSION,
+        "alg": canonical_algorithm(algorithm),
+        "r": [
+            [int(r["left"]), int(r["top"]), int(r["width"]), int(r["height"]), int(r.get("offset", 0))]
+            for r in regions
+        ],
+    }
+    if channels is not None:
+        manifest["ch"] = [int(c) for c in channels]
+    if mac_key:
+        manifest["mac"] = _mac(manifest, mac_key)
+    return manifest
+
+
+def serialize_manifest(manifest: Dict) -> str:
+    """Serialize a manifest to its compact JSON form."""
+    return json.dumps(manifest, separators=(",", ":"))
+
+
+def parse_manifest(text: str) -> Dict:
+    """
+    Parse and validate a serialized manifest.
+
+    Raises ValueError when the manifest is malformed or of an unknown version.
+    """
+    try:
+        manifest = json.loads(text)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid region manifest: {e}")
+    if not isinstance(manifest, dict) or manifest.get("v") != MANIFEST_VERSION:
+        raise ValueError("Unsupported region manifest version")
+    if not isinstance(manifest.get("alg"), str):
+        raise ValueError("Region manifest algorithm must be a string")
+    entries = manifest.get("r")
+    if not isinstance(entries, list) or not all(
+        isinstance(e, list) and len(e) == 5 and all(isinstance(n, int) for n in e)
+        for e in entries
+    ):
+        raise ValueError("Region manifest entries must be [left, top, width, height, offset]")
+    channels = manifest.get("ch")
+    if channels is not None and not (
+        isinstance(channels, list) and channels and all(isinstance(c, int) for c in channels)
+    ):
+        raise ValueError("Region manifest channels must be a list of channel indices")
+    return manifest
+
+
+def algorithm_matches(manifest: Dict, algorithm: str) -> bool:
+    """Whether a manifest was written for the given algorithm."""
+    return canonical_algorithm(manifest["alg"]) == canonical_algorithm(algorithm)
+
+
+def verify_manifest(manifest: Dict, mac_key: Optional[bytes], algorithm: Optional[str] = None,
+                    allow_unauthenticated: bool = False) -> bool:
+    """
+    Check that a manifest may be trusted for decrypting with the given key and algorithm.
+
+    Parameters:
+    - manifest: Parsed manifest
+    - mac_key: Key bytes of the region cipher
+    - algorithm: Requested algorithm; a manifest written for another one is rejected
+    - allow_unauthenticated: Accept a manifest without a MAC even though a key is
+      supplied (anyone can rewrite the region list of such a manifest)
+
+    Returns:
+    - True if the manifest can be used
+    """
+    if algorithm is not None and not algorithm_matches(manifest, algorithm):
+        return False
+    tag = manifest.get("mac")
+    if tag is None:
+        return allow_unauthenticated or not mac_key
+    if not mac_key or not isinstance(tag, str):
+        return False
+    return hmac.compare_digest(tag, _mac(manifest, mac_key))
+
+
+def manifest_regions(manifest: Dict) -> List[Dict]:
+    """Convert manifest entries back into region dictionaries."""
+    regions = [
+        {"left": x, "top": y, "width": w, "height": h, "offset": o, "scaleX": 1, "scaleY": 1}
+        for x, y, w, h, o in manifest["r"]
+    ]
+    if "ch" in manifest:
+        for region in regions:
+            region["channels"] = manifest["ch"]
+    return regions
+
+
+def png_info(manifest: Dict) -> PngInfo:
+    """Create PNG metadata carrying the manifest in a compressed iTXt chunk."""
+    info = PngInfo()
+    info.add_itxt(MANIFEST_KEYWORD, serialize_manifest(manifest), zip=True)
+    return info
+
+
+def read_manifest(img: Image.Image) -> Optional[Dict]:
+    """
+    Read an embedded manifest from a decoded image.
+
+    Returns None if the image carries no manifest or it cannot be parsed.
+    """
+    text = getattr(img, "text", None) or img.info
+    raw = text.get(MANIFEST_KEYWORD) if text else None
+    if raw is None:
+        return None
+    try:
+        return parse_manifest(str(raw))
+    except ValueError as e:
+        logger.warning(f"Ignoring embedded region manifest: {e}")
+        return None
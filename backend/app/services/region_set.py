@@ -0,0 +1,237 @@
+import base64
+import binascii
+import hashlib
+import json
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from app.core.config import settings
+
+# Region sets
+#
+# Regions are rows of an (N, 4) int32 array: left, top, width, height. The
+# packed wire form is the same rows as little-endian int32, 16 bytes per
+# region with no header, so thousands of regions parse with one frombuffer
+# instead of one dict (and one validation) each. Per-region channel
+# selections, which only the JSON form can carry, ride alongside the array.
+PACKED_DTYPE = np.dtype("<i4")
+REGION_SIZE = 4 * PACKED_DTYPE.itemsize
+_INT32 = np.iinfo(np.int32)
+# Sort keys are shifted by this much per group so one cumulative max runs over all groups
+_GROUP_STRIDE = 1 << 33
+
+
+class RegionSet:
+    """
+    Array-backed set of rectangular image regions.
+
+    Parameters:
+    - rects: (N, 4) integer array of left, top, width, height rows
+    - channels: Optional per-region channel selections (None entries use the request default)
+    """
+
+    def __init__(self, rects: np.ndarray, channels: Optional[List[Optional[List[int]]]] = None):
+        rects = np.asarray(rects)
+        if rects.size == 0:
+            rects = np.zeros((0, 4), dtype=np.int32)
+        if rects.ndim != 2 or rects.shape[1] != 4:
+            raise ValueError("Regions must be rows of left, top, width, height")
+        if len(rects) > settings.REGION_MAX_COUNT:
+            raise ValueError(f"Too many regions: {len(rects)} (at most {settings.REGION_MAX_COUNT})")
+        if rects.dtype != np.int32:
+            if rects.size and (rects.min() < _INT32.min or rects.max() > _INT32.max):
+                raise ValueError("Region coordinates are out of range")
+            rects = rects.astype(np.int32)
+        if channels is not None:
+            if len(channels) != len(rects):
+                raise ValueError("Per-region channels do not match the regions")
+            if all(c is None for c in channels):
+                channels = None
+        self.rects = rects
+        self.channels = channels
+
+    def __len__(self) -> int:
+        return len(self.rects)
+
+    # Parsing
+
+    @classmethod
+    def coerce(cls, regions: Union["RegionSet", Sequence[Dict]]) -> "RegionSet":
+        """Return ``regions`` as a RegionSet, converting a list of region dicts."""
+        return regions if isinstance(regions, RegionSet) else cls.from_dicts(regions)
+
+    @classmethod
+    def from_dicts(cls, regions: Sequence[Dict]) -> "RegionSet":
+        """
+        Build a region set from dicts with left, top, width and height keys.
+
+        Optional scaleX/scaleY factors are applied to width and height and the
+        result truncated, as the per-region code always did.
+        """
+        try:
+            values = [
+                (r["left"], r["top"], r["width"] * r.get("scaleX", 1), r["height"] * r.get("scaleY", 1))
+                for r in regions
+            ]
+            rects = np.array(values, dtype=np.float64).reshape(-1, 4)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError("Each region must be an object with numeric keys: left, top, width, height")
+        if not np.isfinite(rects).all():
+            raise ValueError("Region coordinates must be finite numbers")
+        channels = [r.get("channels") for r in regions]
+        return cls(np.trunc(rects).astype(np.int64), channels)
+
+    @classmethod
+    def from_string(cls, text: str) -> "RegionSet":
+        """Parse regions given as "x,y,width,height;x,y,width,height"."""
+        segments = [segment for segment in text.split(";") if segment.strip()]
+        for segment in segments:
+            if segment.count(",") != 3:
+                raise ValueError(f"Invalid region format: {segment}. Expected format: x,y,width,height")
+        try:
+            values = np.array(",".join(segments).split(","), dtype=np.int64) if segments else np.zeros(0)
+        except (ValueError, OverflowError):
+            # Find the offending segment for the error message
+            for segment in segments:
+                try:
+                    np.array(segment.split(","), dtype=np.int64)
+                except (ValueError, OverflowError):
+                    raise ValueError(f"Invalid region format: {segment}. Expected format: x,y,width,height")
+            raise
+        return cls(values.reshape(-1, 4))
+
+    @classmethod
+    def from_packed(cls, data: bytes) -> "RegionSet":
+        """Parse packed little-endian int32 left, top, width, height rows."""
+        if len(data) % REGION_SIZE:
+            raise ValueError(f"Packed regions must be a multiple of {REGION_SIZE} bytes")
+        return cls(np.frombuffer(data, dtype=PACKED_DTYPE).reshape(-1, 4).astype(np.int32))
+
+    @classmethod
+    def from_base64(cls, text: str) -> "RegionSet":
+        """Parse Base64-encoded packed regions."""
+        try:
+            data = base64.b64decode(text, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError("Packed regions are not valid Base64")
+        return cls.from_packed(data)
+
+    # Serialization
+
+    def to_packed(self) -> bytes:
+        return self.rects.astype(PACKED_DTYPE, copy=False).tobytes()
+
+    def to_dicts(self) -> List[Dict]:
+        regions = [
+            {"left": x, "top": y, "width": w, "height": h} for x, y, w, h in self.rects.tolist()
+        ]
+        if self.channels is not None:
+            for region, channels in zip(regions, self.channels):
+                if channels is not None:
+                    region["channels"] = channels
+        return regions
+
+    def fingerprint(self) -> str:
+        """Digest identifying the regions, for cache keys."""
+        digest = hashlib.sha256(self.to_packed())
+        if self.channels is not None:
+            digest.update(json.dumps(self.channels).encode())
+        return digest.hexdigest()
+
+    # Geometry
+
+    def clamp(self, image_width: int, image_height: int) -> "RegionSet":
+        """
+        Clamp every region to an image, keeping at least one pixel per region.
+
+        Matches the per-region clamping: the corner is moved into the image
+        and the size cut to what remains from there.
+        """
+        left, top, width, height = self.rects.astype(np.int64).T
+        x = np.clip(left, 0, image_width - 1)
+        y = np.clip(top, 0, image_height - 1)
+        width = np.maximum(1, np.minimum(width, image_width - x))
+        height = np.maximum(1, np.minimum(height, image_height - y))
+        return RegionSet(np.stack([x, y, width, height], axis=1), self.channels)
+
+    def overlap_pairs(self) -> np.ndarray:
+        """
+        Index pairs (i < j) of regions sharing at least one pixel, as an (M, 2) array.
+
+        Regions are sorted by left edge; each is compared only with the
+        regions starting before its right edge, so the cost follows the number
+        of horizontally overlapping pairs rather than N squared.
+        """
+        n = len(self.rects)
+        if n < 2:
+            return np.zeros((0, 2), dtype=np.int64)
+        rects = self.rects.astype(np.int64)
+        order = np.argsort(rects[:, 0], kind="stable")
+        left, top, width, height = rects[order].T
+        right, bottom = left + width, top + height
+        # Candidates of sorted region k are k + 1 .. end[k] - 1
+        end = np.searchsorted(left, right, side="left")
+        counts = np.maximum(end - np.arange(1, n + 1), 0)
+        first = np.repeat(np.arange(n), counts)
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        second = first + 1 + (np.arange(counts.sum()) - starts)
+        hit = (
+            (left[first] < right[second]) & (top[first] < bottom[second]) & (top[second] < bottom[first])
+            & (width[first] > 0) & (height[first] > 0) & (width[second] > 0) & (height[second] > 0)
+        )
+        pairs = np.stack([order[first[hit]], order[second[hit]]], axis=1)
+        return np.sort(pairs, axis=1)
+
+    def overlaps(self) -> bool:
+        return len(self.overlap_pairs()) > 0
+
+    def merged(self) -> "RegionSet":
+        """
+        Coalesce regions whose union is itself a rectangle.
+
+        Regions on the same rows (equal top and height) that overlap or touch
+        horizontally are joined, then regions on the same columns vertically,
+        until nothing changes. The covered pixels are exactly the same; masks
+        made of many adjacent strips collapse to a few rectangles. Per-region
+        channel selections cannot be merged.
+        """
+        if self.channels is not None:
+            raise ValueError("Regions with per-region channels cannot be merged")
+        rects = self.rects.astype(np.int64)
+        if (rects[:, 2:] <= 0).any():
+            raise ValueError("Regions to merge must have a positive width and height")
+        while True:
+            count = len(rects)
+            rects = _merge_runs(rects, axis=0)
+            rects = _merge_runs(rects, axis=1)
+            if len(rects) == count:
+                return RegionSet(rects)
+
+
+def _merge_runs(rects: np.ndarray, axis: int) -> np.ndarray:
+    """Join regions sharing their extent across ``axis`` whose spans along it overlap or touch."""
+    if len(rects) < 2:
+        return rects
+    start, size = rects[:, axis], rects[:, axis + 2]
+    other, other_size = rects[:, 1 - axis], rects[:, 3 - axis]
+    order = np.lexsort((start, other_size, other))
+    start, end = start[order], start[order] + size[order]
+    other, other_size = other[order], other_size[order]
+
+    new_group = np.ones(len(rects), dtype=bool)
+    new_group[1:] = (other[1:] != other[:-1]) | (other_size[1:] != other_size[:-1])
+    group = np.cumsum(new_group)
+    # Shifting by the group makes the running max of the end restart per group
+    shifted_end = np.maximum.accumulate(end + group * _GROUP_STRIDE)
+    run_start = new_group.copy()
+    run_start[1:] |= start[1:] + group[1:] * _GROUP_STRIDE > shifted_end[:-1]
+    runs = np.flatnonzero(run_start)
+    run_end = np.maximum.reduceat(end, runs)
+
+    merged = np.empty((len(runs), 4), dtype=np.int64)
+    merged[:, axis] = start[runs]
+    merged[:, axis + 2] = run_end - start[runs]
+    merged[:, 1 - axis] = other[runs]
+    merged[:, 3 - axis] = other_size[runs]
+    return merged
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import struct
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import blake3
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from app.core.config import settings
+from app.services import key_cache
+
+logger = logging.getLogger(__name__)
+
+# Mixed into every key; bump the version to invalidate every entry
+CACHE_CONTEXT = b"SecureCrypt 2025 result cache v2"
+_META_LENGTH = struct.Struct(">I")
+
+
+class CacheKey:
+    """
+    Content address of a request.
+
+    Derived from the request with BLAKE3 keyed by the host secret, split
+    into a public lookup id and a secret that encrypts the on-disk entry.
+    Neither reveals the request parameters, and without the host secret the
+    ids cannot be used to test guessed passwords. Disk entries can only be
+    read by someone who submits the same request (keys included).
+    """
+
+    __slots__ = ("id", "secret")
+
+    def __init__(self, lookup_id: str, secret: bytes):
+        self.id = lookup_id
+        self.secret = secret
+
+
+class ResultCache:
+    """
+    Two-tier cache of deterministic operation results.
+
+    Entries live in an in-memory LRU bounded by size and spill to an encrypted
+    on-disk tier, also bounded by size. Both tiers expire entries after a
+    short TTL. The disk tier lives in a directory only this user can access
+    (see key_cache.private_dir), which also holds the host secret keying the
+    entries; if either is not private the disk tier is disabled.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = None,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = None,
+        ttl: float = None,
+    ):
+        self.max_memory_bytes = settings.RESULT_CACHE_MEMORY_BYTES if max_memory_bytes is None else max_memory_bytes
+        self.max_disk_bytes = settings.RESULT_CACHE_DISK_BYTES if max_disk_bytes is None else max_disk_bytes
+        self.ttl = settings.RESULT_CACHE_TTL if ttl is None else ttl
+        self.disk_dir = disk_dir or settings.RESULT_CACHE_DIR or os.path.join(key_cache.default_dir(), "results")
+        self._secret: Optional[bytes] = None
+        self._memory: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_index: Optional["OrderedDict[str, Tuple[float, int]]"] = None
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+    def _host_secret(self) -> bytes:
+        """Secret keying the cache keys, shared through the disk directory."""
+        if self._secret is None:
+            with self._lock:
+                if self._secret is None:
+                    self._secret = self._load_secret()
+        return self._secret
+
+    def _load_secret(self) -> bytes:
+        if self.max_disk_bytes > 0:
+            try:
+                key_cache.private_dir(self.disk_dir)
+                return key_cache.host_secret(os.path.join(self.disk_dir, ".secret"))
+            except (OSError, ValueError) as e:
+                logger.error(f"Result cache disk tier disabled: {e}")
+                self.max_disk_bytes = 0
+        # Memory-only entries never leave this process
+        return os.urandom(key_cache.SECRET_LENGTH)
+
+    def make_key(self, namespace: str, data: bytes, params: Dict[str, Any]) -> CacheKey:
+        """
+        Derive the cache key of a request.
+
+        Parameters:
+        - namespace: Operation name, keeps different endpoints apart
+        - data: Input payload (e.g. the decoded image bytes)
+        - params: Every parameter that influences the result, secrets included
+
+        Returns:
+        - CacheKey with the lookup id and the entry encryption secret
+        """
+        header = json.dumps([namespace, params], sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+        hasher = blake3.blake3(key=self._host_secret())
+        hasher.update(CACHE_CONTEXT)
+        hasher.update(_META_LENGTH.pack(len(header)))
+        hasher.update(header)
+        hasher.update(data)
+        digest = hasher.digest(length=64)
+        return CacheKey(digest[:32].hex(), digest[32:])
+
+    # Entry encoding: meta length | meta JSON | value
+
+    @staticmethod
+    def _pack(value: bytes, meta: Optional[Dict]) -> bytes:
+        meta_bytes = json.dumps(meta).encode("utf-8") if meta is not None else b""
+        return _META_LENGTH.pack(len(meta_bytes)) + meta_bytes + value
+
+    @staticmethod
+    def _unpack(blob: bytes) -> Tuple[bytes, Optional[Dict]]:
+        (length,) = _META_LENGTH.unpack_from(blob)
+        start = _META_LENGTH.size
+        meta = json.loads(blob[start:start + length]) if length else None
+        return blob[start + length:], meta
+
+    def get(self, key: CacheKey) -> Optional[Tuple[bytes, Optional[Dict]]]:
+        """Return (value, meta) for a key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key.id)
+            if entry is not None:
+                expires, blob = entry
+                if expires > now:
+                    self._memory.move_to_end(key.id)
+                    return self._unpack(blob)
+                self._drop_memory(key.id)
+
+        blob = self._read_disk(key, now)
+        if blob is None:
+            return None
+        with self._lock:
+            self._store_memory(key.id, blob, now + self.ttl)
+        return self._unpack(blob)
+
+    def put(self, key: CacheKey, value: bytes, meta: Optional[Dict] = None):
+        """Store a result in both tiers."""
+        blob = self._pack(value, meta)
+        with self._lock:
+            self._store_memory(key.id, blob, time.time() + self.ttl)
+        self._write_disk(key, blob)
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for lookup_id in list(self._load_disk_index()):
+                self._drop_disk(lookup_id)
+
+    # Memory tier
+
+    def _store_memory(self, lookup_id: str, blob: bytes, expires: float):
+        if len(blob) > self.max_memory_bytes:
+            return
+        self._drop_memory(lookup_id)
+        self._memory[lookup_id] = (expires, blob)
+        self._memory_bytes += len(blob)
+        while self._memory_bytes > self.max_memory_bytes:
+            oldest = next(iter(self._memory))
+            self._drop_memory(oldest)
+
+    def _drop_memory(self, lookup_id: str):
+        entry = self._memory.pop(lookup_id, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[1])
+
+    # Disk tier
+
+    def _path(self, lookup_id: str) -> str:
+        return os.path.join(self.disk_dir, lookup_id[:2], lookup_id)
+
+    def _load_disk_index(self) -> "OrderedDict[str, Tuple[float, int]]":
+        """Index existing entries by modification time, oldest first (lock held)."""
+        if self._disk_index is None:
+            entries = []
+            if os.path.isdir(self.disk_dir):
+                for root, _, files in os.walk(self.disk_dir):
+                    for name in files:
+                        if "." in name:
+                            # Temporary file from an interrupted write
+                            continue
+                        try:
+                            stat = os.stat(os.path.join(root, name))
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, name, stat.st_size))
+            entries.sort()
+            self._disk_index = OrderedDict((name, (mtime, size)) for mtime, name, size in entries)
+            self._disk_bytes = sum(size for _, _, size in entries)
+        return self._disk_index
+
+    def _drop_disk(self, lookup_id: str):
+        entry = self._load_disk_index().pop(lookup_id, None)
+        if entry is not None:
+            self._disk_bytes -= entry[1]
+        try:
+            os.remove(self._path(lookup_id))
+        except OSError:
+            pass
+
+    def _read_disk(self, key: CacheKey, now: float) -> Optional[bytes]:
+        if self.max_disk_bytes <= 0:
+            return None
+        with self._lock:
+            entry = self._load_disk_index().get(key.id)
+            if entry is None:
+                return None
+            if entry[0] + self.ttl <= now:
+                self._drop_disk(key.id)
+                return None
+        try:
+            with open(self._path(key.id), "rb") as f:
+                sealed = f.read()
+            return AESGCM(key.secret).decrypt(sealed[:12], sealed[12:], key.id.encode())
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {key.id[:12]}: {e}")
+            with self._lock:
+                self._drop_disk(key.id)
+            return None
+
+    def _write_disk(self, key: CacheKey, blob: bytes):
+        if self.max_disk_bytes <= 0:
+            return
+        nonce = os.urandom(12)
+        sealed = nonce + AESGCM(key.secret).encrypt(nonce, blob, key.id.encode())
+        if len(sealed) > self.max_disk_bytes:
+            return
+        path = self._path(key.id)
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(sealed)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry: {e}")
+            return
+
+        with self._lock:
+            index = self._load_disk_index()
+            previous = index.pop(key.id, None)
+            if previous is not None:
+                self._disk_bytes -= previous[1]
+            index[key.id] = (time.time(), len(sealed))
+            self._disk_bytes += len(sealed)
+            while self._disk_bytes > self.max_disk_bytes and index:
+                self._drop_disk(next(iter(index)))
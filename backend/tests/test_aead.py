@@ -0,0 +1,59 @@
+import os
+
+import pytest
+from cryptography.exceptions import UnsupportedAlgorithm
+
+from app.services import encryption_service
+from app.services.encryption_service import EncryptionService
+
+PASSWORD = "correct horse"
+
+
+def _flip(data: bytes, index: int) -> bytes:
+    return data[:index] + bytes([data[index] ^ 1]) + data[index + 1:]
+
+
+@pytest.mark.parametrize("algorithm", encryption_service.available_aeads())
+@pytest.mark.parametrize("size", [0, 1, 1000])
+def test_round_trip_and_tamper(algorithm, size):
+    service = EncryptionService()
+    plaintext = os.urandom(size)
+    encrypted = service.aead_encrypt(plaintext, PASSWORD, algorithm)
+    assert service.aead_decrypt(encrypted, PASSWORD, algorithm) == plaintext
+    for index in (0, 20, len(encrypted) - 1):  # salt, nonce, tag
+        with pytest.raises(ValueError):
+            service.aead_decrypt(_flip(encrypted, index), PASSWORD, algorithm)
+    with pytest.raises(ValueError):
+        service.aead_decrypt(encrypted, "wrong", algorithm)
+
+
+@pytest.mark.parametrize("algorithm", encryption_service.available_aeads())
+def test_key_sizes(algorithm):
+    service = EncryptionService()
+    for key_size in encryption_service.AEAD_KEY_SIZES[algorithm]:
+        encrypted = service.aead_encrypt(b"data", PASSWORD, algorithm, key_size)
+        assert service.aead_decrypt(encrypted, PASSWORD, algorithm, key_size) == b"data"
+    with pytest.raises(ValueError):
+        service.aead_encrypt(b"data", PASSWORD, algorithm, 64)
+
+
+def test_auto_round_trip_and_tamper():
+    service = EncryptionService()
+    encrypted = service.aead_auto_encrypt(b"attack at dawn", PASSWORD)
+    assert encrypted[0] == encryption_service.AEAD_IDS[encryption_service.preferred_aead()]
+    assert service.aead_auto_decrypt(encrypted, PASSWORD) == b"attack at dawn"
+    with pytest.raises(ValueError):
+        service.aead_auto_decrypt(_flip(encrypted, len(encrypted) - 1), PASSWORD)
+    with pytest.raises(ValueError):
+        service.aead_auto_decrypt(b"\xff" + encrypted[1:], PASSWORD)
+
+
+def test_missing_gcm_siv_reported_as_unavailable(monkeypatch):
+    def unsupported(key):
+        raise UnsupportedAlgorithm("AES-GCM-SIV is not supported by this version of OpenSSL")
+
+    monkeypatch.setattr(encryption_service, "AESGCMSIV", unsupported)
+    monkeypatch.setattr(encryption_service, "_available_aeads", None)
+    assert encryption_service.available_aeads() == ["aes-gcm", "chacha20-poly1305"]
+    with pytest.raises(ValueError):
+        EncryptionService().aead_encrypt(b"data", PASSWORD, "aes-gcm-siv")
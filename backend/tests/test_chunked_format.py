@@ -0,0 +1,65 @@
+import io
+import os
+
+import pytest
+
+from app.core.config import settings
+from app.services import chunked_format
+from app.services.encryption_service import EncryptionService
+
+PASSWORD = "correct horse"
+
+
+def _encrypt(plaintext: bytes, chunk_size: int = 1000) -> bytes:
+    out = io.BytesIO()
+    EncryptionService().encrypt_stream(io.BytesIO(plaintext), out, PASSWORD, 256, chunk_size)
+    return out.getvalue()
+
+
+def _decrypt(data: bytes) -> bytes:
+    out = io.BytesIO()
+    EncryptionService().decrypt_stream(io.BytesIO(data), out, PASSWORD)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("size", [0, 1, 999, 1000, 1001, 4567])
+def test_round_trip(size):
+    plaintext = os.urandom(size)
+    assert _decrypt(_encrypt(plaintext)) == plaintext
+
+
+@pytest.mark.parametrize("mutate", [
+    lambda d: d[:-1],                                                   # truncated final chunk
+    lambda d: d[:chunked_format.HEADER.size + 1016],                    # dropped chunks
+    lambda d: d[:-5] + bytes([d[-5] ^ 1]) + d[-4:],                     # flipped tag bit
+    lambda d: d[:40] + bytes([d[40] ^ 1]) + d[41:],                     # flipped salt/nonce bit
+])
+def test_tampering_detected(mutate):
+    with pytest.raises(ValueError):
+        _decrypt(mutate(_encrypt(os.urandom(3500))))
+
+
+def test_oversized_chunk_size_rejected():
+    header = chunked_format.HEADER.pack(chunked_format.MAGIC, chunked_format.VERSION, 0, 256,
+                                        settings.STREAM_MAX_CHUNK_SIZE + 1, bytes(16), bytes(8))
+    with pytest.raises(ValueError):
+        chunked_format.parse_header(header)
+    with pytest.raises(ValueError):
+        chunked_format.build_header(256, settings.STREAM_MAX_CHUNK_SIZE + 1, bytes(16), bytes(8))
+
+
+@pytest.mark.parametrize("start, end", [(0, 1), (999, 1001), (1500, 3500), (0, 3500), (3499, 3500)])
+def test_range_read(start, end):
+    plaintext = os.urandom(3500)
+    reader = EncryptionService().chunked_reader(io.BytesIO(_encrypt(plaintext)), PASSWORD)
+    assert reader.size == len(plaintext)
+    assert b"".join(reader.read(start, end)) == plaintext[start:end]
+
+
+def test_range_read_rejects_tampered_chunk():
+    data = bytearray(_encrypt(os.urandom(3500)))
+    data[chunked_format.HEADER.size + 1016 + 10] ^= 1  # second chunk
+    reader = EncryptionService().chunked_reader(io.BytesIO(bytes(data)), PASSWORD)
+    assert b"".join(reader.read(0, 10))
+    with pytest.raises(ValueError):
+        b"".join(reader.read(1000, 1010))
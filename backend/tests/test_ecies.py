@@ -0,0 +1,81 @@
+import base64
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, x25519
+
+from app.core.config import settings
+from app.services import ecies
+from app.services.encryption_service import EncryptionService
+
+CURVES = {"secp256r1": ec.SECP256R1, "secp256k1": ec.SECP256K1}
+
+
+def _keypair(curve):
+    if curve == "x25519":
+        private_key = x25519.X25519PrivateKey.generate()
+        raw = private_key.private_bytes(serialization.Encoding.Raw, serialization.PrivateFormat.Raw,
+                                        serialization.NoEncryption())
+        public = private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return raw.hex(), public.hex()
+    private_key = ec.generate_private_key(CURVES[curve]())
+    return (
+        private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()).decode(),
+        private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                              serialization.PublicFormat.SubjectPublicKeyInfo).decode(),
+    )
+
+
+def _flip(data: bytes, index: int) -> bytes:
+    return data[:index] + bytes([data[index] ^ 1]) + data[index + 1:]
+
+
+@pytest.mark.parametrize("curve", ["secp256r1", "secp256k1", "x25519"])
+def test_compact_round_trip_and_tamper(curve):
+    service = EncryptionService()
+    private_key, public_key = _keypair(curve)
+    message = service.ecc_encrypt(b"attack at dawn", public_key, curve)
+    assert ecies.is_compact(base64.b64decode(message))
+    assert service.ecc_decrypt(message, private_key, curve) == b"attack at dawn"
+    tampered = base64.b64encode(_flip(base64.b64decode(message), -1)).decode()
+    with pytest.raises(ValueError):
+        service.ecc_decrypt(tampered, private_key, curve)
+
+
+@pytest.mark.parametrize("curve", ["secp256r1", "secp256k1"])
+def test_legacy_round_trip(curve, monkeypatch):
+    monkeypatch.setattr(settings, "ECIES_COMPACT_FORMAT", False)
+    service = EncryptionService()
+    private_key, public_key = _keypair(curve)
+    message = service.ecc_encrypt(b"legacy", public_key, curve)
+    assert ecies.is_legacy(base64.b64decode(message))
+    assert service.ecc_decrypt(message, private_key, curve) == b"legacy"
+
+
+@pytest.mark.parametrize("curve", ["secp256r1", "x25519"])
+def test_multi_recipient_round_trip_and_tamper(curve):
+    service = EncryptionService()
+    pairs = [_keypair(curve) for _ in range(3)]
+    message = service.ecc_encrypt_multi(b"for all of you", [public for _, public in pairs], curve)
+    for private_key, _ in pairs:
+        assert service.ecc_decrypt_multi(message, private_key) == b"for all of you"
+    outsider, _ = _keypair(curve)
+    with pytest.raises(ValueError):
+        service.ecc_decrypt_multi(message, outsider)
+    with pytest.raises(ValueError):
+        service.ecc_decrypt_multi(_flip(message, len(message) - 1), pairs[0][0])
+
+
+def test_curve_mismatch_rejected():
+    _, public_key = _keypair("secp256k1")
+    with pytest.raises(ValueError):
+        EncryptionService().ecc_encrypt(b"x", public_key, "secp256r1")
+
+
+def test_unsupported_pem_keys_rejected():
+    for private_key in (ed25519.Ed25519PrivateKey.generate(), ec.generate_private_key(ec.SECP384R1())):
+        pem = private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                    serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+        with pytest.raises(ValueError):
+            ecies.load_public_key(pem)
@@ -0,0 +1,69 @@
+import io
+import json
+import base64
+import asyncio
+
+import numpy as np
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.api import routes
+from app.main import app
+
+KEY = "00" * 32
+NONCE = "11" * 12
+
+
+def _frame(seed):
+    arr = np.random.default_rng(seed).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(arr).save(buffer, "PNG")
+    return arr, buffer.getvalue()
+
+
+def _process(frames, operation):
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/image/frames/process",
+            data={"operation": operation, "algorithm": "ChaCha20", "key": KEY, "nonce": NONCE,
+                  "regions": "8,8,32,24"},
+            files=[("frames", (f"frame{i}.png", data, "image/png")) for i, data in enumerate(frames)],
+        )
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+    assert [line["index"] for line in lines] == list(range(len(frames)))
+    return [base64.b64decode(line["frame"]) for line in lines]
+
+
+def test_frames_round_trip():
+    arrays, frames = zip(*(_frame(seed) for seed in range(5)))
+    encrypted = _process(frames, "encrypt")
+    for original, data in zip(arrays, encrypted):
+        processed = np.asarray(Image.open(io.BytesIO(data)))
+        assert (processed[8:32, 8:40] != original[8:32, 8:40]).any()
+        assert (processed[40:] == original[40:]).all()
+    decrypted = _process(encrypted, "decrypt")
+    for original, data in zip(arrays, decrypted):
+        assert (np.asarray(Image.open(io.BytesIO(data))) == original).all()
+
+
+def test_frames_streamed_after_uploads_closed():
+    # Newer FastAPI releases close uploads as soon as the handler returns,
+    # before the streaming body is consumed
+    frames = [_frame(seed)[1] for seed in range(3)]
+    uploads = [UploadFile(io.BytesIO(data), filename=f"frame{i}.png") for i, data in enumerate(frames)]
+
+    async def run():
+        response = await routes.process_frame_sequence(
+            frames=uploads, operation="encrypt", algorithm="ChaCha20", key=KEY, nonce=NONCE, regions="8,8,32,24"
+        )
+        for upload in uploads:
+            await upload.close()
+        body = b"".join([chunk.encode() if isinstance(chunk, str) else chunk
+                         async for chunk in response.body_iterator])
+        await response.background()
+        return body
+
+    lines = [json.loads(line) for line in asyncio.run(run()).splitlines()]
+    assert [line["index"] for line in lines] == [0, 1, 2]
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services import image_codecs, pixel_format
+
+RNG = np.random.default_rng(0)
+ARRAYS = {
+    "L": RNG.integers(0, 256, (30, 40), dtype=np.uint8),
+    "LA": RNG.integers(0, 256, (30, 40, 2), dtype=np.uint8),
+    "RGB": RNG.integers(0, 256, (30, 40, 3), dtype=np.uint8),
+    "RGBA": RNG.integers(0, 256, (30, 40, 4), dtype=np.uint8),
+    "I;16": RNG.integers(0, 65536, (30, 40), dtype=np.uint16),
+}
+
+
+def _decode(data):
+    return pixel_format.native_array(image_codecs.open_image(data))
+
+
+@pytest.mark.parametrize("output_format", ["png", "png-fast", "png-store", "tiff", "raw"])
+@pytest.mark.parametrize("mode", list(ARRAYS))
+def test_lossless_round_trip(output_format, mode):
+    array = ARRAYS[mode]
+    decoded = _decode(image_codecs.encode_image(array, output_format))
+    assert decoded.dtype == array.dtype and decoded.shape == array.shape
+    assert (decoded == array).all()
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA"])
+def test_webp_lossless_round_trip(mode):
+    array = ARRAYS[mode]
+    assert (_decode(image_codecs.encode_image(array, "webp-lossless")) == array).all()
+
+
+@pytest.mark.parametrize("mode", ["L", "LA", "I;16"])
+def test_webp_rejects_what_it_cannot_store(mode):
+    with pytest.raises(ValueError):
+        image_codecs.encode_image(ARRAYS[mode], "webp-lossless")
+    with pytest.raises(ValueError):
+        image_codecs.encode_image(Image.fromarray(ARRAYS[mode]), "webp-lossless")
+
+
+@pytest.mark.parametrize("output_format", ["png-fast", "tiff", "raw", "webp-lossless"])
+def test_manifest_only_embedded_in_png(output_format):
+    manifest = {"v": 1, "alg": "AES-CTR", "r": [[0, 0, 4, 4, 0]]}
+    if image_codecs.supports_manifest(output_format):
+        data = image_codecs.encode_image(ARRAYS["RGB"], output_format, manifest)
+        assert image_codecs.open_image(data).info["securecrypt:regions"]
+    else:
+        with pytest.raises(ValueError):
+            image_codecs.encode_image(ARRAYS["RGB"], output_format, manifest)
+
+
+def test_raw_is_little_endian():
+    data = image_codecs.encode_image(np.array([[0x0102]], dtype=np.uint16), "raw")
+    assert data[image_codecs.RAW_HEADER.size:] == b"\x02\x01"
+
+
+@pytest.mark.parametrize("mutate", [
+    lambda d: d[:10],                                                  # truncated header
+    lambda d: d[:-1],                                                  # short payload
+    lambda d: d[:4] + b"\x02" + d[5:],                                 # unknown version
+    lambda d: d[:5] + b"\x20" + d[6:],                                 # unknown bit depth
+])
+def test_malformed_raw_rejected(mutate):
+    data = image_codecs.encode_image(ARRAYS["RGB"], "raw")
+    with pytest.raises(ValueError):
+        image_codecs.open_image(mutate(data))
+
+
+def test_unknown_output_format_rejected():
+    with pytest.raises(ValueError):
+        image_codecs.resolve_output_format("jpeg", "encrypt")
@@ -0,0 +1,87 @@
+import io
+import os
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from app.core.config import settings
+from app.services import key_envelope
+from app.services.encryption_service import EncryptionService
+
+PLAINTEXT = os.urandom(5000)
+
+
+def _pem(private_key):
+    return (
+        private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()).decode(),
+        private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                              serialization.PublicFormat.SubjectPublicKeyInfo).decode(),
+    )
+
+
+def _credentials():
+    """(method, encrypt key, decrypt key) for each wrap method."""
+    rsa_private, rsa_public = _pem(rsa.generate_private_key(public_exponent=65537, key_size=2048))
+    ecc_private, ecc_public = _pem(ec.generate_private_key(ec.SECP256R1()))
+    return {
+        "password": ("password", "old password", "old password"),
+        "rsa": ("rsa", rsa_public, rsa_private),
+        "ecc": ("ecc", ecc_public, ecc_private),
+    }
+
+
+CREDENTIALS = _credentials()
+
+
+def _rewrap(service, data, old_key, new_method, new_key):
+    prefix, old_length = service.rewrap(io.BytesIO(data), old_key, new_method, new_key)
+    return prefix + data[old_length:]
+
+
+@pytest.mark.parametrize("method", ["password", "rsa", "ecc"])
+def test_round_trip_and_tamper(method):
+    service = EncryptionService()
+    _, encrypt_key, decrypt_key = CREDENTIALS[method]
+    data = service.encrypt_wrapped(PLAINTEXT, method, encrypt_key)
+    assert key_envelope.is_wrapped(data)
+    assert service.decrypt_wrapped(data, decrypt_key) == PLAINTEXT
+    slot_end = key_envelope.read_prefix(io.BytesIO(data))["length"]
+    for index in (key_envelope.PREFIX.size + 1, slot_end + 40, len(data) - 1):  # key slot, payload, tag
+        tampered = data[:index] + bytes([data[index] ^ 1]) + data[index + 1:]
+        with pytest.raises(ValueError):
+            service.decrypt_wrapped(tampered, decrypt_key)
+
+
+@pytest.mark.parametrize("old", ["password", "rsa", "ecc"])
+@pytest.mark.parametrize("new", ["password", "rsa", "ecc"])
+def test_rewrap_keeps_payload(old, new):
+    service = EncryptionService()
+    _, old_encrypt, old_decrypt = CREDENTIALS[old]
+    _, new_encrypt, new_decrypt = CREDENTIALS[new]
+    if new == "password":
+        new_encrypt = new_decrypt = "new password"
+    data = service.encrypt_wrapped(PLAINTEXT, old, old_encrypt)
+    rewrapped = _rewrap(service, data, old_decrypt, new, new_encrypt)
+    old_length = key_envelope.read_prefix(io.BytesIO(data))["length"]
+    new_length = key_envelope.read_prefix(io.BytesIO(rewrapped))["length"]
+    assert rewrapped[new_length:] == data[old_length:]
+    assert service.decrypt_wrapped(rewrapped, new_decrypt) == PLAINTEXT
+    if new_decrypt != old_decrypt:
+        with pytest.raises(ValueError):
+            service.decrypt_wrapped(rewrapped, old_decrypt)
+
+
+def test_rewrap_keeps_slot_size():
+    service = EncryptionService()
+    data = service.encrypt_wrapped(PLAINTEXT, "password", "old password")
+    prefix, old_length = service.rewrap(io.BytesIO(data), "old password", "password", "new password")
+    assert len(prefix) == old_length == key_envelope.PREFIX.size + settings.KEY_WRAP_SLOT_SIZE
+
+
+def test_rewrap_rejects_wrong_key():
+    service = EncryptionService()
+    data = service.encrypt_wrapped(PLAINTEXT, "password", "old password")
+    with pytest.raises(ValueError):
+        service.rewrap(io.BytesIO(data), "not the password", "password", "new password")
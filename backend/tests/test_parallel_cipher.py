@@ -0,0 +1,46 @@
+import os
+
+import pytest
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from app.core.config import settings
+from app.services import parallel_cipher
+
+KEY = bytes(range(32))
+IV = bytes(range(16))
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    # Split even small buffers into several segments
+    monkeypatch.setattr(settings, "PARALLEL_CIPHER_MIN_SIZE", 0)
+    monkeypatch.setattr(settings, "PARALLEL_CIPHER_MIN_SEGMENT", 48)
+
+
+def _serial(mode, data, encrypt=True):
+    cipher = Cipher(algorithms.AES(KEY), mode)
+    context = cipher.encryptor() if encrypt else cipher.decryptor()
+    return context.update(data) + context.finalize()
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 17, 47, 49, 1000, 4097])
+@pytest.mark.parametrize("workers", [2, 3, 7])
+def test_ctr_matches_serial(size, workers):
+    data = os.urandom(size)
+    assert parallel_cipher.ctr_xcrypt(algorithms.AES(KEY), IV, data, workers) == _serial(modes.CTR(IV), data)
+
+
+def test_ctr_counter_wraps_like_openssl():
+    iv = b"\xff" * 16
+    data = os.urandom(1000)
+    assert parallel_cipher.ctr_xcrypt(algorithms.AES(KEY), iv, data, 4) == _serial(modes.CTR(iv), data)
+
+
+@pytest.mark.parametrize("blocks", [1, 3, 4, 37, 250])
+@pytest.mark.parametrize("workers", [2, 3, 7])
+def test_block_modes_match_serial(blocks, workers):
+    data = os.urandom(16 * blocks)
+    ciphertext = _serial(modes.CBC(IV), data)
+    assert parallel_cipher.cbc_decrypt(algorithms.AES(KEY), IV, ciphertext, workers) == data
+    assert parallel_cipher.ecb_crypt(algorithms.AES(KEY), data, True, workers) == _serial(modes.ECB(), data)
+    assert parallel_cipher.ecb_crypt(algorithms.AES(KEY), data, False, workers) == _serial(modes.ECB(), data, False)
@@ -0,0 +1,51 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services import pixel_format
+from app.services.image_service import ImageEncryptionService
+
+KEY = "00" * 32
+NONCE = "11" * 12
+REGIONS = [{"left": 4, "top": 6, "width": 20, "height": 10}]
+
+
+def _png(array):
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _round_trip(image_data):
+    service = ImageEncryptionService()
+    encrypted = service.process_image(image_data, REGIONS, KEY, NONCE, "ChaCha20", "encrypt", "png")
+    decrypted = service.process_image(encrypted, REGIONS, KEY, NONCE, "ChaCha20", "decrypt", "png")
+    return np.array(Image.open(io.BytesIO(encrypted))), np.array(Image.open(io.BytesIO(decrypted)))
+
+
+def test_32_bit_decode_of_16_bit_grayscale_kept_16_bit():
+    # Older Pillow releases open 16-bit grayscale PNGs in mode "I"
+    values = (np.arange(40 * 30).reshape(30, 40) * 53 % 65536).astype(np.int32)
+    array = pixel_format.native_array(Image.fromarray(values))
+    assert array.dtype == np.uint16 and array.ndim == 2
+    assert (array == values).all()
+
+
+@pytest.mark.parametrize("array", [
+    (np.arange(30 * 40).reshape(30, 40) * 53 % 65536).astype(np.uint16),
+    (np.arange(30 * 40).reshape(30, 40) % 256).astype(np.uint8),
+    np.random.default_rng(0).integers(0, 256, (30, 40, 4), dtype=np.uint8),
+], ids=["I;16", "L", "RGBA"])
+def test_native_layout_round_trip(array):
+    encrypted, decrypted = _round_trip(_png(array))
+    assert encrypted.dtype == array.dtype and encrypted.shape == array.shape
+    assert (encrypted[6:16, 4:24] != array[6:16, 4:24]).any()
+    assert (decrypted == array).all()
+
+
+def test_alpha_left_in_clear_by_default():
+    array = np.random.default_rng(1).integers(0, 256, (30, 40, 4), dtype=np.uint8)
+    encrypted, _ = _round_trip(_png(array))
+    assert (encrypted[..., 3] == array[..., 3]).all()
@@ -0,0 +1,75 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services.image_service import ImageEncryptionService
+
+KEY = "00" * 32
+NONCE = "11" * 12
+
+
+def _encrypted_image(rects, algorithm="ChaCha20", nonce=NONCE):
+    yy, xx = np.mgrid[0:400, 0:500]
+    arr = np.stack([(xx // 7 + yy // 9) % 256, (xx // 5) % 256, (yy // 3) % 256], -1).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(arr).save(buffer, "PNG")
+    regions = [{"left": x, "top": y, "width": w, "height": h} for x, y, w, h in rects]
+    return ImageEncryptionService().process_image(buffer.getvalue(), regions, KEY, nonce, algorithm, "encrypt")
+
+
+def _detect(image_data, levels):
+    regions = ImageEncryptionService().detect_encrypted_regions(image_data, levels)
+    return sorted((r["left"], r["top"], r["width"], r["height"]) for r in regions)
+
+
+def _coverage(rects):
+    mask = np.zeros((400, 500), dtype=bool)
+    for x, y, w, h in rects:
+        mask[y:y+h, x:x+w] = True
+    return mask
+
+
+@pytest.mark.parametrize("levels", [2, 3])
+@pytest.mark.parametrize("rects", [
+    # Adjacent regions, merged into one candidate by the coarse pass
+    [(100, 100, 50, 50), (154, 100, 50, 50)],
+    # L shape with a gap of a few rows
+    [(100, 100, 200, 20), (100, 124, 20, 100)],
+])
+def test_candidate_split_into_regions(rects, levels):
+    assert _detect(_encrypted_image(rects), levels) == sorted(rects)
+
+
+@pytest.mark.parametrize("levels", [2, 3])
+def test_touching_l_shape_covered_exactly(levels):
+    rects = [(100, 100, 200, 20), (100, 120, 20, 100)]
+    detected = _detect(_encrypted_image(rects), levels)
+    assert len(detected) == 2
+    assert (_coverage(detected) == _coverage(rects)).all()
+
+
+NEARBY = [(20, 30, 60, 50), (150, 100, 80, 70)]
+
+
+@pytest.mark.parametrize("levels", [2, 3])
+def test_nearby_regions_detected_once(levels):
+    image_data = _encrypted_image(NEARBY, "AES-CTR", "11" * 8)
+    assert _detect(image_data, levels) == sorted(NEARBY)
+
+
+def test_fragmented_candidate_refined_once(monkeypatch):
+    # Cut the coarse mask of the second region in two; the fragments' windows overlap
+    service = ImageEncryptionService()
+    high_variance_mask = service._high_variance_mask
+
+    def fragmented(gray):
+        mask = high_variance_mask(gray)
+        mask[:, 48:52] = 0
+        return mask
+
+    monkeypatch.setattr(service, "_high_variance_mask", fragmented)
+    image_data = _encrypted_image(NEARBY, "AES-CTR", "11" * 8)
+    regions = service.detect_encrypted_regions(image_data, 2)
+    assert sorted((r["left"], r["top"], r["width"], r["height"]) for r in regions) == sorted(NEARBY)
@@ -0,0 +1,71 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services import region_manifest
+from app.services.image_service import ImageEncryptionService
+
+REGIONS = [{"left": 10, "top": 5, "width": 30, "height": 20, "offset": 0}]
+
+
+def _png():
+    yy, xx = np.mgrid[0:60, 0:80]
+    arr = np.stack([(xx * 3) % 256, (yy * 4) % 256, (xx + yy) % 256], -1).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(arr).save(buffer, "PNG")
+    return buffer.getvalue(), arr
+
+
+def test_manifest_round_trip():
+    manifest = region_manifest.build_manifest(REGIONS, "AES-CTR", mac_key=b"k" * 32, channels=[0, 1])
+    parsed = region_manifest.parse_manifest(region_manifest.serialize_manifest(manifest))
+    assert region_manifest.verify_manifest(parsed, b"k" * 32, "AES-CTR")
+    assert region_manifest.manifest_regions(parsed)[0]["width"] == 30
+
+
+def test_manifest_tampered_or_wrong_key_rejected():
+    manifest = region_manifest.build_manifest(REGIONS, "AES-CTR", mac_key=b"k" * 32)
+    assert not region_manifest.verify_manifest(manifest, b"x" * 32, "AES-CTR")
+    manifest["r"][0][2] = 31
+    assert not region_manifest.verify_manifest(manifest, b"k" * 32, "AES-CTR")
+
+
+def test_unauthenticated_manifest_needs_opt_in():
+    manifest = region_manifest.build_manifest(REGIONS, "RC4")
+    assert not region_manifest.verify_manifest(manifest, b"k" * 16, "RC4")
+    assert region_manifest.verify_manifest(manifest, b"k" * 16, "RC4", allow_unauthenticated=True)
+
+
+def test_algorithm_mismatch_rejected():
+    manifest = region_manifest.build_manifest(REGIONS, "rc4", mac_key=b"k" * 16)
+    assert manifest["alg"] == "RC4"
+    assert not region_manifest.verify_manifest(manifest, b"k" * 16, "Logistic XOR")
+
+
+@pytest.mark.parametrize("malformed", ['{"v": 2, "alg": "RC4", "r": []}', '{"v": 1, "r": []}',
+                                       '{"v": 1, "alg": "RC4", "r": [[1, 2, 3]]}', "not json"])
+def test_malformed_manifest(malformed):
+    with pytest.raises(ValueError):
+        region_manifest.parse_manifest(malformed)
+
+
+def test_partial_rc4_manifest_decrypts():
+    data, arr = _png()
+    service = ImageEncryptionService()
+    encrypted = service.partial_process_image(data, REGIONS, "encrypt", "rc4", rc4_key="secretkey",
+                                              embed_manifest=True, output_format="png")
+    decrypted = service.auto_decrypt_image(encrypted, b"secretkey".hex(), None, "RC4")
+    assert (np.array(Image.open(io.BytesIO(decrypted))) == arr).all()
+
+
+@pytest.mark.parametrize("algorithm, requested", [("logistic", "Logistic XOR"), ("logistic-tiled", "Logistic Tiled")])
+def test_partial_logistic_manifest_not_used_for_other_cipher(algorithm, requested):
+    data, _ = _png()
+    service = ImageEncryptionService()
+    encrypted = service.partial_process_image(data, REGIONS, "encrypt", algorithm, password="pw",
+                                              logistic_initial=0.3, logistic_parameter=3.7,
+                                              embed_manifest=True, output_format="png")
+    with pytest.raises(ValueError):
+        service.auto_decrypt_image(encrypted, b"pw".hex(), None, requested)
@@ -0,0 +1,47 @@
+import os
+import base64
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+FORM = {"algorithm": "aes", "password": "pw", "keySize": "256", "mode": "gcm"}
+
+
+def _post(client, operation, data, **extra):
+    return client.post("/api/encrypt", data={**FORM, "operation": operation, **extra},
+                       files={"file": ("f.bin", data, "application/octet-stream")},
+                       headers={"Accept-Encoding": "gzip"})
+
+
+def _encrypt(client, plaintext):
+    response = _post(client, "encrypt", plaintext)
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers  # ciphertext is never compressed
+    assert response.json()["encoding"] == "base64"
+    # Decryption takes the Base64 ciphertext as the file
+    return response.json()["data"].encode()
+
+
+@pytest.mark.parametrize("plaintext, encoding", [
+    ("héllo wörld\n".encode() * 2000, "text"),
+    (os.urandom(5000), "base64"),
+    (b"text at the start " * 10 + b"\xff\xfe", "base64"),
+], ids=["text", "binary", "text-prefix"])
+def test_decrypt_output_encoding_detected(plaintext, encoding):
+    with TestClient(app) as client:
+        response = _post(client, "decrypt", _encrypt(client, plaintext))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["encoding"] == encoding
+    data = body["data"].encode() if encoding == "text" else base64.b64decode(body["data"])
+    assert data == plaintext
+    # Repetitive text compresses; random bytes do not, even as Base64
+    assert ("content-encoding" in response.headers) == (encoding == "text")
+
+
+def test_explicit_text_rejects_binary():
+    with TestClient(app) as client:
+        response = _post(client, "decrypt", _encrypt(client, b"\x00\xff" * 100), outputEncoding="text")
+    assert response.status_code == 400
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+from app.api.scheduler import SchedulerMiddleware
+
+CLASSES = {"heavy": {"weight": 1, "concurrency": 1, "offload": True}}
+
+
+def _middleware(app):
+    return SchedulerMiddleware(app, classes=CLASSES, endpoint_classes={}, default_class="heavy",
+                               heavy_class="heavy", max_concurrency=1, queue_timeout=5)
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def _send(message):
+    pass
+
+
+def test_offloaded_slot_held_until_lane_finishes():
+    started, proceed = threading.Event(), threading.Event()
+    loops = []
+
+    async def app(scope, receive, send):
+        loops.append(asyncio.get_running_loop())
+        started.set()
+        proceed.wait(5)
+
+    middleware = _middleware(app)
+    scope = {"type": "http", "path": "/", "headers": []}
+
+    async def scenario():
+        task = asyncio.create_task(middleware(scope, _receive, _send))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        # Client disconnects: the awaiting task is cancelled, the lane thread keeps running
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert middleware.scheduler.active == 1
+        proceed.set()
+        for _ in range(100):
+            if middleware.scheduler.active == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert middleware.scheduler.active == 0
+        # The next request reuses the lane thread's event loop
+        await middleware(scope, _receive, _send)
+
+    asyncio.run(scenario())
+    assert len(loops) == 2 and loops[0] is loops[1]